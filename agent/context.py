@@ -0,0 +1,238 @@
+"""
+Keeps the conversation history sent to the model within a token budget.
+
+The `context` node runs before every model call. It counts the tokens of the
+history locally (with tiktoken, or about four characters per token when no
+encoding is available) and, while the total is over `max_tokens`:
+
+1. compacts tool outputs longer than `tool_output_max_tokens` to their head and
+   tail, oldest first, leaving alone the leading system prompt, the latest
+   `keep_recent_turns` turns and results the model has not seen yet;
+2. folds the turns before those into one summary message, written by the model
+   (or, without one, a note saying how many messages were dropped);
+3. compacts the remaining tool outputs of the recent turns as a last resort.
+
+Changes are written back to the state by message id, so the checkpointer holds
+the compacted history and later turns do not pay for it again. Turns start at
+a `HumanMessage`, so a summary never separates a tool call from its result.
+"""
+import functools
+import logging
+import uuid
+
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langgraph.constants import TAG_NOSTREAM
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the `context_settings` section of config.yaml.
+DEFAULT_MAX_TOKENS = 100_000
+DEFAULT_KEEP_RECENT_TURNS = 2
+DEFAULT_TOOL_OUTPUT_MAX_TOKENS = 2_000
+DEFAULT_ENCODING = "o200k_base"
+
+# Tokens counted for each message on top of its content (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation above for your own later reference. Keep the user's goals and "
+    "instructions, decisions made, files and commands involved with their outcomes, and any open "
+    "questions. Be concise and do not call any tools."
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception:
+        # tiktoken is missing or cannot fetch its tables (e.g. offline).
+        return None
+
+
+class TokenCounter:
+    """Counts tokens of message contents, memoising the counts of large strings."""
+
+    def __init__(self, encoding: str = DEFAULT_ENCODING):
+        self.encoding_name = encoding
+        self._count = functools.lru_cache(maxsize=4096)(self._count_text)
+
+    def _count_text(self, text: str) -> int:
+        encoding = _encoding(self.encoding_name)
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def text(self, text: str) -> int:
+        return self._count(text) if text else 0
+
+    def message(self, message) -> int:
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.text(_content_text(message.content))
+        for tool_call in getattr(message, "tool_calls", None) or ():
+            tokens += self.text(tool_call["name"]) + self.text(str(tool_call["args"]))
+        return tokens
+
+
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in content)
+
+
+def load_settings() -> dict:
+    """The `context_settings` section of config.yaml, or {} when it is missing."""
+    from core.models import config
+    return config.get("context_settings") or {}
+
+
+class ContextWindow:
+    """Compacts a message history to a token budget."""
+
+    def __init__(
+        self,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        keep_recent_turns: int = DEFAULT_KEEP_RECENT_TURNS,
+        tool_output_max_tokens: int = DEFAULT_TOOL_OUTPUT_MAX_TOKENS,
+        encoding: str = DEFAULT_ENCODING,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_output_max_tokens = tool_output_max_tokens
+        self.counter = TokenCounter(encoding)
+
+    def total(self, messages) -> int:
+        return sum(self.counter.message(message) for message in messages)
+
+    def _layout(self, messages):
+        """Returns (end of the system prompt, start of the recent turns, start of the unseen tool results)."""
+        head = 0
+        while head < len(messages) and isinstance(messages[head], SystemMessage):
+            head += 1
+        turn_starts = [i for i in range(head, len(messages)) if isinstance(messages[i], HumanMessage) and not _is_summary(messages[i])]
+        if self.keep_recent_turns <= 0:
+            recent = len(messages)
+        elif len(turn_starts) >= self.keep_recent_turns:
+            recent = turn_starts[-self.keep_recent_turns]
+        else:
+            recent = head
+        unseen = len(messages)
+        while unseen > recent and isinstance(messages[unseen - 1], ToolMessage):
+            unseen -= 1
+        return head, recent, unseen
+
+    def compact(self, messages: list, summarize=None) -> list:
+        """
+        Returns the state updates that bring `messages` within the budget: edited
+        messages (same ids) and `RemoveMessage`s. `summarize(messages)` returns the
+        text of a summary, or is None to drop old turns without one.
+        """
+        total = self.total(messages)
+        if total <= self.max_tokens:
+            return []
+        messages = list(messages)
+        edited = {}
+        head, recent, unseen = self._layout(messages)
+
+        total = self._compact_tool_outputs(messages, range(head, recent), total, edited)
+        removed = []
+        if total > self.max_tokens and recent > head:
+            old = messages[head:recent]
+            # The summary takes the id of the first old message, so it replaces it in place.
+            summary = self._summary_message(old, summarize, old[0].id)
+            removed = old[1:]
+            messages[head:recent] = [summary]
+            for message in old:
+                edited.pop(message.id, None)
+            edited[summary.id] = summary
+            total = self.total(messages)
+            recent = head + 1
+            unseen -= len(old) - 1
+        if total > self.max_tokens:
+            self._compact_tool_outputs(messages, range(recent, unseen), total, edited)
+        return list(edited.values()) + [RemoveMessage(id=message.id) for message in removed]
+
+    def _compact_tool_outputs(self, messages, indices, total: int, edited: dict) -> int:
+        for i in indices:
+            if total <= self.max_tokens:
+                break
+            message = messages[i]
+            if not isinstance(message, ToolMessage):
+                continue
+            text = _content_text(message.content)
+            tokens = self.counter.text(text)
+            if tokens <= self.tool_output_max_tokens:
+                continue
+            compacted = message.model_copy(update={"content": _elide(text, tokens, self.tool_output_max_tokens)})
+            messages[i] = edited[message.id] = compacted
+            total += self.counter.message(compacted) - self.counter.message(message)
+        return total
+
+    def _summary_message(self, old: list, summarize, message_id: str) -> HumanMessage:
+        text = None
+        if summarize is not None:
+            try:
+                text = summarize(old)
+            except Exception as e:
+                text = None
+                logger.warning(f"Could not summarize the earlier conversation: {e}")
+        if not text:
+            text = f"[{len(old)} earlier messages were removed to fit the context budget.]"
+        return HumanMessage(
+            content=SUMMARY_PREFIX + text,
+            id=message_id or str(uuid.uuid4()),
+            additional_kwargs={"context_summary": True},
+        )
+
+
+def _is_summary(message) -> bool:
+    return bool(message.additional_kwargs.get("context_summary"))
+
+
+def _elide(text: str, tokens: int, max_tokens: int) -> str:
+    """Keeps about `max_tokens` tokens' worth of the start and end of a text."""
+    keep_chars = int(len(text) * max_tokens / tokens) // 2
+    omitted = len(text) - 2 * keep_chars
+    return (
+        f"{text[:keep_chars]}\n... [{omitted} characters (about {tokens - max_tokens} tokens) of this older "
+        f"tool output were elided to fit the context budget] ...\n{text[-keep_chars:]}"
+    )
+
+
+def _summary_request(old: list) -> list:
+    # Tool results are only valid after their calls, so the request starts at a turn.
+    return [*old, HumanMessage(content=SUMMARY_PROMPT)]
+
+
+# Summary tokens are not part of the answer, so they stay out of the "messages" stream mode.
+_SUMMARY_CONFIG = {"tags": [TAG_NOSTREAM]}
+
+
+def summarizer(llm):
+    """Returns a `summarize(messages)` callable for `ContextWindow.compact` that uses the model."""
+    def summarize(old):
+        return _content_text(llm.invoke(_summary_request(old), config=_SUMMARY_CONFIG).content).strip()
+    return summarize
+
+
+def context_node(state, window: ContextWindow, llm=None):
+    """Compacts the history in the state before the model sees it."""
+    updates = window.compact(state["messages"], summarizer(llm) if llm is not None else None)
+    return {"messages": updates} if updates else {}
+
+
+async def acontext_node(state, window: ContextWindow, llm=None):
+    """The async counterpart of `context_node`."""
+    needed = []
+    updates = window.compact(state["messages"], needed.append if llm is not None else None)
+    if needed:
+        # Compacting turned out to need a summary: fetch it without blocking the loop, then compact again.
+        try:
+            response = await llm.ainvoke(_summary_request(needed[0]), config=_SUMMARY_CONFIG)
+            summary = _content_text(response.content).strip()
+            updates = window.compact(state["messages"], lambda old: summary)
+        except Exception as e:
+            logger.warning(f"Could not summarize the earlier conversation: {e}")
+    return {"messages": updates} if updates else {}
@@ -1,28 +1,58 @@
 from functools import partial
+from langchain_core.messages import AIMessage, message_chunk_to_message
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 
+from agent.context import ContextWindow, acontext_node, context_node, load_settings
 from agent.state import AgentState
+from agent.tool_node import ConflictAwareToolNode
 
 def agent_node(state, llm):
-    """Invokes the LLM to get a response."""
-    return {"messages": [llm.invoke(state["messages"])]}
+    """
+    Streams the LLM's response and returns it as one message.
+
+    Each chunk, including partial tool-call arguments, reaches LangGraph's
+    "messages" stream mode as it arrives; the state still gets the complete
+    `AIMessage` (an empty one if the model streamed nothing).
+    """
+    response = None
+    for chunk in llm.stream(state["messages"]):
+        response = chunk if response is None else response + chunk
+    return {"messages": [_complete_message(response)]}
 
-def create_graph(llm, tools, checkpointer):
+async def aagent_node(state, llm):
+    """The async counterpart of `agent_node`, used when the graph runs with `ainvoke`/`astream`."""
+    response = None
+    async for chunk in llm.astream(state["messages"]):
+        response = chunk if response is None else response + chunk
+    return {"messages": [_complete_message(response)]}
+
+def _complete_message(response):
+    return AIMessage(content="") if response is None else message_chunk_to_message(response)
+
+def create_graph(llm, tools, checkpointer=None, context_settings=None):
     """
     Creates the agent graph using the standard, cyclical tool-calling pattern.
+
+    A `context` node keeps the history within the token budget of
+    `context_settings` (the `context_settings` section of config.yaml by default)
+    before every model call.
     """
     builder = StateGraph(AgentState)
 
-    builder.add_node("agent", partial(agent_node, llm=llm))
-    builder.add_node("tools", ToolNode(tools))
+    window = ContextWindow(**(load_settings() if context_settings is None else context_settings))
+    builder.add_node("context", RunnableLambda(partial(context_node, window=window, llm=llm), afunc=partial(acontext_node, window=window, llm=llm), name="context"))
+    builder.add_node("agent", RunnableLambda(partial(agent_node, llm=llm), afunc=partial(aagent_node, llm=llm), name="agent"))
+    builder.add_node("tools", ConflictAwareToolNode(tools))
 
-    builder.set_entry_point("agent")
+    builder.set_entry_point("context")
+    builder.add_edge("context", "agent")
     builder.add_conditional_edges(
         "agent",
         tools_condition,
     )
-    builder.add_edge("tools", "agent")
+    builder.add_edge("tools", "context")
 
     # The graph is compiled with the checkpointer
     return builder.compile(checkpointer=checkpointer)
@@ -0,0 +1,93 @@
+"""
+Builds the system prompt as a byte-stable prefix followed by the volatile context.
+
+Providers cache prompts by prefix, so the prompt is split in two text blocks:
+the components without placeholders, in file order, which are identical for
+every conversation, and then the components with `{{...}}` placeholders (the
+date, OS, working directory and its listing) plus the user's memory facts.
+`core.models.get_model` marks the first block as cacheable.
+
+The components are read and split once and cached; the cache is rebuilt when a
+file in `PROMPT_DIR` is added, removed or modified.
+"""
+import os
+import platform
+import threading
+from datetime import datetime
+
+from langchain_core.messages import SystemMessage
+
+from agent import tracing
+from core.persistent_memory import read_memory
+
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core", "prompt_components")
+
+_compiled = None
+_compiled_lock = threading.Lock()
+
+
+def _stamp(prompt_dir: str):
+    """The names, mtimes and sizes of the prompt components, which identify one version of them."""
+    with os.scandir(prompt_dir) as it:
+        entries = [entry for entry in it if entry.name.endswith(".md") and entry.is_file()]
+    return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size) for entry in entries))
+
+
+def compile_template(prompt_dir: str = None):
+    """Returns (stable prefix, volatile template) of the prompt components, cached until they change."""
+    global _compiled
+    prompt_dir = prompt_dir or PROMPT_DIR
+    stamp = (prompt_dir, _stamp(prompt_dir))
+    with _compiled_lock:
+        if _compiled is not None and _compiled[0] == stamp:
+            return _compiled[1]
+    stable, volatile = [], []
+    for name, _, _ in stamp[1]:
+        with open(os.path.join(prompt_dir, name), "r") as f:
+            text = f.read().strip()
+        (volatile if "{{" in text else stable).append(text)
+    template = ("\n\n".join(stable), "\n\n".join(volatile))
+    with _compiled_lock:
+        _compiled = (stamp, template)
+    return template
+
+
+def _directory_listing(cwd: str) -> str:
+    # Imported here: the file tools are heavier than the prompt module.
+    from agent.tools.file_system import list_directory
+    try:
+        # Use the tool directly to get a bounded tree summary of the working directory
+        return list_directory.invoke({"path": cwd, "tree": True})
+    except Exception as e:
+        return f"Could not list directory: {e}"
+
+
+def render_context(template: str) -> str:
+    """Fills in the volatile part of the prompt and appends the user's memory facts."""
+    cwd = os.getcwd()
+    context = template.replace("{{date}}", datetime.now().strftime("%Y-%m-%d"))
+    context = context.replace("{{os}}", platform.system())
+    context = context.replace("{{cwd}}", cwd)
+    if "{{directory_listing}}" in context:
+        context = context.replace("{{directory_listing}}", _directory_listing(cwd))
+    facts = read_memory()
+    if facts:
+        context += f"\n\n# User-Specific Memory\n" + "\n".join(f"- {fact}" for fact in facts)
+    return context
+
+
+def build_system_message() -> SystemMessage:
+    """The system prompt as two text blocks: the cacheable prefix and the per-conversation context."""
+    with tracing.span("build_system_message", tracing.PROMPT) as span:
+        prefix, template = compile_template()
+        context = render_context(template)
+        span.set(prefix_chars=len(prefix), context_chars=len(context))
+    return SystemMessage(content=[
+        {"type": "text", "text": prefix},
+        {"type": "text", "text": context},
+    ])
+
+
+def assemble_system_prompt() -> str:
+    """The system prompt as one string, prefix first."""
+    return "\n\n".join(block["text"] for block in build_system_message().content)
@@ -0,0 +1,175 @@
+"""
+Runs the tool calls of one model turn concurrently without letting them race.
+
+LangGraph's `ToolNode` already maps all the calls of an `AIMessage` onto a
+thread pool, so two `replace` calls on the same file, or a `read_file` next to
+a `write_file` of that file, can interleave. `ConflictAwareToolNode` gives every
+call an access class from `TOOL_ACCESS`:
+
+* `READ` calls only read the paths named in their arguments (or the whole
+  workspace when they name none, e.g. `glob` without a path);
+* `WRITE` calls change the paths named in their arguments;
+* `INDEPENDENT` calls touch no workspace files (web requests, job status,
+  stored outputs);
+* anything else, like `run_shell_command` or a tool not listed here, may
+  change anything and is treated as a `WRITE` of the whole workspace.
+
+A call waits for every earlier call it conflicts with (one of the two writes,
+and their paths overlap), and starts as soon as those are done, on a pool of at
+most `MAX_PARALLEL_TOOLS` threads. Reads never wait for reads, so a turn of
+independent reads takes as long as its slowest call. Results are returned in
+the order of the tool calls.
+
+Results longer than `output_store.SPILL_THRESHOLD_CHARS` are stored on disk and
+replaced by a preview with a handle that `read_tool_output` pages through, so
+no tool can flood the conversation.
+"""
+import asyncio
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import ContextThreadPoolExecutor, get_config_list
+from langgraph.prebuilt import ToolNode
+from langgraph.store.base import BaseStore
+
+from agent.tools import output_store
+
+# Number of tool calls that run at the same time.
+MAX_PARALLEL_TOOLS = 8
+
+READ = "read"
+WRITE = "write"
+INDEPENDENT = "independent"
+
+TOOL_ACCESS = {
+    "read_file": READ,
+    "read_many_files": READ,
+    "list_directory": READ,
+    "search_file_content": READ,
+    "glob": READ,
+    "list_background_processes": INDEPENDENT,
+    "poll_background_process": INDEPENDENT,
+    "tail_background_process": INDEPENDENT,
+    "google_web_search": INDEPENDENT,
+    "web_fetch": INDEPENDENT,
+    "read_tool_output": INDEPENDENT,
+    "write_file": WRITE,
+    "replace": WRITE,
+    "copy_file": WRITE,
+    "move_file": WRITE,
+    "concat_files": WRITE,
+    "extract_lines": WRITE,
+}
+
+# Arguments that name the files or directories a call works on.
+_PATH_ARGS = ("path", "absolute_path", "file_path", "source_path", "destination_path", "paths", "source_paths")
+
+
+class _Access:
+    """What one tool call reads or writes. `paths` of None means the whole workspace."""
+
+    __slots__ = ("mode", "paths")
+
+    def __init__(self, mode: str, paths):
+        self.mode = mode
+        self.paths = paths
+
+    def conflicts_with(self, other: "_Access") -> bool:
+        if INDEPENDENT in (self.mode, other.mode) or (self.mode == READ and other.mode == READ):
+            return False
+        if self.paths is None or other.paths is None:
+            return True
+        return any(_overlap(a, b) for a in self.paths for b in other.paths)
+
+
+def _overlap(a: str, b: str) -> bool:
+    """Whether two absolute paths are the same or one contains the other."""
+    if len(a) > len(b):
+        a, b = b, a
+    return b == a or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+def _access(call: dict) -> _Access:
+    mode = TOOL_ACCESS.get(call["name"], WRITE)
+    if mode == INDEPENDENT:
+        return _Access(mode, ())
+    paths = []
+    for name in _PATH_ARGS:
+        value = (call.get("args") or {}).get(name)
+        for path in [value] if isinstance(value, str) else value or ():
+            if isinstance(path, str) and path:
+                if any(ch in path for ch in "*?["):
+                    # A glob pattern: only its literal leading directories are known.
+                    path = path[:min(path.find(ch) for ch in "*?[" if ch in path)].rpartition("/")[0] or "."
+                paths.append(os.path.abspath(os.path.expanduser(path)))
+    # Unknown tools and shell commands may touch anything.
+    return _Access(mode, paths if paths and call["name"] in TOOL_ACCESS else None)
+
+
+def _spill(output):
+    """Swaps an oversized tool result for a preview of its stored copy."""
+    if isinstance(output, ToolMessage) and isinstance(output.content, str) and output.name != "read_tool_output":
+        output.content = output_store.spill(output.content)
+    return output
+
+
+def dependencies(tool_calls: list) -> list[set[int]]:
+    """For each call, the indices of the earlier calls it has to wait for."""
+    accesses = [_access(call) for call in tool_calls]
+    return [{j for j in range(i) if accesses[i].conflicts_with(accesses[j])} for i in range(len(tool_calls))]
+
+
+class ConflictAwareToolNode(ToolNode):
+    """A `ToolNode` that orders conflicting tool calls and runs the others in parallel."""
+
+    def __init__(self, tools, *, max_workers: int = MAX_PARALLEL_TOOLS, **kwargs):
+        super().__init__(tools, **kwargs)
+        self.max_workers = max_workers
+
+    def _func(self, input, config: RunnableConfig, *, store: Optional[BaseStore]):
+        tool_calls, input_type = self._parse_input(input, store)
+        configs = get_config_list(config, len(tool_calls))
+        waits_for = dependencies(tool_calls)
+        outputs = [None] * len(tool_calls)
+        pending = set(range(len(tool_calls)))
+        running = {}
+        with ContextThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(tool_calls)))) as executor:
+            while pending or running:
+                for i in sorted(pending):
+                    if not waits_for[i] & (pending | set(running.values())):
+                        pending.discard(i)
+                        running[executor.submit(self._run_one, tool_calls[i], input_type, configs[i])] = i
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outputs[running.pop(future)] = future.result()
+        return self._combine_tool_outputs(outputs, input_type)
+
+    async def _afunc(self, input, config: RunnableConfig, *, store: Optional[BaseStore]):
+        tool_calls, input_type = self._parse_input(input, store)
+        waits_for = dependencies(tool_calls)
+        limit = asyncio.Semaphore(self.max_workers)
+        tasks = []
+
+        async def run(i):
+            if waits_for[i]:
+                await asyncio.gather(*(tasks[j] for j in waits_for[i]))
+            async with limit:
+                return await self._arun_one(tool_calls[i], input_type, config)
+
+        for i in range(len(tool_calls)):
+            tasks.append(asyncio.ensure_future(run(i)))
+        outputs = await asyncio.gather(*tasks)
+        return self._combine_tool_outputs(outputs, input_type)
+
+    def _run_one(self, call, input_type, config):
+        return _spill(super()._run_one(call, input_type, config))
+
+    async def _arun_one(self, call, input_type, config):
+        output = await super()._arun_one(call, input_type, config)
+        if isinstance(output, ToolMessage) and isinstance(output.content, str) and len(output.content) > output_store.SPILL_THRESHOLD_CHARS:
+            # Writing a large output to disk would stall the event loop.
+            return await asyncio.to_thread(_spill, output)
+        return output
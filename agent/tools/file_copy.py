@@ -0,0 +1,113 @@
+"""
+Byte-range copies between files that stay inside the kernel where possible.
+
+`copy_range` tries `os.copy_file_range` first (which can even share extents on
+filesystems that support reflinks), then `os.sendfile`, and only falls back to
+a userspace read/write loop when neither is available for the pair of files.
+`write_atomically` wraps a destination in a temporary file that is renamed over
+it once complete, so readers never see a half-written file.
+"""
+import contextlib
+import errno
+import os
+import tempfile
+import threading
+
+# Size of the pieces each system call copies.
+COPY_CHUNK_BYTES = 64 * 1024 * 1024
+
+# Errors meaning "this mechanism does not work for these files", rather than a real I/O failure.
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ETXTBSY}
+
+_umask_lock = threading.Lock()
+
+
+def _umask() -> int:
+    """The process umask, for the permissions of newly created files."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    # Without /proc the umask can only be read by setting it, so set it straight back.
+    with _umask_lock:
+        umask = os.umask(0o077)
+        os.umask(umask)
+    return umask
+
+
+def _copy_with(copier, src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """Copies with one mechanism until done; returns the number of bytes copied."""
+    copied = 0
+    while copied < count:
+        try:
+            n = copier(src_fd, dst_fd, offset + copied, min(COPY_CHUNK_BYTES, count - copied))
+        except OSError as e:
+            if e.errno in _UNSUPPORTED:
+                return copied
+            raise
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _read_write(src_fd, dst_fd, offset, count):
+    data = os.pread(src_fd, min(count, 1024 * 1024), offset)
+    view = memoryview(data)
+    while view:
+        view = view[os.write(dst_fd, view):]
+    return len(data)
+
+
+def copy_range(src_fd: int, dst_fd: int, offset: int = 0, count: int = None) -> int:
+    """
+    Copies `count` bytes (to the end of the source by default) from `offset` in
+    the source to the current position of the destination. Returns the number
+    of bytes copied.
+    """
+    if count is None:
+        count = max(os.fstat(src_fd).st_size - offset, 0)
+    copied = 0
+    for copier in (
+        _copy_file_range if hasattr(os, "copy_file_range") else None,
+        _sendfile if hasattr(os, "sendfile") else None,
+        _read_write,
+    ):
+        if copier is None or copied >= count:
+            continue
+        copied += _copy_with(copier, src_fd, dst_fd, offset + copied, count - copied)
+    return copied
+
+
+@contextlib.contextmanager
+def write_atomically(destination: str, mode: int = None):
+    """
+    Yields the file descriptor of a temporary file that replaces `destination`
+    on success. The file gets `mode`, or the permissions a new file would get.
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(destination)}.", suffix=".tmp")
+    try:
+        os.fchmod(fd, 0o666 & ~_umask() if mode is None else mode)
+        yield fd
+        os.fsync(fd)
+        os.close(fd)
+        fd = None
+        os.replace(temp_path, destination)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_path)
+        raise
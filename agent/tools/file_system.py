@@ -1,44 +1,185 @@
 import os
+import collections
+import concurrent.futures
+import errno
 import glob as py_glob
+import heapq
+import itertools
 import re
+import shutil
 from langchain_core.tools import tool
 
+from agent.tools import file_copy, gitignore, line_index, search, snapshot, text_edit, trigram_index, walker
+
+# Number of entries `list_directory` returns when no limit is given.
+DEFAULT_LIST_LIMIT = 1000
+
+# Bounds of the tree summary: total lines, and the size above which a directory is only counted.
+TREE_MAX_LINES = 200
+TREE_COLLAPSE_ENTRIES = 50
+
+# Number of lines `read_file` returns when no limit is given.
+DEFAULT_LINE_LIMIT = 2000
+
+# Lines longer than this are shortened by `read_file`.
+MAX_LINE_BYTES = 2000
+
+# Per-file and total budgets of `read_many_files`.
+READ_MANY_MAX_FILE_LINES = 2000
+READ_MANY_MAX_FILE_BYTES = 256 * 1024
+READ_MANY_MAX_TOTAL_BYTES = 4 * 1024 * 1024
+
+# Number of threads `read_many_files` reads with.
+READ_MANY_WORKERS = 16
+
+# Patterns `read_many_files` skips unless `useDefaultExcludes` is false.
+READ_MANY_DEFAULT_EXCLUDES = [
+    "**/node_modules/**", "**/.git/**", "**/__pycache__/**", "**/.pytest_cache/**",
+    "**/.venv/**", "**/venv/**", "**/*.pyc", "**/*.so", "**/*.dll", "**/*.exe",
+    "**/*.zip", "**/*.tar", "**/*.gz", "**/*.png", "**/*.jpg", "**/*.jpeg",
+    "**/*.gif", "**/*.ico", "**/*.pdf", "**/*.mp3", "**/*.mp4", "**/*.sqlite",
+]
+
+def _list_entries(path: str, ignore: list[str] = None, respect_git_ignore: bool = True):
+    """Returns the (kept entries, number of git-ignored entries) of a directory."""
+    entries = snapshot.scandir(path)
+    if ignore:
+        entries = [entry for entry in entries if not any(py_glob.fnmatch.fnmatch(entry.name, pattern) for pattern in ignore)]
+    git_ignored = 0
+    if respect_git_ignore:
+        is_ignored = gitignore.get_matcher(path).checker()
+        kept = [entry for entry in entries if not is_ignored(entry.path, _is_dir(entry))]
+        git_ignored = len(entries) - len(kept)
+        entries = kept
+    return entries, git_ignored
+
+def _is_dir(entry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+def _stat_key(entry, field: str):
+    try:
+        return getattr(entry.stat(), field)
+    except OSError:
+        return 0
+
+_LIST_SORT_KEYS = {
+    "name": lambda entry: entry.name,
+    "type": lambda entry: (not _is_dir(entry), entry.name),
+    "mtime": lambda entry: (-_stat_key(entry, "st_mtime_ns"), entry.name),
+    "size": lambda entry: (-_stat_key(entry, "st_size"), entry.name),
+}
+
+def _tree_summary(path: str, max_depth: int, ignore: list[str], respect_git_ignore: bool) -> list[str]:
+    """Renders an indented tree of at most TREE_MAX_LINES lines; deep or large directories become counts."""
+    lines = []
+
+    def counts(directory):
+        try:
+            entries, _ = _list_entries(directory, ignore, respect_git_ignore)
+        except OSError:
+            return None, "unreadable"
+        dirs = sum(1 for entry in entries if _is_dir(entry))
+        return entries, f"{len(entries) - dirs} files, {dirs} directories"
+
+    def walk(directory, entries, depth, indent):
+        entries = sorted(entries, key=_LIST_SORT_KEYS["type"])
+        for i, entry in enumerate(entries):
+            if len(lines) >= TREE_MAX_LINES:
+                lines.append(f"{indent}... ({len(entries) - i} more entries)")
+                return False
+            if not _is_dir(entry):
+                lines.append(f"{indent}{entry.name}")
+                continue
+            children, summary = counts(entry.path)
+            if children is None or depth + 1 >= max_depth or len(children) > TREE_COLLAPSE_ENTRIES:
+                lines.append(f"{indent}[DIR] {entry.name}/ ({summary})")
+                continue
+            lines.append(f"{indent}[DIR] {entry.name}/")
+            if not walk(entry.path, children, depth + 1, indent + "  "):
+                return False
+        return True
+
+    entries, _ = _list_entries(path, ignore, respect_git_ignore)
+    if not walk(path, entries, 0, ""):
+        lines.append(f"(Tree truncated after {TREE_MAX_LINES} entries. List a subdirectory to see more.)")
+    return lines
+
 @tool
-def list_directory(path: str, ignore: list[str] = None, respect_git_ignore: bool = True) -> str:
-    """Lists the names of files and subdirectories directly within a specified directory path. Can optionally ignore entries matching provided glob patterns."""
+def list_directory(path: str, ignore: list[str] = None, respect_git_ignore: bool = True, offset: int = 0, limit: int = DEFAULT_LIST_LIMIT, sort: str = "name", tree: bool = False, max_depth: int = 2) -> str:
+    """Lists the names of files and subdirectories directly within a specified directory path. Can optionally ignore entries matching provided glob patterns. Git-ignored entries are left out unless `respect_git_ignore` is false. Entries are sorted by `sort` ("name", "type" for directories first, "mtime" for newest first or "size" for largest first) and paginated with `offset`/`limit`. With `tree`, a compact tree down to `max_depth` levels is shown instead, with large or deep directories summarized as counts."""
     try:
         if not os.path.isdir(path):
             if os.path.exists(path):
                 return f"Error: Path is not a directory: {path}"
             else:
                 return f"Error listing directory: ENOENT: no such file or directory, stat '{path}'"
+        if sort not in _LIST_SORT_KEYS:
+            return f"Error: Invalid parameters provided. Reason: sort must be one of {', '.join(_LIST_SORT_KEYS)}, but was {sort}."
+        if offset < 0 or (limit is not None and limit <= 0):
+            return "Error: Invalid parameters provided. Reason: offset must be non-negative and limit positive."
 
-        items = os.listdir(path)
-        if ignore:
-            items = [item for item in items if not any(py_glob.fnmatch.fnmatch(item, pattern) for pattern in ignore)]
+        if tree:
+            lines = [f"Directory tree for {path}:"] + _tree_summary(path, max(max_depth, 1), ignore, respect_git_ignore)
+            return "\n".join(lines)
 
-        output = f"Directory listing for {path}:\n"
-        for item in sorted(items):
-            if os.path.isdir(os.path.join(path, item)):
-                output += f"[DIR] {item}\n"
-            else:
-                output += f"{item}\n"
-        return output.strip()
+        entries, git_ignored = _list_entries(path, ignore, respect_git_ignore)
+        if offset and offset >= len(entries):
+            return f"Error: Invalid parameters provided. Reason: Offset {offset} is beyond the number of entries ({len(entries)}) in {path}."
+        key = _LIST_SORT_KEYS[sort]
+        if limit is None:
+            page = sorted(entries, key=key)[offset:]
+        else:
+            # Only the entries up to the end of the page need to be ordered
+            page = heapq.nsmallest(offset + limit, entries, key=key)[offset:]
+
+        lines = [f"Directory listing for {path}:"]
+        lines.extend(f"[DIR] {entry.name}" if _is_dir(entry) else entry.name for entry in page)
+        output = "\n".join(lines)
+        if offset or len(page) < len(entries) - offset:
+            output += f"\n\n(Showing entries {offset + 1}-{offset + len(page)} of {len(entries)}. Use offset/limit to see more.)"
+        if git_ignored:
+            output += f"\n\n({git_ignored} items were git-ignored)"
+        return output
     except Exception as e:
         return f"An unexpected error occurred: {e}"
 
 @tool
 def read_file(absolute_path: str, offset: int = None, limit: int = None) -> str:
-    """Reads and returns the raw content of a specified file. For text files, it can read specific line ranges."""
+    """Reads and returns the raw content of a specified file. For text files, it can read specific line ranges: `offset` is the 0-based line number to start from and `limit` the number of lines to read. Without them, up to 2000 lines are returned and a notice explains how to page through longer files."""
     if not os.path.isabs(absolute_path):
         return f"Error: Invalid parameters provided. Reason: File path must be absolute, but was relative: {absolute_path}. You must provide an absolute path."
     if os.path.isdir(absolute_path):
         return f"Path is a directory, not a file: {absolute_path}"
+    if offset is not None and offset < 0:
+        return f"Error: Invalid parameters provided. Reason: Offset must be a non-negative number, but was {offset}."
+    if limit is not None and limit <= 0:
+        return f"Error: Invalid parameters provided. Reason: Limit must be a positive number, but was {limit}."
     try:
-        with open(absolute_path, "r", errors='ignore') as f:
-            # A more robust version would handle offset and limit for large files.
-            content = f.read()
-        return content
+        with open(absolute_path, "rb") as f:
+            head = f.read(search.BINARY_SNIFF_BYTES)
+        if search.is_binary(head):
+            return f"Cannot display content of binary file: {absolute_path}"
+
+        start = offset or 0
+        lines, index, cut_lines = line_index.read_lines(
+            absolute_path, start, limit or DEFAULT_LINE_LIMIT, max_line_bytes=MAX_LINE_BYTES
+        )
+        if start and start >= index.total_lines:
+            return f"Error: Invalid parameters provided. Reason: Offset {start} is beyond the end of the file ({index.total_lines} lines): {absolute_path}"
+
+        content = _decode_text(b"".join(lines))
+        end = start + len(lines)
+        if start == 0 and end >= index.total_lines and not cut_lines:
+            return content
+
+        notice = f"[File content truncated: showing lines {start + 1}-{end} of {index.total_lines} total lines."
+        if cut_lines:
+            notice += f" {cut_lines} line(s) longer than {MAX_LINE_BYTES} bytes were shortened."
+        notice += " Use offset/limit parameters to view more.]"
+        return f"{notice}\n{content}"
     except FileNotFoundError:
         return f"File not found: {absolute_path}"
     except Exception as e:
@@ -59,6 +200,7 @@ def write_file(file_path: str, content: str) -> str:
 
         with open(file_path, "w") as f:
             f.write(content)
+        snapshot.invalidate(file_path)
         
         if was_present:
             return f"Successfully overwrote file: {file_path}."
@@ -68,141 +210,367 @@ def write_file(file_path: str, content: str) -> str:
     except Exception as e:
         return f"An unexpected error occurred: {e}"
 
+def _check_destination(destination_path: str, overwrite: bool):
+    """Returns an error message if a destination cannot be written, creating its directory otherwise."""
+    if os.path.isdir(destination_path):
+        return f"Error: Invalid parameters provided. Reason: Path is a directory, not a file: {destination_path}"
+    if os.path.exists(destination_path) and not overwrite:
+        return f"Error: Invalid parameters provided. Reason: Destination already exists: {destination_path}. Set overwrite to true to replace it."
+    dir_name = os.path.dirname(destination_path)
+    if dir_name and not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+    return None
+
+def _check_source(source_path: str):
+    if not os.path.exists(source_path):
+        return f"File not found: {source_path}"
+    if os.path.isdir(source_path):
+        return f"Error: Invalid parameters provided. Reason: Path is a directory, not a file: {source_path}"
+    return None
+
+@tool
+def copy_file(source_path: str, destination_path: str, overwrite: bool = False) -> str:
+    """Copies a file to a new path on the server without reading its content, so it works for files of any size and for binary files. Missing parent directories are created; an existing destination is only replaced when `overwrite` is true."""
+    try:
+        error = _check_source(source_path) or _check_destination(destination_path, overwrite)
+        if error:
+            return error
+        with open(source_path, "rb") as src, file_copy.write_atomically(destination_path, os.stat(source_path).st_mode & 0o7777) as dst:
+            copied = file_copy.copy_range(src.fileno(), dst)
+        snapshot.invalidate(destination_path)
+        return f"Successfully copied {source_path} to {destination_path} ({copied} bytes)."
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
+
+@tool
+def move_file(source_path: str, destination_path: str, overwrite: bool = False) -> str:
+    """Moves or renames a file or directory on the server without reading its content. Missing parent directories are created; an existing destination file is only replaced when `overwrite` is true."""
+    try:
+        if not os.path.exists(source_path):
+            return f"File not found: {source_path}"
+        if os.path.isdir(source_path):
+            if os.path.exists(destination_path):
+                return f"Error: Invalid parameters provided. Reason: Destination already exists: {destination_path}"
+            dir_name = os.path.dirname(destination_path)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name)
+        else:
+            error = _check_destination(destination_path, overwrite)
+            if error:
+                return error
+        try:
+            os.rename(source_path, destination_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Across filesystems a rename is impossible: copy, then delete the source
+            shutil.move(source_path, destination_path)
+        snapshot.invalidate(source_path)
+        snapshot.invalidate(destination_path)
+        return f"Successfully moved {source_path} to {destination_path}."
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
+
+@tool
+def concat_files(source_paths: list[str], destination_path: str, overwrite: bool = False) -> str:
+    """Concatenates files, in the given order, into a new file on the server without reading their content. Missing parent directories are created; an existing destination is only replaced when `overwrite` is true (it may also be one of the sources)."""
+    try:
+        if not source_paths:
+            return "Error: Invalid parameters provided. Reason: source_paths must not be empty."
+        for source_path in source_paths:
+            error = _check_source(source_path)
+            if error:
+                return error
+        error = _check_destination(destination_path, overwrite)
+        if error:
+            return error
+        total = 0
+        with file_copy.write_atomically(destination_path) as dst:
+            for source_path in source_paths:
+                with open(source_path, "rb") as src:
+                    total += file_copy.copy_range(src.fileno(), dst)
+        snapshot.invalidate(destination_path)
+        return f"Successfully concatenated {len(source_paths)} file(s) into {destination_path} ({total} bytes)."
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
+
+@tool
+def extract_lines(source_path: str, destination_path: str, offset: int, limit: int, overwrite: bool = False) -> str:
+    """Writes `limit` lines of a file, starting at the 0-based line `offset`, to a new file on the server without returning them. Missing parent directories are created; an existing destination is only replaced when `overwrite` is true."""
+    if offset < 0:
+        return f"Error: Invalid parameters provided. Reason: Offset must be a non-negative number, but was {offset}."
+    if limit <= 0:
+        return f"Error: Invalid parameters provided. Reason: Limit must be a positive number, but was {limit}."
+    try:
+        error = _check_source(source_path)
+        if error:
+            return error
+        start, end, index = line_index.byte_range(source_path, offset, limit)
+        if offset and offset >= index.total_lines:
+            return f"Error: Invalid parameters provided. Reason: Offset {offset} is beyond the end of the file ({index.total_lines} lines): {source_path}"
+        error = _check_destination(destination_path, overwrite)
+        if error:
+            return error
+        with open(source_path, "rb") as src, file_copy.write_atomically(destination_path) as dst:
+            copied = file_copy.copy_range(src.fileno(), dst, start, end - start)
+        snapshot.invalidate(destination_path)
+        last_line = min(offset + limit, index.total_lines)
+        return f"Successfully wrote lines {offset + 1}-{last_line} of {source_path} to {destination_path} ({copied} bytes)."
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
+
 @tool
-def search_file_content(pattern: str, path: str = None, include: str = None) -> str:
-    """Searches for a regular expression pattern within the content of files in a specified directory (or current working directory). Can filter files by a glob pattern. Returns the lines containing matches, along with their file paths and line numbers."""
+def search_file_content(pattern: str, path: str = None, include: str = None, max_matches: int = 1000, max_files: int = 200, respect_git_ignore: bool = True) -> str:
+    """Searches for a regular expression pattern within the content of files in a specified directory (or current working directory). Can filter files by a glob pattern. Git-ignored files are skipped unless `respect_git_ignore` is false. Returns the lines containing matches, along with their file paths and line numbers. The search stops after `max_matches` matching lines or `max_files` matching files."""
     if path is None:
         path = os.getcwd()
 
     if not os.path.exists(path):
         return f"Error: Invalid parameters provided. Reason: Failed to access path stats for {os.path.join(os.getcwd(), path)}: Error: ENOENT: no such file or directory, stat '{os.path.join(os.getcwd(), path)}'"
 
-    matches = []
-    default_excludes = ['.git', '__pycache__', 'node_modules', '.pytest_cache']
+    try:
+        search.compile_pattern(pattern)
+    except re.error as e:
+        return f"Error: Invalid parameters provided. Reason: Invalid regular expression pattern \"{pattern}\": {e}"
+
+    default_excludes = search.DEFAULT_EXCLUDES
     
     # If include is a specific file, just search that file
     if include and os.path.isfile(os.path.join(path, include)):
         files_to_search = [os.path.join(path, include)]
-    # Otherwise, walk the directory
+    # Otherwise, let the trigram index (which never holds git-ignored files) narrow the candidates for literal-heavy patterns
+    elif respect_git_ignore and (candidates := trigram_index.candidate_files(pattern, path, excludes=default_excludes)) is not None:
+        files_to_search = [
+            file_path for file_path in candidates
+            if not include or py_glob.fnmatch.fnmatch(os.path.basename(file_path), include)
+        ]
+    # Otherwise, walk the directory lazily so an early stop also ends the walk
     else:
-        files_to_search = []
-        for root, dirs, files in os.walk(path):
-            # Exclude common directories
-            dirs[:] = [d for d in dirs if d not in default_excludes]
-            
-            for file in files:
-                if include and not py_glob.fnmatch.fnmatch(file, include):
+        ignore = gitignore.get_matcher(path).checker() if respect_git_ignore else None
+
+        def iter_files():
+            for file_path, _, entry in walker.walk_files(path, excludes=default_excludes, ignore=ignore, scandir=snapshot.scandir):
+                if include and not py_glob.fnmatch.fnmatch(entry.name, include):
                     continue
-                files_to_search.append(os.path.join(root, file))
+                yield file_path
+        files_to_search = iter_files()
 
-    for file_path in files_to_search:
-        try:
-            with open(file_path, 'r', errors='ignore') as f:
-                file_matches = []
-                for line_num, line in enumerate(f, 1):
-                    if re.search(pattern, line):
-                        file_matches.append(f"L{line_num}: {line.strip()}")
-                if file_matches:
-                    relative_path = os.path.relpath(file_path, start=os.getcwd())
-                    matches.append(f"File: {relative_path}\n" + "\n".join(file_matches))
-        except (IOError, OSError):
-            continue
-            
-    if not matches:
-        filter_str = f' (filter: "{include}")' if include else ""
+    results, truncated = search.search_files(files_to_search, pattern, max_matches=max_matches, max_files=max_files)
+
+    filter_str = f' (filter: "{include}")' if include else ""
+    if not results:
         return f'No matches found for pattern "{pattern}" in path "{path}"{filter_str}.'
 
+    matches = []
+    for file_path, file_matches in results:
+        relative_path = os.path.relpath(file_path, start=os.getcwd())
+        lines = "\n".join(f"L{line_num}: {line}" for line_num, line in file_matches)
+        matches.append(f"File: {relative_path}\n{lines}")
+
     # Construct the final output string
-    filter_str = f' (filter: "{include}")' if include else ""
     header = f'Found {len(matches)} matches for pattern "{pattern}" in path "{path}"{filter_str}:\n---\n'
     
     # Join matches with a separator
     match_content = "\n---\n".join(matches)
-    
-    return header + match_content + "\n---"
+    output = header + match_content + "\n---"
+    if truncated:
+        output += f"\n(Search stopped early after reaching its budget of {max_matches} matching lines or {max_files} matching files. Narrow the pattern, path or include filter to see more.)"
+    return output
+
 @tool
-def glob(pattern: str, path: str = None, case_sensitive: bool = False, respect_git_ignore: bool = True) -> str:
-    """Efficiently finds files matching specific glob patterns (e.g., `src/**/*.ts`, `**/*.md`), returning absolute paths sorted by modification time (newest first). Ideal for quickly locating files based on their name or path structure, especially in large codebases."""
+def glob(pattern: str, path: str = None, case_sensitive: bool = False, respect_git_ignore: bool = True, limit: int = None) -> str:
+    """Efficiently finds files matching specific glob patterns (e.g., `src/**/*.ts`, `**/*.md`), returning absolute paths sorted by modification time (newest first). Ideal for quickly locating files based on their name or path structure, especially in large codebases. With `limit`, only the newest `limit` files are returned."""
     if path is None:
         path = os.getcwd()
     
     if not os.path.exists(path):
         return f"Error: Invalid parameters provided. Reason: Search path does not exist {os.path.join(os.getcwd(), path)}"
 
-    # This is a simplified implementation. A real one would handle respect_git_ignore.
-    recursive = '**' in pattern
-    glob_path = os.path.join(path, pattern)
-    
-    # Perform the glob search
-    files = py_glob.glob(glob_path, recursive=recursive)
-    
-    # Sort by modification time, newest first
-    try:
-        files.sort(key=os.path.getmtime, reverse=True)
-    except FileNotFoundError:
-        # Handle cases where a file disappears between glob and getmtime
-        pass
+    search_root = os.path.abspath(path)
+    if os.path.isabs(pattern):
+        search_root, pattern = os.sep, os.path.relpath(pattern, os.sep)
+
+    ignore = gitignore.get_matcher(search_root).checker() if respect_git_ignore else None
+    files, total = walker.find_newest(
+        search_root, pattern, case_sensitive=case_sensitive, limit=limit, ignore=ignore, scandir=snapshot.scandir
+    )
 
     if not files:
         return f'No files found matching pattern "{pattern}" within {os.path.join(os.getcwd(), path)}.'
 
-    header = f'Found {len(files)} file(s) matching "{pattern}" within {os.path.join(os.getcwd(), path)}, sorted by modification time (newest first):\n'
-    
-    return header + "\n".join(files)
+    header = f'Found {total} file(s) matching "{pattern}" within {os.path.join(os.getcwd(), path)}, sorted by modification time (newest first):\n'
+    output = header + "\n".join(files)
+    if len(files) < total:
+        output += f"\n(Showing the {len(files)} newest of {total} files.)"
+    return output
 
 @tool
-def replace(file_path: str, old_string: str, new_string: str, expected_replacements: int = 1) -> str:
-    """Replaces text within a file. By default, replaces a single occurrence, but can replace multiple occurrences when `expected_replacements` is specified."""
+def replace(file_path: str, old_string: str = None, new_string: str = None, expected_replacements: int = 1, edits: list[dict] = None) -> str:
+    """Replaces text within a file. By default, replaces a single occurrence, but can replace multiple occurrences when `expected_replacements` is specified. Several replacements can be made in one call with `edits`, a list of objects with `old_string`, `new_string` and optionally `expected_replacements`; they are applied together in a single pass, so one edit never sees another's new text. The file is only changed if every edit finds exactly its expected number of occurrences."""
     if not os.path.exists(file_path):
         return f"File not found: {file_path}"
+    if edits is None:
+        edits = [{"old_string": old_string, "new_string": new_string, "expected_replacements": expected_replacements}]
     try:
-        with open(file_path, 'r') as f:
-            content = f.read()
-        
-        actual_replacements = content.count(old_string)
-        if actual_replacements == 0:
-            return f"Failed to edit, 0 occurrences found for old_string in {file_path}. No edits made. The exact text in old_string was not found. Ensure you're not escaping content incorrectly and check whitespace, indentation, and context. Use read_file tool to verify."
-        
-        if actual_replacements != expected_replacements:
-            return f"Failed to edit, Expected {expected_replacements} occurrence but found {actual_replacements} for old_string in file: {file_path}"
-        
-        content = content.replace(old_string, new_string, expected_replacements)
-        
-        with open(file_path, 'w') as f:
-            f.write(content)
-            
-        return f"Successfully modified file: {file_path} ({expected_replacements} replacements)."
+        pairs = [(edit["old_string"], edit["new_string"]) for edit in edits]
+        expected = [edit.get("expected_replacements", 1) for edit in edits]
+    except (KeyError, TypeError):
+        return "Error: Invalid parameters provided. Reason: Every edit needs an old_string and a new_string."
+    olds = [old for old, _ in pairs]
+    if not pairs or not all(isinstance(old, str) and old for old in olds) or not all(isinstance(new, str) for _, new in pairs):
+        return "Error: Invalid parameters provided. Reason: old_string must be a non-empty string and new_string a string."
+    if len(set(olds)) != len(olds):
+        return "Error: Invalid parameters provided. Reason: Every edit must have a different old_string."
+    try:
+        counts, committed = text_edit.stream_replace(file_path, pairs, expected)
     except Exception as e:
         return f"An unexpected error occurred: {e}"
 
+    if not committed:
+        for i, (actual, wanted) in enumerate(zip(counts, expected)):
+            which = "old_string" if len(pairs) == 1 else f"old_string of edit {i + 1}"
+            if actual == 0:
+                return f"Failed to edit, 0 occurrences found for {which} in {file_path}. No edits made. The exact text in old_string was not found. Ensure you're not escaping content incorrectly and check whitespace, indentation, and context. Use read_file tool to verify."
+            if actual != wanted:
+                return f"Failed to edit, Expected {wanted} occurrence but found {actual} for {which} in file: {file_path}"
+    snapshot.invalidate(file_path)
+    return f"Successfully modified file: {file_path} ({sum(counts)} replacements)."
+
+def _decode_text(data: bytes) -> str:
+    """Decodes file bytes the way text-mode reads do: UTF-8, ignoring errors, universal newlines."""
+    content = data.decode("utf-8", errors="ignore")
+    if "\r" in content:
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+    return content
+
+def _matches_any(file_path: str, patterns: list[str]) -> bool:
+    """Checks a path against glob patterns; a trailing `/` matches a whole directory."""
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if py_glob.fnmatch.fnmatch(file_path, f"{pattern}*") or py_glob.fnmatch.fnmatch(file_path, f"*/{pattern}*"):
+                return True
+        elif py_glob.fnmatch.fnmatch(file_path, pattern):
+            return True
+    return False
+
+def _git_ignore_checker(path_pattern: str):
+    """Returns the ignore hook of the repository (or directory) a glob pattern points into."""
+    directory = path_pattern
+    while walker.has_magic(directory):
+        directory = os.path.dirname(directory)
+    return gitignore.get_matcher(directory or os.curdir).checker()
+
+def _read_text_head(file_path: str, max_bytes: int, max_lines: int):
+    """
+    Reads at most `max_bytes` and `max_lines` of a text file.
+
+    Returns (content, truncated), or (None, False) for binary files.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read(max_bytes + 1)
+    if search.is_binary(data[:search.BINARY_SNIFF_BYTES]):
+        return None, False
+    truncated = len(data) > max_bytes
+    data = data[:max_bytes]
+    if data.count(b"\n") >= max_lines:
+        pos = -1
+        for _ in range(max_lines):
+            pos = data.find(b"\n", pos + 1)
+        truncated = truncated or pos + 1 < len(data)
+        data = data[:pos + 1]
+    return _decode_text(data), truncated
+
+def _map_in_order(executor, fn, items, window: int):
+    """Yields fn(item) for each item, in order, keeping at most `window` calls in flight."""
+    items = iter(items)
+    pending = collections.deque(executor.submit(fn, item) for item in itertools.islice(items, window))
+    try:
+        while pending:
+            future = pending.popleft()
+            yield future
+            for item in itertools.islice(items, 1):
+                pending.append(executor.submit(fn, item))
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _summarize_paths(file_paths: list[str], shown: int = 10) -> str:
+    summary = ", ".join(file_paths[:shown])
+    if len(file_paths) > shown:
+        summary += f" (and {len(file_paths) - shown} more)"
+    return summary
+
 @tool
 def read_many_files(paths: list[str], exclude: list[str] = None, include: list[str] = None, recursive: bool = True, respect_git_ignore: bool = True, useDefaultExcludes: bool = True) -> str:
-    """Reads content from multiple files specified by paths or glob patterns within a configured target directory."""
-    all_content = ""
-    files_read = []
-    
-    # Collect all files that match the include patterns
-    for path_pattern in paths:
-        for file_path in py_glob.glob(path_pattern, recursive=recursive):
-            files_read.append(file_path)
-            
-    # Filter out files that match the exclude patterns
-    if exclude:
-        files_to_read = []
-        for file_path in files_read:
-            if not any(py_glob.fnmatch.fnmatch(file_path, pattern) for pattern in exclude):
-                files_to_read.append(file_path)
-    else:
-        files_to_read = files_read
+    """Reads content from multiple files specified by paths or glob patterns within a configured target directory. Directories are read recursively. `include` patterns are merged with `paths`, `exclude` patterns are added to the default excludes (dependency directories and common binary files) unless `useDefaultExcludes` is false, and git-ignored files are skipped unless `respect_git_ignore` is false. Each file is limited to 2000 lines and 256 KiB and the whole result to 4 MiB; a note lists what was truncated or skipped."""
+    # Expand every pattern once, dropping duplicates while keeping the first spelling of each path
+    files_to_read = []
+    seen = set()
+    for path_pattern in list(paths) + list(include or []):
+        if os.path.isdir(path_pattern):
+            path_pattern = os.path.join(path_pattern, "**")
+        if not recursive:
+            path_pattern = re.sub(r"(?<![^/])\*\*(?![^/])", "*", path_pattern)
+        # Git-ignored directories are pruned while expanding rather than filtered afterwards
+        ignore = _git_ignore_checker(path_pattern) if respect_git_ignore else None
+        for file_path in sorted(walker.iter_glob(path_pattern, ignore=ignore, scandir=snapshot.scandir)):
+            key = os.path.normpath(os.path.abspath(file_path))
+            if key in seen:
+                continue
+            seen.add(key)
+            files_to_read.append(file_path)
+
+    exclude_patterns = list(exclude or [])
+    if useDefaultExcludes:
+        exclude_patterns += READ_MANY_DEFAULT_EXCLUDES
+    if exclude_patterns:
+        files_to_read = [file_path for file_path in files_to_read if not _matches_any(file_path, exclude_patterns)]
 
     if not files_to_read:
         return "No files matching the criteria were found or all were skipped."
 
-    for file_path in files_to_read:
-        try:
-            with open(file_path, 'r', errors='ignore') as f:
-                all_content += f"--- {file_path} ---\n\n{f.read()}\n\n"
-        except (IOError, OSError):
-            continue
-            
-    return all_content.strip()
+    def read_one(file_path):
+        if not os.path.isfile(file_path):
+            return None, False
+        return _read_text_head(file_path, READ_MANY_MAX_FILE_BYTES, READ_MANY_MAX_FILE_LINES)
+
+    parts = []
+    total_bytes = 0
+    truncated_files = []
+    binary_files = []
+    over_budget = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=READ_MANY_WORKERS) as executor:
+        results = _map_in_order(executor, read_one, files_to_read, 2 * READ_MANY_WORKERS)
+        for i, future in enumerate(results):
+            file_path = files_to_read[i]
+            try:
+                content, truncated = future.result()
+            except (IOError, OSError):
+                continue
+            if content is None:
+                if os.path.isfile(file_path):
+                    binary_files.append(file_path)
+                continue
+            part = f"--- {file_path} ---\n\n{content}\n\n"
+            part_bytes = len(part.encode("utf-8"))
+            if total_bytes + part_bytes > READ_MANY_MAX_TOTAL_BYTES:
+                over_budget = files_to_read[i:]
+                results.close()
+                break
+            total_bytes += part_bytes
+            parts.append(part)
+            if truncated:
+                truncated_files.append(file_path)
+
+    notes = []
+    if truncated_files:
+        notes.append(f"[Truncated {len(truncated_files)} file(s) to their first {READ_MANY_MAX_FILE_LINES} lines or {READ_MANY_MAX_FILE_BYTES} bytes: {_summarize_paths(truncated_files)}. Use read_file with offset/limit to see more.]")
+    if binary_files:
+        notes.append(f"[Skipped {len(binary_files)} binary file(s): {_summarize_paths(binary_files)}]")
+    if over_budget:
+        notes.append(f"[Skipped {len(over_budget)} file(s) after reaching the total budget of {READ_MANY_MAX_TOTAL_BYTES} bytes: {_summarize_paths(over_budget)}. Narrow the paths or read them separately.]")
+
+    if not parts:
+        return "\n".join(["No files matching the criteria were found or all were skipped."] + notes)
+    parts.extend(note + "\n" for note in notes)
+    return "".join(parts).strip()
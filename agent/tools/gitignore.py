@@ -0,0 +1,245 @@
+"""
+The `.gitignore` engine shared by the file-system tools.
+
+Every `.gitignore` (plus `.git/info/exclude` at the repository root) is parsed
+once into compiled regexes and cached per directory, so it is only read again
+when its mtime or size changes. Walkers ask a checker whether each entry is
+ignored while they walk and never descend into ignored directories. As in git,
+a file below an ignored directory cannot be re-included by a negated pattern.
+"""
+import os
+import re
+import threading
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def _translate(pattern: str) -> str:
+    """Translates a gitignore glob (without anchoring) into a regex over `/`-separated paths."""
+    segments = pattern.split("/")
+    out = []
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        if segment == "**":
+            if last:
+                out.append(".*")
+            else:
+                out.append("(?:.*/)?")
+            continue
+        out.append(_translate_segment(segment))
+        if not last:
+            out.append("/")
+    return "".join(out)
+
+
+def _translate_segment(segment: str) -> str:
+    out = []
+    i = 0
+    n = len(segment)
+    while i < n:
+        c = segment[i]
+        i += 1
+        if c == "\\" and i < n:
+            out.append(re.escape(segment[i]))
+            i += 1
+        elif c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and segment[j] in "!^":
+                j += 1
+            if j < n and segment[j] == "]":
+                j += 1
+            while j < n and segment[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+                continue
+            body = segment[i:j].replace("\\", "\\\\")
+            i = j + 1
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
+def parse_rules(text: str) -> list[tuple[re.Pattern, bool, bool]]:
+    """Parses gitignore text into (regex, negated, directory_only) rules, in file order."""
+    rules = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        # Trailing spaces are ignored unless escaped.
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash anywhere but at the end anchors the pattern to the .gitignore's directory.
+        anchored = "/" in line
+        body = _translate(line.lstrip("/"))
+        regex = f"{body}\\Z" if anchored else f"(?:.*/)?{body}\\Z"
+        rules.append((re.compile(regex, re.DOTALL), negated, directory_only))
+    return rules
+
+
+class IgnoreRules:
+    """The compiled rules of one ignore file, relative to the directory it applies to."""
+
+    def __init__(self, base: str, rules: list, stamp=None):
+        self.base = base
+        self.rules = rules
+        self.stamp = stamp
+        self._negated = any(negated for _, negated, _ in rules)
+        if not self._negated:
+            # Without negations, first-match order does not matter: fold the rules into two regexes.
+            self._any_file = self._combine(regex for regex, _, directory_only in rules if not directory_only)
+            self._any_dir = self._combine(regex for regex, _, _ in rules)
+        else:
+            self._any_file = self._any_dir = None
+
+    @staticmethod
+    def _combine(regexes):
+        patterns = [f"(?:{regex.pattern})" for regex in regexes]
+        return re.compile("|".join(patterns), re.DOTALL) if patterns else None
+
+    def match(self, rel_path: str, is_dir: bool):
+        """Returns True (ignored), False (re-included by a negation) or None (no rule applies)."""
+        if not self._negated:
+            combined = self._any_dir if is_dir else self._any_file
+            return True if combined is not None and combined.match(rel_path) else None
+        for regex, negated, directory_only in reversed(self.rules):
+            if directory_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negated
+        return None
+
+
+def find_repository_root(path: str) -> str:
+    """Returns the closest enclosing directory with a `.git` entry, or None."""
+    current = os.path.abspath(path)
+    if not os.path.isdir(current):
+        current = os.path.dirname(current)
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+class IgnoreMatcher:
+    """Answers whether paths below a root directory are ignored."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._rules = {}
+        self._lock = threading.Lock()
+
+    def _load(self, directory: str, file_path: str):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._rules.get(file_path)
+        if cached is not None and cached.stamp == stamp:
+            return cached
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                rules = IgnoreRules(directory, parse_rules(f.read()), stamp)
+        except OSError:
+            return None
+        with self._lock:
+            self._rules[file_path] = rules
+        return rules
+
+    def _rules_for(self, directory: str) -> list:
+        rules = []
+        if directory == self.root:
+            exclude = self._load(directory, os.path.join(directory, ".git", "info", "exclude"))
+            if exclude is not None:
+                rules.append(exclude)
+        gitignore = self._load(directory, os.path.join(directory, ".gitignore"))
+        if gitignore is not None:
+            rules.append(gitignore)
+        return rules
+
+    def _inside(self, path: str) -> bool:
+        return path == self.root or path.startswith(self.root.rstrip(os.sep) + os.sep)
+
+    def checker(self):
+        """
+        Returns an `ignore(path, is_dir)` callable for one walk.
+
+        The rule chain and ignored state of every directory are memoised for
+        the lifetime of the callable, so a walk costs one lookup per entry on
+        top of the regex matches, and each ignore file is stat-ed once.
+        """
+        chains = {}
+        ignored_dirs = {}
+
+        def chain_for(directory: str) -> tuple:
+            chain = chains.get(directory)
+            if chain is None:
+                parent_chain = () if directory == self.root else chain_for(os.path.dirname(directory))
+                chain = chains[directory] = parent_chain + tuple(self._rules_for(directory))
+            return chain
+
+        def matches(path: str, is_dir: bool) -> bool:
+            if os.path.basename(path) == ".git":
+                return True
+            # Deeper ignore files take precedence over shallower ones.
+            for rules in reversed(chain_for(os.path.dirname(path))):
+                result = rules.match(os.path.relpath(path, rules.base).replace(os.sep, "/"), is_dir)
+                if result is not None:
+                    return result
+            return False
+
+        def directory_ignored(directory: str) -> bool:
+            result = ignored_dirs.get(directory)
+            if result is None:
+                result = directory != self.root and (
+                    directory_ignored(os.path.dirname(directory)) or matches(directory, True)
+                )
+                ignored_dirs[directory] = result
+            return result
+
+        def ignore(path: str, is_dir: bool) -> bool:
+            path = os.path.abspath(path)
+            if path == self.root or not self._inside(path):
+                return False
+            # Nothing below an ignored directory can be re-included.
+            return directory_ignored(os.path.dirname(path)) or matches(path, is_dir)
+
+        return ignore
+
+    def is_ignored(self, path: str, is_dir: bool = None) -> bool:
+        """Checks a single path."""
+        if is_dir is None:
+            is_dir = os.path.isdir(path)
+        return self.checker()(path, is_dir)
+
+
+def get_matcher(path: str) -> IgnoreMatcher:
+    """Returns the shared matcher for the repository containing a path (or the path itself outside a repository)."""
+    root = find_repository_root(path) or os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path))
+    with _matchers_lock:
+        matcher = _matchers.get(root)
+        if matcher is None:
+            matcher = _matchers[root] = IgnoreMatcher(root)
+    return matcher
@@ -0,0 +1,181 @@
+"""
+Sparse line-offset indexes that let `read_file` seek straight to a line range.
+
+Building an index memory-maps the file and records, roughly every
+`CHECKPOINT_BYTES`, the byte offset and number of the first line that starts
+there. Reading a window then seeks to the nearest checkpoint, skips at most a
+checkpoint's worth of lines and streams only the requested lines, so memory use
+stays constant regardless of the file size. Indexes are cached per process and
+invalidated when a file's mtime or size changes.
+"""
+import array
+import bisect
+import collections
+import mmap
+import os
+import threading
+
+# Approximate distance in bytes between two checkpoints.
+CHECKPOINT_BYTES = 64 * 1024
+
+# Number of file indexes kept in the in-process cache.
+MAX_CACHED_INDEXES = 64
+
+# Size of the reads used to skip over the remainder of an overlong line.
+_SKIP_CHUNK_BYTES = 64 * 1024
+
+# Size of the slices newlines are counted in, so a long line is never copied whole.
+_COUNT_CHUNK_BYTES = 64 * 1024
+
+# Scanned pages are released from the mapping every this many bytes.
+_RELEASE_BYTES = 64 * 1024 * 1024
+_CAN_RELEASE_PAGES = hasattr(mmap, "MADV_DONTNEED")
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class LineIndex:
+    """The checkpoints of one version of a file."""
+
+    __slots__ = ("mtime_ns", "size", "lines", "offsets", "total_lines")
+
+    def __init__(self, mtime_ns: int, size: int, lines: array.array, offsets: array.array, total_lines: int):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.lines = lines
+        self.offsets = offsets
+        self.total_lines = total_lines
+
+    def checkpoint_for(self, line: int) -> tuple[int, int]:
+        """Returns the (line_number, byte_offset) of the last checkpoint at or before a line."""
+        i = bisect.bisect_right(self.lines, line) - 1
+        return self.lines[i], self.offsets[i]
+
+
+def _count_newlines(mm: mmap.mmap, start: int, end: int) -> int:
+    """Counts the newlines in `mm[start:end]`, copying at most `_COUNT_CHUNK_BYTES` at a time."""
+    count = 0
+    for chunk_start in range(start, end, _COUNT_CHUNK_BYTES):
+        count += mm[chunk_start:min(chunk_start + _COUNT_CHUNK_BYTES, end)].count(b"\n")
+    return count
+
+
+def build_line_index(file_path: str, st: os.stat_result = None) -> LineIndex:
+    """Scans a file once and returns its line index."""
+    st = st or os.stat(file_path)
+    lines = array.array("Q", [0])
+    offsets = array.array("Q", [0])
+    size = st.st_size
+    if size == 0:
+        return LineIndex(st.st_mtime_ns, size, lines, offsets, 0)
+
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        pos = 0
+        released = 0
+        line = 0
+        while True:
+            if _CAN_RELEASE_PAGES and pos - released >= _RELEASE_BYTES:
+                # Drop the pages already scanned so a huge file does not inflate our RSS.
+                release_end = pos - pos % mmap.PAGESIZE
+                mm.madvise(mmap.MADV_DONTNEED, released, release_end - released)
+                released = release_end
+            target = pos + CHECKPOINT_BYTES
+            newline = mm.find(b"\n", target - 1) if target < size else -1
+            if newline == -1:
+                line += _count_newlines(mm, pos, size)
+                break
+            line += _count_newlines(mm, pos, newline + 1)
+            pos = newline + 1
+            if pos >= size:
+                break
+            lines.append(line)
+            offsets.append(pos)
+        ends_with_newline = mm[size - 1:size] == b"\n"
+
+    total_lines = line if ends_with_newline else line + 1
+    return LineIndex(st.st_mtime_ns, size, lines, offsets, total_lines)
+
+
+def get_line_index(file_path: str) -> LineIndex:
+    """Returns the cached line index of a file, rebuilding it if the file changed."""
+    key = os.path.realpath(file_path)
+    st = os.stat(key)
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None and index.mtime_ns == st.st_mtime_ns and index.size == st.st_size:
+            _cache.move_to_end(key)
+            return index
+    index = build_line_index(key, st)
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_INDEXES:
+            _cache.popitem(last=False)
+    return index
+
+
+def _read_line(f, max_bytes: int) -> tuple[bytes, bool]:
+    """Reads one line of at most `max_bytes`, discarding the rest. Returns (line, was_cut)."""
+    line = f.readline(max_bytes)
+    if len(line) < max_bytes or line.endswith(b"\n"):
+        return line, False
+    while True:
+        rest = f.readline(_SKIP_CHUNK_BYTES)
+        if not rest or rest.endswith(b"\n"):
+            return line + (b"\n" if rest else b""), True
+
+
+def read_lines(file_path: str, offset: int, limit: int, max_line_bytes: int = None):
+    """
+    Streams `limit` lines starting at the 0-based line `offset`.
+
+    Returns (lines, index, cut_lines), where `lines` are the raw byte lines
+    (with their line endings) and `cut_lines` counts the lines shortened to
+    `max_line_bytes`.
+    """
+    index = get_line_index(file_path)
+    if offset >= index.total_lines or limit <= 0:
+        return [], index, 0
+    checkpoint_line, checkpoint_offset = index.checkpoint_for(offset)
+    lines = []
+    cut_lines = 0
+    with open(file_path, "rb") as f:
+        f.seek(checkpoint_offset)
+        for _ in range(offset - checkpoint_line):
+            _read_line(f, _SKIP_CHUNK_BYTES)
+        for _ in range(limit):
+            if max_line_bytes is None:
+                line, was_cut = f.readline(), False
+            else:
+                line, was_cut = _read_line(f, max_line_bytes)
+            if not line:
+                break
+            lines.append(line)
+            cut_lines += was_cut
+    return lines, index, cut_lines
+
+
+def byte_range(file_path: str, offset: int, limit: int) -> tuple[int, int, LineIndex]:
+    """
+    Returns the (start, end) byte offsets of `limit` lines starting at the
+    0-based line `offset`, and the file's index. Only the lines between the
+    nearest checkpoint and the end of the range are read.
+    """
+    index = get_line_index(file_path)
+    if offset >= index.total_lines or limit <= 0:
+        return index.size, index.size, index
+    checkpoint_line, checkpoint_offset = index.checkpoint_for(offset)
+    with open(file_path, "rb") as f:
+        f.seek(checkpoint_offset)
+        for _ in range(offset - checkpoint_line):
+            _read_line(f, _SKIP_CHUNK_BYTES)
+        start = f.tell()
+        for _ in range(limit):
+            line, _ = _read_line(f, _SKIP_CHUNK_BYTES)
+            if not line:
+                break
+        return start, f.tell(), index
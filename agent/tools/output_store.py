@@ -0,0 +1,132 @@
+"""
+Content-addressed storage for tool outputs too large to keep in the conversation.
+
+`spill(text)` writes an output longer than `SPILL_THRESHOLD_CHARS` to
+`OUTPUT_DIR/<handle>.txt`, where the handle is derived from the SHA-256 of the
+text, so the same output is only stored once. It returns what the model gets
+instead: a notice with the handle and the size, and the first and last lines of
+the output (about `PREVIEW_CHARS` characters each). `read_page` then serves
+line ranges of a stored output through `line_index`, bounded to
+`PAGE_MAX_BYTES`, so no single tool result grows past a fixed size.
+
+Stored outputs are touched when read; once they take more than
+`MAX_STORED_BYTES`, the least recently used ones are deleted.
+"""
+import hashlib
+import os
+
+from agent.tools import file_copy, line_index
+
+OUTPUT_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gemini_agent",
+    "tool_outputs",
+)
+
+# Outputs longer than this many characters are stored and previewed.
+SPILL_THRESHOLD_CHARS = 32 * 1024
+
+# Characters shown from the start and from the end of a stored output.
+PREVIEW_CHARS = 4 * 1024
+
+# Upper bound of one page returned by `read_page`, and of each of its lines.
+PAGE_MAX_BYTES = 32 * 1024
+PAGE_MAX_LINE_BYTES = 2000
+
+# Disk space kept for stored outputs.
+MAX_STORED_BYTES = 256 * 1024 * 1024
+
+HANDLE_PREFIX = "out-"
+
+
+def _path(handle: str) -> str:
+    return os.path.join(OUTPUT_DIR, f"{handle}.txt")
+
+
+def store(text: str) -> str:
+    """Stores a text unless it is already stored; returns its handle."""
+    data = text.encode("utf-8", errors="surrogateescape")
+    handle = HANDLE_PREFIX + hashlib.sha256(data).hexdigest()[:24]
+    path = _path(handle)
+    if os.path.exists(path):
+        os.utime(path)
+        return handle
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with file_copy.write_atomically(path) as fd:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    _prune(keep=path)
+    return handle
+
+
+def _prune(keep: str):
+    entries = []
+    with os.scandir(OUTPUT_DIR) as it:
+        for entry in it:
+            if entry.name.startswith(HANDLE_PREFIX) and entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= MAX_STORED_BYTES:
+            break
+        if path != keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def _head(text: str, limit: int) -> str:
+    head = text[:limit]
+    cut = head.rfind("\n")
+    return head[:cut + 1] if cut > 0 else head
+
+
+def _tail(text: str, limit: int) -> str:
+    tail = text[-limit:]
+    cut = tail.find("\n")
+    return tail[cut + 1:] if 0 <= cut < len(tail) - 1 else tail
+
+
+def spill(text: str) -> str:
+    """Returns `text` itself if it is short enough, otherwise a preview of the stored text."""
+    if len(text) <= SPILL_THRESHOLD_CHARS:
+        return text
+    handle = store(text)
+    total_lines = text.count("\n") + (0 if text.endswith("\n") else 1)
+    head = _head(text, PREVIEW_CHARS)
+    tail = _tail(text, PREVIEW_CHARS)
+    head_lines = head.count("\n")
+    tail_lines = tail.count("\n") + (0 if tail.endswith("\n") else 1)
+    return (
+        f"[This output is too large for the conversation ({len(text)} characters, {total_lines} lines). "
+        f"It is stored as {handle}: call read_tool_output with this handle and offset/limit (in lines) "
+        f"to read the rest. Its first {head_lines} and last {tail_lines} lines follow.]\n"
+        f"{head}"
+        f"... [lines {head_lines + 1}-{total_lines - tail_lines} not shown] ...\n"
+        f"{tail}"
+    )
+
+
+def read_page(handle: str, offset: int, limit: int):
+    """
+    Returns (lines, total_lines, cut_lines) for a line range of a stored output:
+    at most `limit` lines and `PAGE_MAX_BYTES` bytes, with lines longer than
+    `PAGE_MAX_LINE_BYTES` shortened (counted in `cut_lines`). Raises
+    FileNotFoundError for unknown handles.
+    """
+    if not handle.startswith(HANDLE_PREFIX) or not handle[len(HANDLE_PREFIX):].isalnum():
+        raise FileNotFoundError(handle)
+    path = _path(handle)
+    lines, index, cut_lines = line_index.read_lines(path, offset, limit, max_line_bytes=PAGE_MAX_LINE_BYTES)
+    os.utime(path)
+    size = 0
+    for i, line in enumerate(lines):
+        size += len(line)
+        if size > PAGE_MAX_BYTES and i:
+            lines = lines[:i]
+            break
+    return lines, index.total_lines, cut_lines
@@ -0,0 +1,326 @@
+"""
+Tracks the background processes started by shell commands.
+
+Commands started with `background=true` become jobs whose merged stdout and
+stderr are copied by a reader thread into rotating spill files under
+`SPILL_DIR`: once the current file reaches `SPILL_MAX_BYTES` it is moved to
+`output.log.1` (replacing the previous one), so a job never uses more than two
+files' worth of disk. When the job's pipe closes, the thread reaps it with
+`wait4` and records its exit status and resource usage.
+
+Processes a foreground command leaves running (e.g. with `&`) are adopted as
+jobs too, found through their process group in /proc. Their output is not
+captured, and since they are not our children only their liveness is known.
+
+Jobs belong to the conversation thread that started them; at most
+`MAX_FINISHED_JOBS` finished jobs are kept per thread. When the agent exits,
+the jobs it started are killed and their spill files removed.
+"""
+import atexit
+import itertools
+import os
+import signal
+import subprocess
+import threading
+import time
+
+SPILL_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gemini_agent",
+    "jobs",
+)
+
+# Size at which a job's spill file is rotated.
+SPILL_MAX_BYTES = 4 * 1024 * 1024
+
+# Number of finished jobs remembered per conversation thread.
+MAX_FINISHED_JOBS = 20
+
+_READ_BYTES = 64 * 1024
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class ResourceUsage:
+    """CPU seconds of a command and its waited-for children."""
+
+    __slots__ = ("user", "system")
+
+    def __init__(self, user: float, system: float):
+        self.user = user
+        self.system = system
+
+    @classmethod
+    def from_rusage(cls, rusage) -> "ResourceUsage":
+        # Not ru_maxrss: a forked child starts with the agent's own pages, so it reports the agent's RSS.
+        return cls(rusage.ru_utime, rusage.ru_stime)
+
+    def describe(self, wall_time: float) -> str:
+        return f"wall {wall_time:.2f}s, user {self.user:.2f}s, sys {self.system:.2f}s"
+
+
+def _proc_stat_fields(pid: int):
+    """Returns the fields of /proc/<pid>/stat after the command name, or None."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return data[data.rindex(b")") + 2:].split()
+
+
+def group_members(pgid: int) -> list[int]:
+    """Lists the live processes in a process group (empty where /proc is unavailable)."""
+    try:
+        # Cheap check first: most commands leave nothing behind, and then /proc need not be scanned.
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return []
+    except PermissionError:
+        pass
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return []
+    members = []
+    for pid in pids:
+        fields = _proc_stat_fields(pid)
+        # Zombies are already dead; they only wait to be reaped.
+        if fields is not None and int(fields[2]) == pgid and fields[0] != b"Z":
+            members.append(pid)
+    return sorted(members)
+
+
+def cpu_times(pid: int):
+    """Returns (user, system) seconds of a process plus its reaped children, from /proc."""
+    fields = _proc_stat_fields(pid)
+    if fields is None:
+        return None
+    utime, stime, cutime, cstime = (int(fields[i]) for i in (11, 12, 13, 14))
+    return (utime + cutime) / _CLOCK_TICKS, (stime + cstime) / _CLOCK_TICKS
+
+
+def is_alive(pid: int) -> bool:
+    fields = _proc_stat_fields(pid)
+    if fields is not None:
+        return fields[0] != b"Z"
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RotatingSpill:
+    """An append-only log split over `output.log` and the rotated `output.log.1`."""
+
+    def __init__(self, directory: str, max_bytes: int = None):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "output.log")
+        self.max_bytes = SPILL_MAX_BYTES if max_bytes is None else max_bytes
+        self.total = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._file = open(self.path, "wb")
+
+    def write(self, data: bytes):
+        with self._lock:
+            if self._file.closed:
+                # Removed while the job was still writing (e.g. at exit).
+                return
+            self.total += len(data)
+            if self._size + len(data) > self.max_bytes and self._size:
+                self._file.close()
+                os.replace(self.path, self.path + ".1")
+                self._file = open(self.path, "wb")
+                self._size = 0
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def tail(self, max_lines: int, max_bytes: int = 64 * 1024) -> str:
+        """Returns up to the last `max_lines` lines (and `max_bytes` bytes) written."""
+        data = b""
+        for path in (self.path, self.path + ".1"):
+            try:
+                with open(path, "rb") as f:
+                    f.seek(0, os.SEEK_END)
+                    size = f.tell()
+                    f.seek(max(size - (max_bytes - len(data)), 0))
+                    data = f.read() + data
+            except OSError:
+                continue
+            if len(data) >= max_bytes or data.count(b"\n") > max_lines:
+                break
+        lines = data.decode("utf-8", errors="replace").splitlines()
+        return "\n".join(lines[-max_lines:])
+
+    def remove(self):
+        self.close()
+        for path in (self.path, self.path + ".1"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            pass
+
+
+class Job:
+    """A background process group."""
+
+    def __init__(self, job_id: int, owner: str, command: str, pid: int, process: subprocess.Popen = None, spill: RotatingSpill = None, pgid: int = None):
+        self.id = job_id
+        self.owner = owner
+        self.command = command
+        self.pid = pid
+        self.pgid = pid if pgid is None else pgid
+        self.process = process
+        self.spill = spill
+        self.started = time.time()
+        self.ended = None
+        self.returncode = None
+        self.usage = None
+
+    @property
+    def running(self) -> bool:
+        if self.process is not None:
+            return self.ended is None
+        if self.ended is None and not is_alive(self.pid):
+            self.ended = time.time()
+        return self.ended is None
+
+    def status(self) -> str:
+        if self.running:
+            return f"running for {time.time() - self.started:.0f}s"
+        if self.returncode is None:
+            return "finished (exit status unknown: not started by the agent)"
+        if self.returncode < 0:
+            return f"killed by signal {-self.returncode}"
+        return f"exited with code {self.returncode}"
+
+    def describe(self) -> str:
+        lines = [
+            f"Job: {self.id}",
+            f"Command: {self.command}",
+            f"PID: {self.pid} (process group {self.pgid})",
+            f"Status: {self.status()}",
+        ]
+        if self.usage is not None:
+            lines.append(f"Resources: {self.usage.describe(self.ended - self.started)}")
+        if self.spill is not None:
+            lines.append(f"Output: {self.spill.total} bytes, spilled to {self.spill.path}")
+        else:
+            lines.append("Output: (not captured; start commands with background=true to capture their output)")
+        return "\n".join(lines)
+
+
+class ProcessManager:
+    """All background jobs, grouped by conversation thread."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, owner: str, command: str, cwd: str = None) -> Job:
+        """Starts `bash -c command` in its own process group, spilling its output."""
+        process = subprocess.Popen(
+            ["bash", "-c", command],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=cwd,
+            start_new_session=True,
+        )
+        job_id = next(self._ids)
+        spill = RotatingSpill(os.path.join(SPILL_DIR, f"{os.getpid()}-{job_id}"))
+        job = Job(job_id, owner, command, process.pid, process, spill)
+        self._add(job)
+        threading.Thread(target=self._pump, args=(job,), name=f"job-{job_id}", daemon=True).start()
+        return job
+
+    def adopt(self, owner: str, command: str, pids: list[int], pgid: int) -> list[Job]:
+        """Registers processes a foreground command left behind in its process group."""
+        with self._lock:
+            known = {job.pid for job in self._jobs.values()}
+        jobs = [Job(next(self._ids), owner, command, pid, pgid=pgid) for pid in pids if pid not in known]
+        for job in jobs:
+            self._add(job)
+        return jobs
+
+    def _add(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.owner == job.owner and j.ended is not None]
+            for old in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+                del self._jobs[old.id]
+                if old.spill is not None:
+                    old.spill.remove()
+
+    def _pump(self, job: Job):
+        fd = job.process.stdout.fileno()
+        try:
+            while True:
+                data = os.read(fd, _READ_BYTES)
+                if not data:
+                    break
+                job.spill.write(data)
+        finally:
+            job.process.stdout.close()
+            job.spill.close()
+            try:
+                _, status, rusage = os.wait4(job.pid, 0)
+                job.returncode = job.process.returncode = os.waitstatus_to_exitcode(status)
+                job.usage = ResourceUsage.from_rusage(rusage)
+            except ChildProcessError:
+                job.returncode = job.process.wait()
+            job.ended = time.time()
+
+    def get(self, owner: str, job_id: int) -> Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def list(self, owner: str) -> list[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.owner == owner]
+
+    def kill(self, job: Job, sig: int = signal.SIGTERM) -> bool:
+        """Signals a job's process group; returns False if it had already ended."""
+        if not job.running:
+            return False
+        try:
+            if job.process is not None:
+                os.killpg(job.pgid, sig)
+            else:
+                # Adopted processes may share their group with others, so only the process itself is signaled.
+                os.kill(job.pid, sig)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def kill_all(self):
+        """Kills the process groups of the jobs started with `start` and removes every spill file."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            if job.process is not None and job.ended is None:
+                try:
+                    os.killpg(job.pgid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+            if job.spill is not None:
+                job.spill.remove()
+
+
+manager = ProcessManager()
+atexit.register(manager.kill_all)
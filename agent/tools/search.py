@@ -0,0 +1,235 @@
+"""
+The regex search engine behind the `search_file_content` tool.
+
+The pattern is compiled once, binary files are skipped, and every file is
+scanned as a whole with a newline-offset index to recover line numbers. Large
+file sets are fanned out in batches across a process pool, and the search stops
+as soon as its match or file budget is spent.
+"""
+import bisect
+import itertools
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Number of leading bytes inspected to decide whether a file is binary.
+BINARY_SNIFF_BYTES = 8192
+
+# Below this many files, scanning in-process is faster than using the pool.
+PARALLEL_THRESHOLD = 64
+
+# Directory names that are never searched.
+DEFAULT_EXCLUDES = ['.git', '__pycache__', 'node_modules', '.pytest_cache']
+
+# Number of files handed to a worker process at a time.
+BATCH_SIZE = 32
+
+_executor = None
+_executor_workers = os.cpu_count() or 1
+
+
+def compile_pattern(pattern: str) -> re.Pattern:
+    """Compiles a search pattern so that `^` and `$` anchor at line boundaries."""
+    return re.compile(pattern, re.MULTILINE)
+
+
+def is_binary(sample: bytes) -> bool:
+    """Returns True if a head sample of a file looks like binary data."""
+    return b"\x00" in sample
+
+
+def _newline_offsets(text: str) -> list[int]:
+    """Returns the offsets of every newline character in the text."""
+    offsets = []
+    pos = text.find("\n")
+    while pos != -1:
+        offsets.append(pos)
+        pos = text.find("\n", pos + 1)
+    return offsets
+
+
+def scan_text(text: str, pattern: re.Pattern, max_matches: int = None) -> list[tuple[int, str]]:
+    """
+    Finds every line of the text that matches the pattern.
+
+    Lines are matched with the same semantics as searching each line (including
+    its trailing newline) on its own. Returns (line_number, stripped_line) pairs.
+    """
+    matches = []
+    newlines = None
+    pos = 0
+    length = len(text)
+    while pos < length:
+        if max_matches is not None and len(matches) >= max_matches:
+            break
+        m = pattern.search(text, pos)
+        if m is None:
+            break
+        start = m.start()
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", start)
+        if line_end == -1:
+            line_end = length
+        if start == length:
+            # An empty match past the final newline is not a line of its own.
+            break
+        line_limit = min(line_end + 1, length)
+        if m.end() > line_limit and not pattern.search(text, line_start, line_limit):
+            # The match spans several lines and the starting line does not match on its own.
+            pos = line_end + 1
+            continue
+        if newlines is None:
+            newlines = _newline_offsets(text)
+        line_num = bisect.bisect_left(newlines, start) + 1
+        matches.append((line_num, text[line_start:line_end].strip()))
+        pos = line_end + 1
+    return matches
+
+
+def scan_file(file_path: str, pattern: re.Pattern, max_matches: int = None) -> list[tuple[int, str]]:
+    """Reads a file and returns its matching lines, or an empty list for binary or unreadable files."""
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except (IOError, OSError):
+        return []
+    if is_binary(data[:BINARY_SNIFF_BYTES]):
+        return []
+    text = data.decode("utf-8", errors="ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return scan_text(text, pattern, max_matches)
+
+
+def _scan_batch(file_paths: list[str], pattern: str, max_matches: int = None) -> list[tuple[str, list]]:
+    """Worker entry point: scans a batch of files and returns those with matches."""
+    compiled = compile_pattern(pattern)
+    results = []
+    for file_path in file_paths:
+        file_matches = scan_file(file_path, compiled, max_matches)
+        if file_matches:
+            results.append((file_path, file_matches))
+    return results
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Returns the shared worker pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver") if "forkserver" in methods else None
+        _executor = ProcessPoolExecutor(max_workers=_executor_workers, mp_context=context)
+    return _executor
+
+
+def reset_executor():
+    """Discards a broken worker pool so the next search starts a fresh one."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _batches(iterator, size):
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _Budget:
+    """Tracks the match and file budget of a single search."""
+
+    def __init__(self, max_matches, max_files):
+        self.max_matches = max_matches
+        self.max_files = max_files
+        self.results = []
+        self.match_count = 0
+        self.truncated = False
+
+    def remaining_matches(self):
+        if self.max_matches is None:
+            return None
+        return self.max_matches - self.match_count
+
+    def add(self, file_path, file_matches) -> bool:
+        """Records a file's matches; returns False once the budget is exhausted."""
+        remaining = self.remaining_matches()
+        if remaining is not None and len(file_matches) > remaining:
+            file_matches = file_matches[:remaining]
+            self.truncated = True
+        self.results.append((file_path, file_matches))
+        self.match_count += len(file_matches)
+        if self.max_files is not None and len(self.results) >= self.max_files:
+            self.truncated = True
+            return False
+        if self.max_matches is not None and self.match_count >= self.max_matches:
+            self.truncated = True
+            return False
+        return True
+
+
+def search_files(file_paths, pattern: str, max_matches: int = None, max_files: int = None, parallel: bool = None):
+    """
+    Searches the given files for a regular expression.
+
+    `file_paths` may be any iterable and is consumed lazily, so an early stop
+    also stops the directory walk that produces it. The pattern must already be
+    known to compile. Returns a tuple of ([(file_path, [(line_number, line)])],
+    truncated), with files in the order they were given.
+    """
+    budget = _Budget(max_matches, max_files)
+    iterator = iter(file_paths)
+    head = list(itertools.islice(iterator, PARALLEL_THRESHOLD))
+    if parallel is None:
+        parallel = len(head) == PARALLEL_THRESHOLD and _executor_workers > 1
+
+    if not parallel:
+        compiled = compile_pattern(pattern)
+        for file_path in itertools.chain(head, iterator):
+            file_matches = scan_file(file_path, compiled, budget.remaining_matches())
+            if file_matches and not budget.add(file_path, file_matches):
+                break
+        return budget.results, budget.truncated
+
+    for batch_results in _parallel_scan(itertools.chain(head, iterator), pattern, max_matches):
+        for file_path, file_matches in batch_results:
+            if not budget.add(file_path, file_matches):
+                return budget.results, budget.truncated
+    return budget.results, budget.truncated
+
+
+def _parallel_scan(file_paths, pattern: str, max_matches: int = None):
+    """
+    Yields the results of each batch of files, in order, scanned on the worker pool.
+
+    Batches are submitted in a sliding window, so at most a window's worth of
+    work is wasted when the consumer stops early. If the pool breaks (e.g. a
+    worker is killed by the OOM killer) the remaining batches are scanned in-process.
+    """
+    executor = get_executor()
+    batches = _batches(iter(file_paths), BATCH_SIZE)
+    pending = [(batch, executor.submit(_scan_batch, batch, pattern, max_matches)) for batch in itertools.islice(batches, 2 * _executor_workers)]
+    try:
+        while pending:
+            batch, future = pending.pop(0)
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                reset_executor()
+                yield _scan_batch(batch, pattern, max_matches)
+                for pending_batch, _ in pending:
+                    yield _scan_batch(pending_batch, pattern, max_matches)
+                pending = []
+                for next_batch in batches:
+                    yield _scan_batch(next_batch, pattern, max_matches)
+                return
+            next_batch = next(batches, None)
+            if next_batch is not None:
+                pending.append((next_batch, executor.submit(_scan_batch, next_batch, pattern, max_matches)))
+    finally:
+        for _, future in pending:
+            future.cancel()
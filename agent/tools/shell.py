@@ -1,44 +1,166 @@
-import subprocess
+import asyncio
+import signal
+
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
+from langgraph.config import get_stream_writer
+
+from agent.tools import process_manager, shell_runner, shell_session
 
 @tool
-def run_shell_command(command: str, directory: str = None, description: str = None) -> str:
-    """This tool executes a given shell command as `bash -c <command>`. Command can start background processes using `&`. Command is executed as a subprocess that leads its own process group. Command process group can be terminated as `kill -- -PGID` or signaled as `kill -s SIGNAL -- -PGID`.
+def run_shell_command(command: str, directory: str = None, description: str = None, timeout: int = None, background: bool = False, config: RunnableConfig = None) -> str:
+    """This tool executes a given shell command with bash. Within a conversation, commands run in one persistent bash session, so the working directory (changed with `cd`), exported variables and activated virtualenvs carry over to later commands; `directory` only applies to the command it is given with. Such a command runs in the session's process group, not in a group of its own: do not kill that group, since it is the session itself. The command is stopped after `timeout` seconds (600 by default), which also restarts the session. Set `background` to true for long-running commands such as servers or watchers: the command then starts in its own process group, the tool returns its job id at once, and its output is captured for `tail_background_process`; stop it with `kill_background_process`. Command can also start background processes using `&`; they are listed in `Background PIDs` and tracked as jobs (see `list_background_processes`), but their output is not captured.
 
 The following information is returned:
 
 Command: Executed command.
 Directory: Directory (relative to project root) where command was executed, or `(root)`.
-Stdout: Output on stdout stream. Can be `(empty)` or partial on error and for any unwaited background processes.
-Stderr: Output on stderr stream. Can be `(empty)` or partial on error and for any unwaited background processes.
+Stdout: Output on stdout stream. Can be `(empty)` or partial on error and for any unwaited background processes. Long output keeps its beginning and end, with the number of omitted bytes in between.
+Stderr: Output on stderr stream. Can be `(empty)` or partial on error and for any unwaited background processes. Long output keeps its beginning and end, with the number of omitted bytes in between.
 Error: Error or `(none)` if no error was reported for the subprocess.
 Exit Code: Exit code or `(none)` if terminated by signal.
 Signal: Signal number or `(none)` if no signal was received.
 Background PIDs: List of background processes started or `(none)`.
-Process Group PGID: Process group started or `(none)`"""
+Process Group PGID: Process group the command led, or `(none)` when it ran in the conversation's shell session.
+Resources: Wall-clock time and user and system CPU seconds of the command."""
     try:
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=directory,
-            start_new_session=True
-        )
-        stdout, stderr = process.communicate()
-        
-        output = f"Command: {command}\n"
-        output += f"Directory: {directory or '(root)'}\n"
-        output += f"Stdout: {stdout.strip() if stdout.strip() else '(empty)'}\n"
-        output += f"Stderr: {stderr.strip() if stderr.strip() else '(empty)'}\n"
-        output += f"Error: (none)\n"
-        output += f"Exit Code: {process.returncode}\n"
-        output += f"Signal: (none)\n"
-        output += f"Background PIDs: (none)\n"
-        output += f"Process Group PGID: {process.pid}"
-        
-        return output
+        if background:
+            return _start_background(command, directory, config)
+        on_progress = _progress_publisher(command)
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        restarted = False
+        if thread_id is None:
+            result = shell_runner.run(command, cwd=directory, timeout=timeout, on_progress=on_progress)
+        else:
+            result, restarted = shell_session.pool.run(str(thread_id), command, cwd=directory, timeout=timeout, on_progress=on_progress)
+        return _report(command, directory, result, restarted, config, in_session=thread_id is not None)
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
 
+async def _arun_shell_command(command: str, directory: str = None, description: str = None, timeout: int = None, background: bool = False, config: RunnableConfig = None) -> str:
+    """Runs the command on the event loop; session commands run on a worker thread, since the session is a blocking pipe."""
+    try:
+        if background:
+            return _start_background(command, directory, config)
+        on_progress = _progress_publisher(command)
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        restarted = False
+        if thread_id is None:
+            result = await shell_runner.arun(command, cwd=directory, timeout=timeout, on_progress=on_progress)
+        else:
+            result, restarted = await asyncio.to_thread(
+                shell_session.pool.run, str(thread_id), command, cwd=directory, timeout=timeout, on_progress=on_progress
+            )
+        return _report(command, directory, result, restarted, config, in_session=thread_id is not None)
     except Exception as e:
-        return f"An unexpected error occurred: {e}"
\ No newline at end of file
+        return f"An unexpected error occurred: {e}"
+
+run_shell_command.coroutine = _arun_shell_command
+
+def _start_background(command: str, directory: str, config: RunnableConfig) -> str:
+    job = process_manager.manager.start(_owner(config), command, cwd=directory)
+    return (
+        f"Command: {command}\n"
+        f"Directory: {directory or '(root)'}\n"
+        f"Started background job {job.id} (PID {job.pid}, process group {job.pid}). "
+        f"Use poll_background_process, tail_background_process and kill_background_process with job id {job.id}."
+    )
+
+def _report(command: str, directory: str, result: shell_runner.CommandResult, restarted: bool, config: RunnableConfig, in_session: bool) -> str:
+    jobs = process_manager.manager.adopt(_owner(config), command, result.background_pids, result.pid)
+    output = format_result(command, directory, result, [job.pid for job in jobs], own_group=not in_session)
+    if restarted:
+        output += "\n(The shell session ended; the next command starts a fresh session without the previous directory or environment changes.)"
+    return output
+
+def _stream_text(buffer: shell_runner.HeadTailBuffer) -> str:
+    text = buffer.text().strip()
+    return text if text else "(empty)"
+
+def format_result(command: str, directory: str, result: shell_runner.CommandResult, background_pids: list[int] = None, own_group: bool = True) -> str:
+    """
+    Renders a finished command in the `Command/Stdout/Stderr/...` format. A
+    command run in a shell session (`own_group=False`) has no process group of
+    its own, so none is reported.
+    """
+    error = "(none)"
+    if result.timed_out:
+        error = f"Command timed out after {result.wall_time:.1f} seconds; its process group was terminated."
+    output = f"Command: {command}\n"
+    output += f"Directory: {directory or '(root)'}\n"
+    output += f"Stdout: {_stream_text(result.stdout)}\n"
+    output += f"Stderr: {_stream_text(result.stderr)}\n"
+    output += f"Error: {error}\n"
+    output += f"Exit Code: {result.exit_code if result.exit_code is not None else '(none)'}\n"
+    output += f"Signal: {result.signal if result.signal is not None else '(none)'}\n"
+    if background_pids is None:
+        background_pids = result.background_pids
+    output += f"Background PIDs: {', '.join(map(str, background_pids)) if background_pids else '(none)'}\n"
+    output += f"Process Group PGID: {result.pid if own_group else '(none)'}"
+    if result.usage is not None:
+        output += f"\nResources: {result.usage.describe(result.wall_time)}"
+    return output
+
+def _owner(config: RunnableConfig) -> str:
+    """Background jobs belong to the conversation thread, or to "default" outside one."""
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    return "default" if thread_id is None else str(thread_id)
+
+def _find_job(job_id: int, config: RunnableConfig):
+    job = process_manager.manager.get(_owner(config), job_id)
+    if job is None:
+        return None, f"Error: No background job with id {job_id}. Use list_background_processes to see the jobs."
+    return job, None
+
+@tool
+def list_background_processes(config: RunnableConfig = None) -> str:
+    """Lists the background jobs of this conversation: commands run with `background=true` and processes left running by other commands, with their status."""
+    jobs = process_manager.manager.list(_owner(config))
+    if not jobs:
+        return "No background jobs."
+    return "\n".join(f"[{job.id}] PID {job.pid}, {job.status()}: {job.command}" for job in jobs)
+
+@tool
+def poll_background_process(job_id: int, config: RunnableConfig = None) -> str:
+    """Reports whether a background job is still running, its exit code once it finished, its resource usage and how much output it produced."""
+    job, error = _find_job(job_id, config)
+    return error or job.describe()
+
+@tool
+def tail_background_process(job_id: int, lines: int = 50, config: RunnableConfig = None) -> str:
+    """Returns the last `lines` lines of output (stdout and stderr interleaved) of a job started with `background=true`."""
+    job, error = _find_job(job_id, config)
+    if error:
+        return error
+    if lines <= 0:
+        return "Error: Invalid parameters provided. Reason: lines must be a positive number."
+    if job.spill is None:
+        return f"Error: The output of job {job_id} is not captured; only commands run with background=true have their output captured."
+    output = job.spill.tail(lines)
+    return f"{job.describe()}\n--- last {lines} lines ---\n{output or '(empty)'}"
+
+@tool
+def kill_background_process(job_id: int, signal_name: str = "TERM", config: RunnableConfig = None) -> str:
+    """Sends a signal (`TERM` by default, or e.g. `KILL`, `INT`, `HUP`) to a background job's process group."""
+    job, error = _find_job(job_id, config)
+    if error:
+        return error
+    try:
+        sig = signal.Signals["SIG" + signal_name.upper().removeprefix("SIG")]
+    except KeyError:
+        return f"Error: Invalid parameters provided. Reason: Unknown signal: {signal_name}"
+    if not process_manager.manager.kill(job, sig):
+        return f"Job {job_id} is no longer running ({job.status()})."
+    return f"Sent {sig.name} to job {job_id} (PID {job.pid})."
+
+def _progress_publisher(command: str):
+    """Returns a callback that streams partial output to LangGraph's "custom" stream mode, or None outside a graph run."""
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return None
+
+    def publish(stdout, stderr):
+        writer({"tool": "run_shell_command", "command": command, "stdout": stdout.text(), "stderr": stderr.text()})
+
+    return publish
@@ -0,0 +1,298 @@
+"""
+Runs shell commands with bounded memory and a wall-clock timeout.
+
+Both pipes are read incrementally as data arrives. Each stream keeps its first
+`HEAD_BYTES` and its last `TAIL_BYTES` and only counts what falls in between,
+so a command can print gigabytes without growing the agent's memory. When the
+timeout expires, the command's whole process group gets SIGTERM and, after
+`KILL_GRACE_SECONDS`, SIGKILL. Once the command itself has exited, the pipes
+are only drained for `BACKGROUND_DRAIN_SECONDS`, so background jobs that keep
+them open cannot block the caller; processes still in the group at that point
+are reported as background processes. The command is reaped with `wait4`, which
+also yields its CPU time.
+
+`arun` does the same on an asyncio event loop: the pipes are read through
+`connect_read_pipe` and the exit is awaited through a pidfd (or by polling),
+so a long command never blocks the loop.
+"""
+import asyncio
+import collections
+import os
+import selectors
+import signal
+import subprocess
+import time
+
+from agent.tools import process_manager
+
+# Bytes kept from the start and from the end of each output stream.
+HEAD_BYTES = 16 * 1024
+TAIL_BYTES = 16 * 1024
+
+# Default wall-clock limit of a command, in seconds.
+DEFAULT_TIMEOUT_SECONDS = 600
+
+# Seconds between SIGTERM and SIGKILL when a command times out.
+KILL_GRACE_SECONDS = 2.0
+
+# Seconds the pipes are still read after the command exits.
+BACKGROUND_DRAIN_SECONDS = 0.2
+
+# Minimum seconds between two progress reports.
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+_READ_BYTES = 64 * 1024
+
+
+class HeadTailBuffer:
+    """Keeps the head and the tail of a byte stream and counts the bytes in between."""
+
+    def __init__(self, head_bytes: int = None, tail_bytes: int = None):
+        self.head_bytes = HEAD_BYTES if head_bytes is None else head_bytes
+        self.tail_bytes = TAIL_BYTES if tail_bytes is None else tail_bytes
+        self.head = bytearray()
+        self.tail = collections.deque()
+        self.tail_size = 0
+        self.total = 0
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data or self.tail_bytes <= 0:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        while self.tail_size - len(self.tail[0]) >= self.tail_bytes:
+            self.tail_size -= len(self.tail.popleft())
+
+    @property
+    def omitted(self) -> int:
+        """Number of bytes dropped between the head and the tail."""
+        return self.total - len(self.head) - min(self.tail_size, self.tail_bytes)
+
+    def text(self) -> str:
+        """Decodes the kept output, marking where bytes were dropped."""
+        tail = b"".join(self.tail)[-self.tail_bytes:] if self.tail else b""
+        head_text = self.head.decode("utf-8", errors="replace")
+        tail_text = tail.decode("utf-8", errors="replace")
+        if self.omitted:
+            content = f"{head_text}\n... [{self.omitted} bytes omitted] ...\n{tail_text}"
+        else:
+            content = head_text + tail_text
+        return content.replace("\r\n", "\n")
+
+
+class CommandResult:
+    """What a finished command produced."""
+
+    def __init__(self, pid: int, stdout: HeadTailBuffer, stderr: HeadTailBuffer, returncode: int, timed_out: bool, wall_time: float,
+                 usage: process_manager.ResourceUsage = None, background_pids: list[int] = ()):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.wall_time = wall_time
+        self.usage = usage
+        self.background_pids = list(background_pids)
+
+    @property
+    def exit_code(self):
+        return self.returncode if self.returncode is not None and self.returncode >= 0 else None
+
+    @property
+    def signal(self):
+        return -self.returncode if self.returncode is not None and self.returncode < 0 else None
+
+
+def kill_group(pgid: int, sig: int = signal.SIGKILL):
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _reap(process: subprocess.Popen, block: bool):
+    """Waits for a process with wait4; returns its ResourceUsage, or None while it is still running."""
+    try:
+        pid, status, rusage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        process.wait()
+        return process_manager.ResourceUsage(0.0, 0.0)
+    if pid == 0:
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process_manager.ResourceUsage.from_rusage(rusage)
+
+
+def run(command: str, cwd: str = None, timeout: float = None, on_progress=None) -> CommandResult:
+    """
+    Runs `bash -c command` as the leader of a new process group.
+
+    `on_progress(stdout, stderr)`, if given, is called with the buffers at most
+    every `PROGRESS_INTERVAL_SECONDS` while output arrives.
+    """
+    timeout = DEFAULT_TIMEOUT_SECONDS if timeout is None else timeout
+    process = subprocess.Popen(
+        ["bash", "-c", command],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+    )
+    buffers = {process.stdout.fileno(): HeadTailBuffer(), process.stderr.fileno(): HeadTailBuffer()}
+    stdout, stderr = buffers.values()
+    selector = selectors.DefaultSelector()
+    for pipe in (process.stdout, process.stderr):
+        selector.register(pipe, selectors.EVENT_READ)
+
+    start = time.monotonic()
+    usage = None
+    exited_at = None
+    term_sent_at = None
+    killed = False
+    last_progress = start
+    try:
+        while selector.get_map():
+            now = time.monotonic()
+            if exited_at is None and (usage := _reap(process, block=False)) is not None:
+                exited_at = now
+            if exited_at is not None and now - exited_at >= BACKGROUND_DRAIN_SECONDS:
+                break
+            if timeout and term_sent_at is None and now - start >= timeout:
+                kill_group(process.pid, signal.SIGTERM)
+                term_sent_at = now
+            if term_sent_at is not None and not killed and now - term_sent_at >= KILL_GRACE_SECONDS:
+                kill_group(process.pid, signal.SIGKILL)
+                killed = True
+
+            wait = 0.05 if exited_at is not None else 0.1
+            for key, _ in selector.select(wait):
+                data = os.read(key.fd, _READ_BYTES)
+                if data:
+                    buffers[key.fd].write(data)
+                else:
+                    selector.unregister(key.fileobj)
+            if on_progress is not None and now - last_progress >= PROGRESS_INTERVAL_SECONDS:
+                last_progress = now
+                on_progress(stdout, stderr)
+
+        if term_sent_at is not None and usage is None:
+            # The group may have ignored SIGTERM while its output pipes were closed.
+            deadline = term_sent_at + KILL_GRACE_SECONDS
+            while usage is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+                usage = _reap(process, block=False)
+            if usage is None:
+                kill_group(process.pid, signal.SIGKILL)
+        if usage is None:
+            usage = _reap(process, block=True)
+        wall_time = time.monotonic() - start
+    finally:
+        selector.close()
+        process.stdout.close()
+        process.stderr.close()
+        if process.returncode is None:
+            kill_group(process.pid, signal.SIGKILL)
+            _reap(process, block=True)
+    background_pids = process_manager.group_members(process.pid)
+    return CommandResult(process.pid, stdout, stderr, process.returncode, term_sent_at is not None, wall_time, usage, background_pids)
+
+
+class _PipeProtocol(asyncio.Protocol):
+    """Feeds a pipe into a HeadTailBuffer on the event loop."""
+
+    def __init__(self, buffer: HeadTailBuffer, on_data):
+        self.buffer = buffer
+        self.on_data = on_data
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def data_received(self, data: bytes):
+        self.buffer.write(data)
+        self.on_data()
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+async def _wait_exit(process: subprocess.Popen) -> process_manager.ResourceUsage:
+    """Awaits the exit of a process and reaps it; returns its ResourceUsage."""
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(process.pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    try:
+        while (usage := _reap(process, block=False)) is None:
+            if pidfd is None:
+                await asyncio.sleep(0.05)
+                continue
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+        return usage
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+async def arun(command: str, cwd: str = None, timeout: float = None, on_progress=None) -> CommandResult:
+    """The asyncio counterpart of `run`."""
+    timeout = DEFAULT_TIMEOUT_SECONDS if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    process = subprocess.Popen(
+        ["bash", "-c", command],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+    )
+    stdout, stderr = HeadTailBuffer(), HeadTailBuffer()
+    start = time.monotonic()
+    last_progress = start
+
+    def report():
+        nonlocal last_progress
+        now = time.monotonic()
+        if on_progress is not None and now - last_progress >= PROGRESS_INTERVAL_SECONDS:
+            last_progress = now
+            on_progress(stdout, stderr)
+
+    transports = []
+    waiter = None
+    try:
+        protocols = []
+        for pipe, buffer in ((process.stdout, stdout), (process.stderr, stderr)):
+            transport, protocol = await loop.connect_read_pipe(lambda buffer=buffer: _PipeProtocol(buffer, report), pipe)
+            transports.append(transport)
+            protocols.append(protocol)
+        waiter = asyncio.ensure_future(_wait_exit(process))
+        done, _ = await asyncio.wait({waiter}, timeout=timeout or None)
+        timed_out = not done
+        if timed_out:
+            kill_group(process.pid, signal.SIGTERM)
+            done, _ = await asyncio.wait({waiter}, timeout=KILL_GRACE_SECONDS)
+            if not done:
+                kill_group(process.pid, signal.SIGKILL)
+        usage = await waiter
+        wall_time = time.monotonic() - start
+        await asyncio.wait([protocol.closed for protocol in protocols], timeout=BACKGROUND_DRAIN_SECONDS)
+    finally:
+        for transport in transports:
+            transport.close()
+        if process.returncode is None:
+            if waiter is not None:
+                waiter.cancel()
+            kill_group(process.pid, signal.SIGKILL)
+            _reap(process, block=True)
+    background_pids = process_manager.group_members(process.pid)
+    return CommandResult(process.pid, stdout, stderr, process.returncode, timed_out, wall_time, usage, background_pids)
@@ -0,0 +1,244 @@
+"""
+Long-lived bash sessions, one per conversation thread.
+
+A session is a `bash --noprofile --norc` process reading commands from a pipe,
+so `cd`, exported variables and activated virtualenvs carry over from one
+command to the next, and a command costs no fork/exec of a new shell. Each
+command is handed to `eval` with stdin redirected from /dev/null, followed by
+`printf` calls that write a random sentinel (and, on stdout, the exit code) to
+both output streams; output is read until both sentinels arrive.
+
+A session that dies (e.g. the command ran `exit`) or that is killed after a
+timeout is simply replaced by a fresh one on the next command. A command's CPU
+time is the growth of the session's own and reaped children's times in /proc,
+and processes it leaves in the session's process group are reported as
+background processes. Sessions idle for longer than `IDLE_SECONDS`, or beyond
+the `MAX_SESSIONS` most recently used ones, are closed.
+"""
+import atexit
+import collections
+import os
+import re
+import secrets
+import selectors
+import shlex
+import signal
+import subprocess
+import threading
+import time
+
+from agent.tools import process_manager, shell_runner
+
+# Seconds after which an unused session is closed.
+IDLE_SECONDS = 30 * 60
+
+# Number of sessions kept alive at once.
+MAX_SESSIONS = 32
+
+_READ_BYTES = 64 * 1024
+
+
+class _SentinelStream:
+    """Feeds one output stream into a buffer until its sentinel line shows up."""
+
+    def __init__(self, buffer: shell_runner.HeadTailBuffer, marker: bytes, with_status: bool):
+        self.buffer = buffer
+        self.marker = b"\n" + marker
+        self.pattern = re.compile(re.escape(self.marker) + (rb" (\d+)\n" if with_status else rb"\n"))
+        self.pending = b""
+        self.done = False
+        self.status = None
+
+    def feed(self, data: bytes):
+        self.pending += data
+        match = self.pattern.search(self.pending)
+        if match:
+            self.buffer.write(self.pending[:match.start()])
+            self.status = int(match.group(1)) if match.groups() else None
+            self.pending = b""
+            self.done = True
+            return
+        # Hold back whatever could still be the start of the sentinel line.
+        keep = len(self.marker) + 16
+        if len(self.pending) > keep:
+            self.buffer.write(self.pending[:-keep])
+            self.pending = self.pending[-keep:]
+
+    def flush(self):
+        self.buffer.write(self.pending)
+        self.pending = b""
+
+
+class ShellSession:
+    """One persistent bash process."""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # Callers between `SessionPool._acquire` and the end of their command; guarded by the pool lock.
+        self.leases = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        if self.alive:
+            shell_runner.kill_group(self.process.pid, signal.SIGKILL)
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+
+    def run(self, command: str, cwd: str = None, timeout: float = None, on_progress=None) -> shell_runner.CommandResult:
+        """Runs a command in the session. The caller holds `lock`."""
+        timeout = shell_runner.DEFAULT_TIMEOUT_SECONDS if timeout is None else timeout
+        marker = f"__AGENT_DONE_{secrets.token_hex(8)}__"
+        body = f"eval {shlex.quote(command)} </dev/null"
+        if cwd:
+            # The directory only applies to this command.
+            body = (
+                f'__agent_prev_dir=$PWD; if builtin cd -- {shlex.quote(cwd)}; then {body}; __agent_status=$?; '
+                f'builtin cd -- "$__agent_prev_dir"; else __agent_status=1; fi'
+            )
+        else:
+            body = f"{body}; __agent_status=$?"
+        script = (
+            f"{body}\n"
+            f"printf '\\n%s %d\\n' {marker} \"$__agent_status\"\n"
+            f"printf '\\n%s\\n' {marker} >&2\n"
+        )
+        self.last_used = time.monotonic()
+        stdout = shell_runner.HeadTailBuffer()
+        stderr = shell_runner.HeadTailBuffer()
+        streams = {
+            self.process.stdout.fileno(): _SentinelStream(stdout, marker.encode(), with_status=True),
+            self.process.stderr.fileno(): _SentinelStream(stderr, marker.encode(), with_status=False),
+        }
+        start = time.monotonic()
+        cpu_before = process_manager.cpu_times(self.process.pid)
+        timed_out = False
+        try:
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            pass
+
+        selector = selectors.DefaultSelector()
+        for pipe in (self.process.stdout, self.process.stderr):
+            selector.register(pipe, selectors.EVENT_READ)
+        last_progress = start
+        try:
+            while not all(stream.done for stream in streams.values()):
+                now = time.monotonic()
+                if timeout and now - start >= timeout:
+                    # The command shares the session's process group, so the session goes too.
+                    timed_out = True
+                    shell_runner.kill_group(self.process.pid, signal.SIGTERM)
+                    try:
+                        self.process.wait(timeout=shell_runner.KILL_GRACE_SECONDS)
+                    except subprocess.TimeoutExpired:
+                        shell_runner.kill_group(self.process.pid, signal.SIGKILL)
+                    break
+                events = selector.select(0.1)
+                if not events and not self.alive:
+                    break
+                for key, _ in events:
+                    data = os.read(key.fd, _READ_BYTES)
+                    if data:
+                        streams[key.fd].feed(data)
+                    else:
+                        selector.unregister(key.fileobj)
+                        streams[key.fd].done = True
+                if on_progress is not None and now - last_progress >= shell_runner.PROGRESS_INTERVAL_SECONDS:
+                    last_progress = now
+                    on_progress(stdout, stderr)
+        finally:
+            selector.close()
+        for stream in streams.values():
+            if stream.status is None:
+                stream.flush()
+
+        status = streams[self.process.stdout.fileno()].status
+        if status is None:
+            # The session died before finishing the command: report how bash itself ended.
+            status = self.process.wait()
+        self.last_used = time.monotonic()
+        usage = None
+        cpu_after = process_manager.cpu_times(self.process.pid)
+        if cpu_before is not None and cpu_after is not None:
+            usage = process_manager.ResourceUsage(cpu_after[0] - cpu_before[0], cpu_after[1] - cpu_before[1])
+        background_pids = [pid for pid in process_manager.group_members(self.process.pid) if pid != self.process.pid]
+        return shell_runner.CommandResult(
+            self.process.pid, stdout, stderr, status, timed_out, time.monotonic() - start, usage, background_pids
+        )
+
+
+class SessionPool:
+    """The sessions of all conversation threads."""
+
+    def __init__(self):
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def run(self, key: str, command: str, cwd: str = None, timeout: float = None, on_progress=None):
+        """Runs a command in the session of `key`, starting one if needed. Returns (result, session_restarted)."""
+        session = self._acquire(key)
+        try:
+            with session.lock:
+                result = session.run(command, cwd=cwd, timeout=timeout, on_progress=on_progress)
+                ended = not session.alive or result.timed_out
+        finally:
+            with self._lock:
+                session.leases -= 1
+        if ended:
+            with self._lock:
+                if self._sessions.get(key) is session:
+                    del self._sessions[key]
+            session.close()
+        return result, ended
+
+    def _acquire(self, key: str) -> ShellSession:
+        """Returns the session of `key`, leased to the caller until `run` releases it."""
+        expired = []
+        with self._lock:
+            now = time.monotonic()
+            # Leased sessions are about to run or running a command, and are never evicted.
+            for other_key, other in list(self._sessions.items()):
+                if other_key != key and now - other.last_used > IDLE_SECONDS and not other.leases:
+                    expired.append(self._sessions.pop(other_key))
+            session = self._sessions.get(key)
+            if session is not None and not session.alive:
+                # A leaseholder closes it itself once its command returns.
+                if not self._sessions.pop(key).leases:
+                    expired.append(session)
+                session = None
+            if session is None:
+                session = self._sessions[key] = ShellSession()
+            self._sessions.move_to_end(key)
+            session.leases += 1
+            session.last_used = now
+            for other_key in [k for k, s in self._sessions.items() if not s.leases]:
+                if len(self._sessions) <= MAX_SESSIONS:
+                    break
+                expired.append(self._sessions.pop(other_key))
+        for old in expired:
+            old.close()
+        return session
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+pool = SessionPool()
+atexit.register(pool.close_all)
@@ -0,0 +1,376 @@
+"""
+A long-lived, in-memory snapshot of the workspace's directory tree.
+
+The file-system tools list directories through `scandir()`, which serves
+directories under the working directory from memory. A directory is scanned
+(and every entry stat-ed) the first time it is listed; afterwards it is only
+touched again when something changes:
+
+- On Linux, every cached directory has an inotify watch. Pending events are
+  drained (without blocking) at the start of each listing, and only the
+  entries they name are stat-ed again.
+- Where inotify is unavailable, or the watch limit is reached, a cached
+  directory is re-scanned when its own mtime changes (an entry was added,
+  removed or renamed) and its files are re-stat-ed at most every
+  `POLL_INTERVAL` seconds.
+
+The tools that write files call `invalidate()` so their own writes are visible
+immediately in either mode.
+
+With inotify, `generation()` tells callers that keep something derived from
+the tree (like the trigram index) whether anything may have changed since they
+last looked, without walking it.
+"""
+import collections
+import ctypes
+import ctypes.util
+import itertools
+import os
+import stat
+import struct
+import threading
+import time
+
+# Seconds for which the file stats of a polled directory are trusted.
+POLL_INTERVAL = 1.0
+
+# Number of directories kept per snapshot; the least recently listed are dropped beyond that.
+MAX_CACHED_DIRS = 20000
+
+# Number of snapshots (one per working directory) kept alive.
+MAX_SNAPSHOTS = 4
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_DONT_FOLLOW = 0x2000000
+_IN_EXCL_UNLINK = 0x4000000
+
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+    | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR | _IN_DONT_FOLLOW | _IN_EXCL_UNLINK
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+_snapshots = collections.OrderedDict()
+_snapshots_lock = threading.Lock()
+
+# Generation numbers are unique across snapshots, so a new snapshot never repeats an old one's.
+_generations = itertools.count(1)
+
+
+class _Inotify:
+    """A non-blocking inotify instance, driven through libc with ctypes."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str) -> int:
+        """Returns the watch descriptor of a directory, or -1 if it cannot be watched."""
+        return self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+
+    def remove_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Yields (wd, mask, name) for every pending event."""
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, pos)
+                pos += _EVENT_HEADER.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+                pos += length
+                yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _open_inotify():
+    if not hasattr(os, "O_NONBLOCK"):
+        return None
+    try:
+        return _Inotify()
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+class SnapshotEntry:
+    """A cached directory entry with the subset of the `os.DirEntry` interface the tools use."""
+
+    __slots__ = ("name", "path", "_is_dir", "_is_file", "_is_symlink", "_stat")
+
+    def __init__(self, name: str, path: str, is_dir: bool, is_file: bool, is_symlink: bool, st):
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+        self._is_file = is_file
+        self._is_symlink = is_symlink
+        self._stat = st
+
+    @classmethod
+    def from_path(cls, directory: str, name: str):
+        """Stats a path; returns None when it no longer exists."""
+        path = os.path.join(directory, name)
+        try:
+            lst = os.lstat(path)
+        except OSError:
+            return None
+        is_symlink = stat.S_ISLNK(lst.st_mode)
+        st = lst
+        if is_symlink:
+            try:
+                st = os.stat(path)
+            except OSError:
+                # A dangling link is neither a file nor a directory.
+                return cls(name, path, False, False, True, None)
+        return cls(name, path, stat.S_ISDIR(st.st_mode), stat.S_ISREG(st.st_mode), is_symlink, st)
+
+    def is_dir(self) -> bool:
+        return self._is_dir
+
+    def is_file(self) -> bool:
+        return self._is_file
+
+    def is_symlink(self) -> bool:
+        return self._is_symlink
+
+    def stat(self) -> os.stat_result:
+        if self._stat is None:
+            raise FileNotFoundError(f"No such file or directory: '{self.path}'")
+        return self._stat
+
+
+class _Directory:
+    __slots__ = ("entries", "mtime_ns", "wd", "dirty", "checked")
+
+    def __init__(self, entries: dict, mtime_ns: int, wd: int):
+        self.entries = entries
+        self.mtime_ns = mtime_ns
+        self.wd = wd
+        self.dirty = set()
+        self.checked = time.monotonic()
+
+
+class WorkspaceSnapshot:
+    """The cached directory tree below one root."""
+
+    def __init__(self, root: str, use_inotify: bool = True):
+        self.root = os.path.abspath(root)
+        self._dirs = collections.OrderedDict()
+        self._by_wd = {}
+        self._lock = threading.RLock()
+        self._inotify = _open_inotify() if use_inotify else None
+        self._generation = next(_generations)
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._inotify is not None
+
+    def contains(self, path: str) -> bool:
+        return path == self.root or path.startswith(self.root.rstrip(os.sep) + os.sep)
+
+    def scandir(self, directory: str) -> list:
+        """Returns the entries of a directory below the root, from memory when possible."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            self._drain_events()
+            node = self._dirs.get(directory)
+            if node is None:
+                node = self._scan(directory)
+            else:
+                self._dirs.move_to_end(directory)
+                node = self._revalidate(directory, node)
+            return list(node.entries.values())
+
+    def generation(self):
+        """
+        Returns a number that changes whenever anything cached may have changed,
+        or None when only polling could tell (no inotify, or a cached directory
+        without a watch).
+        """
+        with self._lock:
+            self._drain_events()
+            if self._inotify is None or any(node.wd < 0 for node in self._dirs.values()):
+                return None
+            return self._generation
+
+    def invalidate(self, path: str):
+        """Forgets what is cached about a path and its parent directory listing."""
+        path = os.path.abspath(path)
+        with self._lock:
+            self._generation = next(_generations)
+            self._drop_subtree(path)
+            parent = self._dirs.get(os.path.dirname(path))
+            if parent is not None:
+                parent.dirty.add(os.path.basename(path))
+
+    def close(self):
+        with self._lock:
+            self._dirs.clear()
+            self._by_wd.clear()
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def _scan(self, directory: str) -> _Directory:
+        # The watch goes in before the listing, so no change can fall between the two.
+        wd = -1
+        if self._inotify is not None:
+            wd = self._inotify.add_watch(directory)
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                entries = {}
+                for entry in it:
+                    try:
+                        is_symlink = entry.is_symlink()
+                        is_dir = entry.is_dir()
+                        is_file = entry.is_file()
+                        st = entry.stat()
+                    except OSError:
+                        entries[entry.name] = SnapshotEntry(entry.name, entry.path, False, False, True, None)
+                        continue
+                    entries[entry.name] = SnapshotEntry(entry.name, entry.path, is_dir, is_file, is_symlink, st)
+        except OSError:
+            if wd >= 0:
+                self._inotify.remove_watch(wd)
+            raise
+        node = _Directory(entries, mtime_ns, wd)
+        self._generation = next(_generations)
+        if wd >= 0:
+            stale = self._by_wd.get(wd)
+            if stale is not None and stale != directory:
+                self._dirs.pop(stale, None)
+            self._by_wd[wd] = directory
+        self._dirs[directory] = node
+        while len(self._dirs) > MAX_CACHED_DIRS:
+            evicted_path, evicted = self._dirs.popitem(last=False)
+            self._forget_watch(evicted_path, evicted)
+        return node
+
+    def _revalidate(self, directory: str, node: _Directory) -> _Directory:
+        for name in node.dirty:
+            entry = SnapshotEntry.from_path(directory, name)
+            if entry is None:
+                node.entries.pop(name, None)
+            else:
+                node.entries[name] = entry
+        node.dirty.clear()
+        if node.wd >= 0:
+            return node
+        # Polled directory: a new mtime means entries were added, removed or renamed.
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            del self._dirs[directory]
+            raise
+        if mtime_ns != node.mtime_ns:
+            del self._dirs[directory]
+            return self._scan(directory)
+        elif time.monotonic() - node.checked >= POLL_INTERVAL:
+            for name in list(node.entries):
+                entry = SnapshotEntry.from_path(directory, name)
+                if entry is None:
+                    node.entries.pop(name)
+                else:
+                    node.entries[name] = entry
+            node.checked = time.monotonic()
+        return node
+
+    def _drain_events(self):
+        if self._inotify is None:
+            return
+        for wd, mask, name in self._inotify.read_events():
+            self._generation = next(_generations)
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost: nothing cached can be trusted any more.
+                for path, node in list(self._dirs.items()):
+                    self._forget_watch(path, node)
+                self._dirs.clear()
+                continue
+            directory = self._by_wd.get(wd)
+            if directory is None:
+                continue
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                self._drop_subtree(directory)
+                continue
+            node = self._dirs.get(directory)
+            if node is not None and name:
+                node.dirty.add(name)
+                if mask & (_IN_CREATE | _IN_DELETE | _IN_MOVED_FROM | _IN_MOVED_TO):
+                    self._drop_subtree(os.path.join(directory, name))
+
+    def _drop_subtree(self, path: str):
+        prefix = path.rstrip(os.sep) + os.sep
+        for cached in [p for p in self._dirs if p == path or p.startswith(prefix)]:
+            self._forget_watch(cached, self._dirs.pop(cached))
+
+    def _forget_watch(self, path: str, node: _Directory):
+        if node.wd >= 0 and self._by_wd.get(node.wd) == path:
+            del self._by_wd[node.wd]
+            if self._inotify is not None:
+                self._inotify.remove_watch(node.wd)
+
+
+def get_snapshot(root: str = None) -> WorkspaceSnapshot:
+    """Returns the shared snapshot of a root directory (the working directory by default)."""
+    root = os.path.abspath(root or os.getcwd())
+    with _snapshots_lock:
+        snapshot = _snapshots.get(root)
+        if snapshot is None:
+            snapshot = _snapshots[root] = WorkspaceSnapshot(root)
+            while len(_snapshots) > MAX_SNAPSHOTS:
+                _snapshots.popitem(last=False)[1].close()
+        else:
+            _snapshots.move_to_end(root)
+    return snapshot
+
+
+def scandir(directory: str) -> list:
+    """
+    Lists a directory like `list(os.scandir(directory))`, served from the
+    working directory's snapshot when the directory lies below it.
+    """
+    directory = os.path.abspath(directory)
+    snapshot = get_snapshot()
+    if snapshot.contains(directory):
+        return snapshot.scandir(directory)
+    with os.scandir(directory) as it:
+        return list(it)
+
+
+def invalidate(path: str):
+    """Tells every snapshot that a path was written, created or deleted."""
+    path = os.path.abspath(path)
+    with _snapshots_lock:
+        snapshots = list(_snapshots.values())
+    for snapshot in snapshots:
+        if snapshot.contains(path):
+            snapshot.invalidate(path)
+
+
+def clear():
+    """Drops every snapshot, so the next listings scan the file system again."""
+    with _snapshots_lock:
+        snapshots = list(_snapshots.values())
+        _snapshots.clear()
+    for snapshot in snapshots:
+        snapshot.close()
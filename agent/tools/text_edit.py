@@ -0,0 +1,86 @@
+"""
+Streaming, atomic string replacement for files of any size.
+
+A file is read in chunks of `CHUNK_CHARS` characters and rewritten in the same
+pass into a temporary file next to it. Every old string is searched for at once
+(the earliest match wins, and the longest old string among matches starting at
+the same position), and replacement text is never searched again, so several
+(old, new) pairs behave like one simultaneous `str.replace`. The tail of each
+chunk that could still be the start of a match is carried over to the next
+chunk, which keeps memory use at about one chunk regardless of the file size.
+
+The temporary file only replaces the original, with an atomic rename, once
+every count is known to be as expected; on a count mismatch or any error the
+original file is left untouched.
+"""
+import os
+import re
+import tempfile
+
+# Number of characters read per chunk.
+CHUNK_CHARS = 1024 * 1024
+
+
+def _replace_stream(src, dst, pattern: re.Pattern, replacements: dict, counts: dict, overlap: int):
+    buffer = ""
+    while True:
+        chunk = src.read(CHUNK_CHARS)
+        at_end = not chunk
+        buffer += chunk
+        # Matches starting at or after the limit may still grow into the next chunk.
+        limit = len(buffer) if at_end else max(len(buffer) - overlap, 0)
+        pos = 0
+        for match in pattern.finditer(buffer):
+            if match.start() >= limit:
+                break
+            old = match.group()
+            dst.write(buffer[pos:match.start()])
+            dst.write(replacements[old])
+            counts[old] += 1
+            pos = match.end()
+        if at_end:
+            dst.write(buffer[pos:])
+            return
+        keep_from = max(pos, limit)
+        dst.write(buffer[pos:keep_from])
+        buffer = buffer[keep_from:]
+
+
+def stream_replace(file_path: str, pairs: list[tuple[str, str]], expected: list[int] = None) -> tuple[list[int], bool]:
+    """
+    Replaces every (old, new) pair in a file in one streaming pass.
+
+    Returns (counts, committed): the number of occurrences of each old string,
+    and whether the file was rewritten. With `expected`, the file is only
+    rewritten when the counts match it exactly. Old strings must be non-empty
+    and distinct.
+    """
+    replacements = dict(pairs)
+    # Longest first, so that at one position the longest old string wins.
+    olds = sorted(replacements, key=len, reverse=True)
+    pattern = re.compile("|".join(re.escape(old) for old in olds))
+    counts = dict.fromkeys(replacements, 0)
+
+    target = os.path.realpath(file_path)
+    directory = os.path.dirname(target)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(target)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as dst, open(target, "r") as src:
+            _replace_stream(src, dst, pattern, replacements, counts, len(olds[0]) - 1)
+            result = [counts[old] for old, _ in pairs]
+            committed = (expected is None or result == list(expected)) and any(result)
+            if committed:
+                dst.flush()
+                os.fsync(dst.fileno())
+        if not committed:
+            os.unlink(temp_path)
+            return result, False
+        os.chmod(temp_path, os.stat(target).st_mode & 0o7777)
+        os.replace(temp_path, target)
+        return result, True
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
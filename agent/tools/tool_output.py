@@ -0,0 +1,31 @@
+from langchain_core.tools import tool
+
+from agent.tools import output_store
+
+# Lines returned by read_tool_output when no limit is given.
+DEFAULT_PAGE_LINES = 200
+
+@tool
+def read_tool_output(handle: str, offset: int = 0, limit: int = DEFAULT_PAGE_LINES) -> str:
+    """Reads part of a tool output that was too large for the conversation and was stored under a handle (shown as `out-...` in its preview). `offset` is the 0-based line to start from and `limit` the number of lines to return; long pages and very long lines are shortened, with a notice telling how to continue."""
+    if offset < 0:
+        return f"Error: Invalid parameters provided. Reason: Offset must be a non-negative number, but was {offset}."
+    if limit <= 0:
+        return f"Error: Invalid parameters provided. Reason: Limit must be a positive number, but was {limit}."
+    try:
+        lines, total_lines, cut_lines = output_store.read_page(handle.strip(), offset, limit)
+    except FileNotFoundError:
+        return f"Error: No stored tool output with handle {handle}. It may have been removed to free disk space; run the tool again."
+    except Exception as e:
+        return f"An unexpected error occurred while reading {handle}: {e}"
+    if offset >= total_lines:
+        return f"Error: Invalid parameters provided. Reason: Offset {offset} is beyond the end of the output ({total_lines} lines): {handle}"
+
+    end = offset + len(lines)
+    notice = f"[Showing lines {offset + 1}-{end} of {total_lines} of {handle}."
+    if cut_lines:
+        notice += f" {cut_lines} line(s) longer than {output_store.PAGE_MAX_LINE_BYTES} bytes were shortened."
+    if end < total_lines:
+        notice += f" Continue with offset={end}."
+    notice += "]"
+    return f"{notice}\n{b''.join(lines).decode('utf-8', errors='replace')}"
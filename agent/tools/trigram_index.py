@@ -0,0 +1,514 @@
+"""
+A persistent trigram index that narrows the files `search_file_content` scans.
+
+Every indexed file is reduced to the set of (ASCII-lowercased) byte trigrams it
+contains, and the postings are kept in a SQLite database under the user cache
+directory, one database per indexed root. A search derives the trigrams any
+match must contain from the regex itself, intersects their postings, and only
+the surviving candidates are verified with the real pattern. Git-ignored files
+are never indexed, and files that are not valid UTF-8 are always candidates,
+since the scanner drops their undecodable bytes and may match across the gap.
+
+The index is refreshed incrementally by comparing the mtime and size of the
+searched subtree against what was indexed. The walk is skipped altogether when
+the workspace snapshot's inotify watches report no change since the last
+refresh of the subtree. The index is rebuilt from scratch when it
+is missing, corrupt or written by an older schema. SQLite's WAL mode and
+`BEGIN IMMEDIATE` writes make it safe to share between the CLI and the
+Telegram bot running at the same time.
+"""
+import os
+import re
+import array
+import collections
+import sqlite3
+import hashlib
+import itertools
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from agent.tools import gitignore, search, snapshot, walker
+
+SCHEMA_VERSION = 3
+
+INDEX_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gemini_agent",
+    "trigram_index",
+)
+
+# Files larger than this are never indexed; they are always treated as candidates.
+MAX_INDEXED_FILE_BYTES = 1024 * 1024
+
+# Number of files per index segment (positions within a segment are stored as uint16).
+INDEX_BATCH_SIZE = 1024
+
+# Small or mostly-stale segments are re-indexed once this many have accumulated.
+MAX_WASTEFUL_SEGMENTS = 8
+
+# Upper bound on the alternatives kept when expanding regex alternations.
+MAX_ALTERNATIVES = 16
+
+# File status values stored in the `files` table.
+STATUS_INDEXED = 0
+STATUS_BINARY = 1
+STATUS_UNINDEXED = 2
+
+# Characters that IGNORECASE folds onto non-ASCII code points (e.g. "k" and the Kelvin sign),
+# which an ASCII-lowercased index cannot represent.
+_UNSAFE_CASE_FOLDS = set("iks")
+
+# Per index database: the snapshot generation each subtree was last refreshed at.
+_refreshed = {}
+_refreshed_lock = threading.Lock()
+
+
+def index_path_for(root: str) -> str:
+    """Returns the location of the index database for a root directory."""
+    digest = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(INDEX_DIR, f"{digest}.sqlite")
+
+
+def _trigram_tuples(data: bytes) -> set[tuple[int, int, int]]:
+    data = data.lower()
+    return set(zip(data, data[1:], data[2:]))
+
+
+def _pack(gram: tuple[int, int, int]) -> int:
+    return (gram[0] << 16) | (gram[1] << 8) | gram[2]
+
+
+def extract_trigrams(data: bytes) -> set[int]:
+    """Returns the set of trigrams in the data, each packed into a 24-bit integer."""
+    return {_pack(gram) for gram in _trigram_tuples(data)}
+
+
+def _literal_trigrams(literal: str) -> set[int]:
+    return extract_trigrams(literal.encode("utf-8")) if len(literal) >= 3 else set()
+
+
+def _and(left, right):
+    """Combines two alternative lists (each alternative is a list of required literals)."""
+    if right is None:
+        return left
+    if left is None:
+        return right
+    combined = [a + b for a, b in itertools.product(left, right)]
+    # Dropping a constraint only widens the candidate set, so it is always safe.
+    return combined if len(combined) <= MAX_ALTERNATIVES else left
+
+
+def _required_literals(items, ignorecase: bool):
+    """
+    Returns the literals a match of the parsed regex must contain, as a list of
+    alternatives, each a list of strings that must all occur. None means the
+    regex places no usable constraint on the text.
+    """
+    required = None
+    run = []
+
+    def flush():
+        nonlocal required, run
+        if run:
+            required = _and(required, [["".join(run)]])
+            run = []
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            char = chr(av)
+            if ignorecase:
+                if not char.isascii() or char.lower() in _UNSAFE_CASE_FOLDS:
+                    flush()
+                    continue
+                char = char.lower()
+            if char in "\r\n":
+                # The scanner normalises line endings, so raw bytes around them may differ.
+                flush()
+                continue
+            run.append(char)
+        elif op is sre_parse.AT:
+            continue
+        elif op is sre_parse.SUBPATTERN:
+            flush()
+            _, add_flags, del_flags, sub = av
+            sub_ignorecase = (ignorecase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            required = _and(required, _required_literals(sub, sub_ignorecase))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None)):
+            flush()
+            low, _, sub = av
+            if low >= 1:
+                required = _and(required, _required_literals(sub, ignorecase))
+        elif op is sre_parse.BRANCH:
+            flush()
+            alternatives = []
+            for branch in av[1]:
+                branch_required = _required_literals(branch, ignorecase)
+                if branch_required is None:
+                    alternatives = None
+                    break
+                alternatives.extend(branch_required)
+            if alternatives and len(alternatives) <= MAX_ALTERNATIVES:
+                required = _and(required, alternatives)
+        else:
+            flush()
+    flush()
+    return required
+
+
+def trigrams_for_pattern(pattern: str):
+    """
+    Derives a trigram query from a regular expression.
+
+    Returns a list of alternatives, each a set of trigrams that a matching file
+    must all contain, or None when the pattern cannot be narrowed by the index.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (re.error, RecursionError):
+        return None
+    ignorecase = bool(parsed.state.flags & re.IGNORECASE)
+    required = _required_literals(list(parsed), ignorecase)
+    if required is None:
+        return None
+    query = []
+    for alternative in required:
+        grams = set()
+        for literal in alternative:
+            grams |= _literal_trigrams(literal)
+        if not grams:
+            # One alternative is unconstrained, so any file could match.
+            return None
+        query.append(grams)
+    return query
+
+
+def _index_file(file_path: str):
+    """Reads a file and returns its (status, trigrams) for the index."""
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read(MAX_INDEXED_FILE_BYTES + 1)
+    except (IOError, OSError):
+        return STATUS_UNINDEXED, set()
+    if search.is_binary(data[:search.BINARY_SNIFF_BYTES]):
+        return STATUS_BINARY, set()
+    if len(data) > MAX_INDEXED_FILE_BYTES:
+        return STATUS_UNINDEXED, set()
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        # The scanner ignores the invalid bytes, so its text has trigrams the raw bytes lack.
+        return STATUS_UNINDEXED, set()
+    return STATUS_INDEXED, _trigram_tuples(data)
+
+
+def _index_batch(file_paths: list[str]):
+    """
+    Worker entry point: builds one segment for a batch of files.
+
+    Returns the status of every file and, for each trigram, the packed
+    positions (within the batch) of the files that contain it.
+    """
+    statuses = []
+    postings = collections.defaultdict(list)
+    for position, file_path in enumerate(file_paths):
+        status, trigrams = _index_file(file_path)
+        statuses.append(status)
+        for gram in trigrams:
+            postings[gram].append(position)
+    return statuses, {_pack(gram): array.array("H", positions).tobytes() for gram, positions in postings.items()}
+
+
+def walk_files(path: str, excludes=search.DEFAULT_EXCLUDES, ignore=None):
+    """Yields (file_path, mtime_ns, size) for every regular file under a path."""
+    for file_path, _, entry in walker.walk_files(path, excludes=excludes, ignore=ignore, scandir=snapshot.scandir):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        yield file_path, st.st_mtime_ns, st.st_size
+
+
+class TrigramIndex:
+    """
+    The on-disk trigram index of a single root directory.
+
+    Files are indexed in batches, and each batch becomes an immutable segment
+    whose postings store file positions relative to the segment's first file
+    id. A changed or deleted file simply loses its `files` row; its stale
+    postings are filtered out at query time and reclaimed when the segment is
+    compacted by re-indexing its surviving files.
+    """
+
+    def __init__(self, root: str, db_path: str = None, excludes=search.DEFAULT_EXCLUDES):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path or index_path_for(self.root)
+        self.excludes = excludes
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        try:
+            return self._open()
+        except sqlite3.DatabaseError:
+            # A corrupt index is only a cache; start over.
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.db_path + suffix)
+                except FileNotFoundError:
+                    pass
+            return self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._create_schema(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                for table in ("files", "segments", "postings"):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(
+                    "CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime_ns INTEGER NOT NULL, "
+                    "size INTEGER NOT NULL, status INTEGER NOT NULL, segment_id INTEGER NOT NULL)"
+                )
+                conn.execute("CREATE INDEX files_segment ON files (segment_id)")
+                conn.execute(
+                    "CREATE TABLE segments (id INTEGER PRIMARY KEY AUTOINCREMENT, base_id INTEGER NOT NULL, "
+                    "file_count INTEGER NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE postings (trigram INTEGER NOT NULL, segment_id INTEGER NOT NULL, positions BLOB NOT NULL, "
+                    "PRIMARY KEY (trigram, segment_id)) WITHOUT ROWID"
+                )
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _prefix_bounds(subtree: str):
+        prefix = subtree.rstrip(os.sep) + os.sep
+        # Every path under the prefix sorts between the prefix and the prefix with its separator bumped.
+        return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def refresh(self, subtree: str = None):
+        """Brings the index of a subtree up to date with the files on disk."""
+        subtree = os.path.abspath(subtree or self.root)
+        workspace = snapshot.get_snapshot()
+        # Read before the walk, so a change made during it is caught by the next refresh.
+        generation = workspace.generation() if workspace.contains(subtree) else None
+        if generation is not None and self._is_fresh(subtree, generation):
+            return
+        self._sync(subtree)
+        if generation is not None:
+            with _refreshed_lock:
+                fresh = {s: g for s, g in _refreshed.get(self.db_path, {}).items() if g == generation}
+                fresh[subtree] = generation
+                _refreshed[self.db_path] = fresh
+
+    def _is_fresh(self, subtree: str, generation: int) -> bool:
+        """Whether the subtree, or a directory above it, was refreshed at this generation."""
+        if not os.path.exists(self.db_path):
+            return False
+        with _refreshed_lock:
+            fresh = _refreshed.get(self.db_path, {})
+        return any(
+            g == generation and (subtree == s or subtree.startswith(s.rstrip(os.sep) + os.sep))
+            for s, g in fresh.items()
+        )
+
+    def _sync(self, subtree: str):
+        ignore = gitignore.get_matcher(self.root).checker()
+        on_disk = {
+            file_path: (mtime_ns, size) for file_path, mtime_ns, size in walk_files(subtree, self.excludes, ignore)
+        }
+        low, high = self._prefix_bounds(subtree)
+
+        conn = self._connect()
+        try:
+            indexed = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute("SELECT path, mtime_ns, size FROM files WHERE path >= ? AND path < ?", (low, high))
+            }
+            removed = list(indexed.keys() - on_disk.keys())
+            changed = [p for p, stat in on_disk.items() if indexed.get(p) != stat]
+            if not removed and not changed:
+                return
+
+            # Compaction piggybacks on a refresh that has to write anyway.
+            compacted = self._compaction_candidates(conn)
+            stats = dict(compacted)
+            stats.update(on_disk)
+            skip = set(removed).union(changed)
+            to_index = changed + [p for p, _ in compacted if p not in skip]
+            segments = self._build_segments(to_index)
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Rows are looked up again by path, since another process may have
+                # re-indexed them since they were read above.
+                conn.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in removed + to_index))
+                for batch, (statuses, postings) in segments:
+                    self._insert_segment(conn, batch, statuses, postings, stats)
+                self._drop_empty_segments(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _compaction_candidates(conn: sqlite3.Connection) -> list:
+        """
+        Returns the live files of segments worth rebuilding: small segments left
+        by incremental refreshes and segments where most files have changed.
+        Nothing is returned until enough such segments have accumulated.
+        """
+        rows = conn.execute(
+            "SELECT s.id, s.file_count, COUNT(f.id) FROM segments s LEFT JOIN files f ON f.segment_id = s.id GROUP BY s.id"
+        ).fetchall()
+        wasteful = [
+            segment_id for segment_id, file_count, live in rows
+            if file_count < INDEX_BATCH_SIZE // 4 or live * 2 < file_count
+        ]
+        if len(wasteful) < MAX_WASTEFUL_SEGMENTS:
+            return []
+        placeholders = ",".join("?" * len(wasteful))
+        return [
+            (path, (mtime_ns, size))
+            for path, mtime_ns, size in conn.execute(
+                f"SELECT path, mtime_ns, size FROM files WHERE segment_id IN ({placeholders})", wasteful
+            )
+        ]
+
+    @staticmethod
+    def _build_segments(file_paths: list[str]) -> list:
+        batches = [file_paths[i:i + INDEX_BATCH_SIZE] for i in range(0, len(file_paths), INDEX_BATCH_SIZE)]
+        if len(file_paths) < search.PARALLEL_THRESHOLD:
+            return [(batch, _index_batch(batch)) for batch in batches]
+        try:
+            return list(zip(batches, search.get_executor().map(_index_batch, batches)))
+        except BrokenProcessPool:
+            search.reset_executor()
+            return [(batch, _index_batch(batch)) for batch in batches]
+
+    @staticmethod
+    def _insert_segment(conn: sqlite3.Connection, batch, statuses, postings, stats):
+        base_id = (conn.execute("SELECT MAX(id) FROM files").fetchone()[0] or 0) + 1
+        base_id = max(base_id, (conn.execute("SELECT MAX(base_id + file_count) FROM segments").fetchone()[0] or 0))
+        segment_id = conn.execute(
+            "INSERT INTO segments (base_id, file_count) VALUES (?, ?)", (base_id, len(batch))
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO files (id, path, mtime_ns, size, status, segment_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (base_id + position, file_path, *stats[file_path], status, segment_id)
+                for position, (file_path, status) in enumerate(zip(batch, statuses))
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO postings (trigram, segment_id, positions) VALUES (?, ?, ?)",
+            ((gram, segment_id, positions) for gram, positions in sorted(postings.items())),
+        )
+
+    @staticmethod
+    def _drop_empty_segments(conn: sqlite3.Connection):
+        empty = [
+            row[0] for row in conn.execute(
+                "SELECT id FROM segments s WHERE NOT EXISTS (SELECT 1 FROM files f WHERE f.segment_id = s.id)"
+            )
+        ]
+        for segment_id in empty:
+            conn.execute("DELETE FROM postings WHERE segment_id = ?", (segment_id,))
+            conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+
+    def candidates(self, query, subtree: str = None) -> list[str]:
+        """
+        Returns the files under a subtree that may match a trigram query, sorted by path.
+
+        Files that could not be indexed (too large or unreadable) are always
+        included; binary files never are.
+        """
+        subtree = os.path.abspath(subtree or self.root)
+        low, high = self._prefix_bounds(subtree)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, path, status FROM files WHERE path >= ? AND path < ? AND status != ?",
+                (low, high, STATUS_BINARY),
+            ).fetchall()
+            paths = {file_id: file_path for file_id, file_path, _ in rows}
+            matched = {file_id for file_id, _, status in rows if status == STATUS_UNINDEXED}
+            bases = dict(conn.execute("SELECT id, base_id FROM segments"))
+            for grams in query:
+                matched |= self._match_all(conn, grams, bases)
+            return sorted(paths[file_id] for file_id in matched if file_id in paths)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _match_all(conn: sqlite3.Connection, grams, bases) -> set[int]:
+        """Returns the ids of the files that contain every one of the trigrams."""
+        per_segment = None
+        for gram in grams:
+            found = {
+                segment_id: positions
+                for segment_id, positions in conn.execute(
+                    "SELECT segment_id, positions FROM postings WHERE trigram = ?", (gram,)
+                )
+                if per_segment is None or segment_id in per_segment
+            }
+            if per_segment is None:
+                per_segment = {segment_id: set(array.array("H", blob)) for segment_id, blob in found.items()}
+            else:
+                per_segment = {
+                    segment_id: per_segment[segment_id].intersection(array.array("H", blob))
+                    for segment_id, blob in found.items()
+                }
+                per_segment = {segment_id: ids for segment_id, ids in per_segment.items() if ids}
+            if not per_segment:
+                return set()
+        return {
+            bases[segment_id] + position
+            for segment_id, positions in (per_segment or {}).items() if segment_id in bases
+            for position in positions
+        }
+
+
+def candidate_files(pattern: str, path: str, root: str = None, excludes=search.DEFAULT_EXCLUDES):
+    """
+    Returns the files under `path` that may match `pattern`, using the index of
+    `root` (the working directory by default).
+
+    Returns None when the index cannot help: the pattern has no usable literals,
+    the path lies outside the root, or the index is unavailable.
+    """
+    query = trigrams_for_pattern(pattern)
+    if query is None:
+        return None
+    root = os.path.abspath(root or os.getcwd())
+    path = os.path.abspath(path)
+    if path != root and not path.startswith(root.rstrip(os.sep) + os.sep):
+        return None
+    index = TrigramIndex(root, excludes=excludes)
+    try:
+        index.refresh(path)
+        return index.candidates(query, path)
+    except (sqlite3.Error, OSError):
+        return None
@@ -0,0 +1,201 @@
+"""
+A single-pass `os.scandir` walker that matches glob patterns during the walk.
+
+Patterns use the same syntax as `glob.glob(recursive=True)`: `*`, `?` and
+`[...]` match within one path segment, a `**` segment matches any number of
+directories, and wildcards do not match names starting with a dot unless the
+pattern segment itself does. The walk starts below the pattern's literal
+prefix, never descends into directories the pattern cannot match, and reuses
+the `DirEntry` stat results, so every file costs at most one `stat`.
+"""
+import heapq
+import os
+import re
+
+
+def _translate_segment(segment: str) -> str:
+    """Translates one glob path segment into a regex that never crosses a `/`."""
+    out = []
+    i = 0
+    n = len(segment)
+    while i < n:
+        c = segment[i]
+        i += 1
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and segment[j] in "!^":
+                j += 1
+            if j < n and segment[j] == "]":
+                j += 1
+            while j < n and segment[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+                continue
+            body = segment[i:j].replace("\\", "\\\\")
+            i = j + 1
+            if body[0] in "!^":
+                body = "^/" + body[1:]
+            out.append(f"[{body}]")
+        else:
+            out.append(re.escape(c))
+    regex = "".join(out)
+    if segment[:1] in ("*", "?", "["):
+        # Like glob, wildcards do not match hidden names.
+        regex = r"(?!\.)" + regex
+    return regex
+
+
+def has_magic(segment: str) -> bool:
+    return any(c in segment for c in "*?[")
+
+
+class GlobMatcher:
+    """A compiled glob pattern, relative to a base directory."""
+
+    def __init__(self, pattern: str, case_sensitive: bool = True):
+        segments = [s for s in pattern.replace(os.sep, "/").split("/") if s not in ("", ".")]
+        # Leading literal segments become part of the directory the walk starts from
+        # (only when matching case-sensitively, since the lookup on disk is exact).
+        literal = []
+        while case_sensitive and len(segments) > 1 and not has_magic(segments[0]):
+            literal.append(segments.pop(0))
+        self.prefix = os.path.join(*literal) if literal else ""
+        self.segments = segments
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self._segment_regexes = [
+            None if s == "**" else re.compile(_translate_segment(s) + r"\Z", flags) for s in segments
+        ]
+        parts = []
+        for i, segment in enumerate(segments):
+            if segment == "**":
+                # `**` swallows zero or more whole directories (or, last, the remaining path).
+                parts.append(r"(?:(?!\.)[^/]+/)*" if i < len(segments) - 1 else r"(?:(?!\.)[^/]+(?:/|\Z))*")
+            else:
+                parts.append(_translate_segment(segment) + ("/" if i < len(segments) - 1 else ""))
+        self._regex = re.compile("".join(parts) + r"\Z", flags)
+
+    def match(self, rel_path: str) -> bool:
+        """Checks a `/`-separated path relative to the walk's start directory."""
+        return self._regex.match(rel_path) is not None
+
+    def may_contain_matches(self, rel_parts: list[str]) -> bool:
+        """Returns False when no path below the given directory can match."""
+        for i, part in enumerate(rel_parts):
+            if i < len(self.segments) and self._segment_regexes[i] is None:
+                # `**` does not enter hidden directories; only a later segment starting with a dot can name one.
+                hidden = [r for s, r in zip(self.segments[i + 1:], self._segment_regexes[i + 1:]) if s.startswith(".")]
+                return all(not p.startswith(".") or any(r.match(p) for r in hidden) for p in rel_parts[i:])
+            if i >= len(self.segments) - 1 or not self._segment_regexes[i].match(part):
+                return False
+        return True
+
+
+def _scandir(directory: str) -> list:
+    with os.scandir(directory) as it:
+        return list(it)
+
+
+def walk_files(root: str, matcher: GlobMatcher = None, excludes=(), ignore=None, scandir=_scandir):
+    """
+    Yields (path, rel_path, DirEntry) for every regular file under a root.
+
+    Directories whose name is in `excludes`, that `ignore(path, is_dir)`
+    rejects, or below which the matcher cannot match are never entered.
+    `scandir(directory)` lists a directory (e.g. from a workspace snapshot).
+    """
+    stack = [(root, [])]
+    while stack:
+        directory, rel_parts = stack.pop()
+        try:
+            entries = scandir(directory)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name in excludes or entry.is_symlink():
+                    continue
+                if ignore is not None and ignore(entry.path, True):
+                    continue
+                child_parts = rel_parts + [entry.name]
+                if matcher is None or matcher.may_contain_matches(child_parts):
+                    subdirs.append((entry.path, child_parts))
+            else:
+                try:
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if ignore is not None and ignore(entry.path, False):
+                    continue
+                rel_path = "/".join(rel_parts + [entry.name])
+                if matcher is None or matcher.match(rel_path):
+                    yield entry.path, rel_path, entry
+        # Reversed so that directories are visited in listing order.
+        stack.extend(reversed(subdirs))
+
+
+def find_newest(root: str, pattern: str, case_sensitive: bool = True, limit: int = None, excludes=(), ignore=None, scandir=_scandir):
+    """
+    Finds the files under `root` matching a glob pattern, newest first.
+
+    With a limit, only the `limit` newest files are kept (in a heap) while
+    walking. Returns (paths, total_matches). Files that vanish during the walk
+    are skipped.
+    """
+    matcher = GlobMatcher(pattern, case_sensitive)
+    start = os.path.join(root, matcher.prefix) if matcher.prefix else root
+    if case_sensitive and len(matcher.segments) == 1 and not has_magic(matcher.segments[0]):
+        # A fully literal pattern is a single lookup, not a walk.
+        candidate = os.path.join(start, matcher.segments[0])
+        return ([candidate], 1) if os.path.isfile(candidate) else ([], 0)
+    if not matcher.segments or not os.path.isdir(start):
+        return [], 0
+
+    heap = []
+    total = 0
+    for path, _, entry in walk_files(start, matcher, excludes, ignore, scandir):
+        try:
+            mtime = entry.stat().st_mtime
+        except OSError:
+            continue
+        total += 1
+        item = (mtime, path)
+        if limit is None:
+            heap.append(item)
+        elif len(heap) < limit:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+    heap.sort(key=lambda item: (-item[0], item[1]))
+    return [path for _, path in heap], total
+
+
+def iter_glob(pattern: str, case_sensitive: bool = True, excludes=(), ignore=None, scandir=_scandir):
+    """
+    Yields the files matching a glob pattern, in walk order.
+
+    Like `glob.glob`, relative patterns yield paths relative to the working
+    directory and absolute patterns yield absolute paths.
+    """
+    anchor = os.sep if os.path.isabs(pattern) else ""
+    matcher = GlobMatcher(pattern[len(anchor):], case_sensitive)
+    base = os.path.join(anchor, matcher.prefix)
+    if not matcher.segments:
+        return
+    if case_sensitive and len(matcher.segments) == 1 and not has_magic(matcher.segments[0]):
+        candidate = os.path.join(base, matcher.segments[0])
+        if os.path.isfile(candidate) and (ignore is None or not ignore(candidate, False)):
+            yield candidate
+        return
+    for _, rel_path, _ in walk_files(base or os.curdir, matcher, excludes, ignore, scandir):
+        yield os.path.join(base, rel_path)
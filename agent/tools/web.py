@@ -1,7 +1,9 @@
+import asyncio
 import os
 import re
 from urllib.parse import urljoin
 from bs4 import BeautifulSoup
+from playwright.async_api import async_playwright
 from playwright.sync_api import sync_playwright
 from langchain_core.tools import tool
 from googleapiclient.discovery import build
@@ -44,33 +46,56 @@ def web_fetch(prompt: str) -> str:
             page.goto(url, timeout=30000)
             html_content = page.content()
             browser.close()
+        return _page_text(html_content, url)
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
+
+async def _aweb_fetch(prompt: str) -> str:
+    """The same fetch with Playwright's async API, so the event loop keeps running while the page loads."""
+    url_match = re.search(r'https?://\S+', prompt)
+    if not url_match:
+        return "Error: No URL found in the prompt."
+    url = url_match.group(0)
 
-        soup = BeautifulSoup(html_content, 'html.parser')
-        main_content = soup.find('article') or soup.find('main') or soup.body
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            page = await browser.new_page()
+            await page.goto(url, timeout=30000)
+            html_content = await page.content()
+            await browser.close()
+        # Parsing a large page is CPU work, so it happens off the event loop too.
+        return await asyncio.to_thread(_page_text, html_content, url)
+    except Exception as e:
+        return f"An unexpected error occurred: {e}"
 
-        for element in main_content(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-            element.decompose()
+web_fetch.coroutine = _aweb_fetch
 
-        content_parts = []
-        for element in main_content.find_all(['h1', 'h2', 'h3', 'p', 'li', 'a', 'table']):
-            if element.name == 'a' and element.get('href'):
-                text = element.get_text(strip=True)
-                href = element.get('href')
-                if not href.startswith('http'):
-                    href = urljoin(url, href)
-                if text:
-                    content_parts.append(f"[{text}]({href})")
-            elif element.name == 'table':
-                table_md = ""
-                for row in element.find_all('tr'):
-                    cells = [cell.get_text(strip=True) for cell in row.find_all(['th', 'td'])]
-                    table_md += "| " + " | ".join(cells) + " |\n"
-                content_parts.append(table_md + '\n')
-            else:
-                content_parts.append(element.get_text(strip=True) + '\n')
-        
-        clean_text = re.sub(r'\n\s*\n', '\n\n', "".join(content_parts)).strip()
-        return clean_text
+def _page_text(html_content: str, url: str) -> str:
+    """Reduces a page to its headings, paragraphs, list items, links and tables."""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    main_content = soup.find('article') or soup.find('main') or soup.body
 
-    except Exception as e:
-        return f"An unexpected error occurred: {e}"
\ No newline at end of file
+    for element in main_content(['script', 'style', 'nav', 'footer', 'header', 'aside']):
+        element.decompose()
+
+    content_parts = []
+    for element in main_content.find_all(['h1', 'h2', 'h3', 'p', 'li', 'a', 'table']):
+        if element.name == 'a' and element.get('href'):
+            text = element.get_text(strip=True)
+            href = element.get('href')
+            if not href.startswith('http'):
+                href = urljoin(url, href)
+            if text:
+                content_parts.append(f"[{text}]({href})")
+        elif element.name == 'table':
+            table_md = ""
+            for row in element.find_all('tr'):
+                cells = [cell.get_text(strip=True) for cell in row.find_all(['th', 'td'])]
+                table_md += "| " + " | ".join(cells) + " |\n"
+            content_parts.append(table_md + '\n')
+        else:
+            content_parts.append(element.get_text(strip=True) + '\n')
+
+    clean_text = re.sub(r'\n\s*\n', '\n\n', "".join(content_parts)).strip()
+    return clean_text
\ No newline at end of file
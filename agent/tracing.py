@@ -0,0 +1,520 @@
+"""
+Timed spans of what happens during a turn, for profiling and export.
+
+Tracing is off until `enable()` installs a `Tracer`; until then `span()` is a
+no-op. With a tracer:
+
+* `TracingCallbackHandler`, passed in the run's `callbacks`, opens a span for
+  every graph node, tool call and model call, with the tool's input and result
+  sizes, and the model's time to first token and prompt, completion and cached
+  token counts (from the response's `usage_metadata`);
+* `TracingCheckpointer` wraps a checkpointer and times its reads and writes;
+* prompt assembly and anything else can be timed with `with span(...)`.
+
+Spans nest through a context variable, so a turn opened with
+`with span("turn", "turn")` becomes the root of everything below it. They can
+be written as JSON lines (`export_jsonl`) or as OTLP/JSON (`export_otlp`),
+which OpenTelemetry collectors and viewers import. `format_breakdown` and
+`format_hotspots` render the per-turn summary and the `ThreadProfiler` output
+of the CLI's `--profile` and `--profile-cprofile`.
+"""
+import contextlib
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+# Span kinds, also used to group the breakdown.
+TURN = "turn"
+GRAPH = "graph"
+NODE = "node"
+TOOL = "tool"
+MODEL = "model"
+PROMPT = "prompt"
+CHECKPOINT = "checkpoint"
+
+SERVICE_NAME = "gemini-agent"
+
+_current = contextvars.ContextVar("current_span", default=None)
+_tracer = None
+
+
+class Span:
+    """One timed operation and its attributes."""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Collects finished spans."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, kind: str, parent: Span = None, **attributes) -> Span:
+        parent = parent if parent is not None else _current.get()
+        if parent is not None:
+            return Span(name, kind, parent.trace_id, parent.span_id, attributes)
+        return Span(name, kind, secrets.token_hex(16), None, attributes)
+
+    def end_span(self, span: Span, error: BaseException = None):
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str, parent: Span = None, **attributes):
+        span = self.start_span(name, kind, parent, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            _current.reset(token)
+            self.end_span(span, e)
+            raise
+        _current.reset(token)
+        self.end_span(span)
+
+    def children(self, root: Span) -> list[Span]:
+        """The finished spans below `root`, in start order."""
+        with self._lock:
+            spans = [s for s in self.spans if s.trace_id == root.trace_id and s is not root]
+        ids = {root.span_id}
+        below = []
+        for span in sorted(spans, key=lambda s: s.start_ns):
+            if span.parent_id in ids:
+                ids.add(span.span_id)
+                below.append(span)
+        return below
+
+    def export_jsonl(self, path: str):
+        """Appends every finished span to `path`, one JSON object per line."""
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def to_otlp(self) -> dict:
+        """The spans as an OTLP/JSON `ExportTraceServiceRequest`."""
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [_otlp_span(span) for span in spans],
+                }],
+            }],
+        }
+
+    def export_otlp(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_otlp(), f, default=str)
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+# OTLP span kinds: model and tool calls are client calls, the rest internal.
+_OTLP_KINDS = {MODEL: 3, TOOL: 3}
+
+
+def _otlp_span(span: Span) -> dict:
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": _OTLP_KINDS.get(span.kind, 1),
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attribute("agent.span_kind", span.kind)]
+        + [_otlp_attribute(key, value) for key, value in span.attributes.items() if value is not None],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+def enable(tracer: Tracer = None) -> Tracer:
+    """Installs a tracer (a new one by default) and returns it."""
+    global _tracer
+    _tracer = tracer or Tracer()
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def get_tracer():
+    """The installed tracer, or None while tracing is off."""
+    return _tracer
+
+
+def span(name: str, kind: str, parent: Span = None, **attributes):
+    """
+    A context manager timing its block as a span of the installed tracer (below
+    `parent`, or the current span); a no-op without a tracer.
+    """
+    if _tracer is None:
+        return contextlib.nullcontext(_NOOP_SPAN)
+    return _tracer.span(name, kind, parent, **attributes)
+
+
+def _content_chars(content) -> int:
+    if isinstance(content, str):
+        return len(content)
+    return sum(len(part) if isinstance(part, str) else len(str(part.get("text", ""))) for part in content or ())
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Turns LangChain callbacks for graph nodes, tools and model calls into spans."""
+
+    # Called where the run happens (not on an executor), so timings and span nesting stay accurate.
+    run_inline = True
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._spans = {}
+        self._parents = {}
+        self._roots = set()
+        self._lock = threading.Lock()
+
+    def _parent(self, parent_run_id):
+        with self._lock:
+            while parent_run_id is not None:
+                if parent_run_id in self._spans:
+                    return self._spans[parent_run_id]
+                parent_run_id = self._parents.get(parent_run_id)
+        return None
+
+    def _start(self, run_id, parent_run_id, name, kind, **attributes):
+        span = self.tracer.start_span(name, kind, parent=self._parent(parent_run_id), **attributes)
+        with self._lock:
+            self._spans[run_id] = span
+        return span
+
+    def _end(self, run_id, error=None, **attributes):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+            self._parents.pop(run_id, None)
+            self._roots.discard(run_id)
+        if span is not None:
+            span.set(**attributes)
+            self.tracer.end_span(span, error)
+        return span
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, name=None, **kwargs):
+        if parent_run_id is None:
+            with self._lock:
+                self._roots.add(run_id)
+            self._start(run_id, None, name or "graph", GRAPH)
+        elif parent_run_id in self._roots and metadata and "langgraph_node" in metadata:
+            self._start(run_id, parent_run_id, metadata["langgraph_node"], NODE, step=metadata.get("langgraph_step"))
+        else:
+            with self._lock:
+                self._parents[run_id] = parent_run_id
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, name=None, **kwargs):
+        name = name or (serialized or {}).get("name") or "tool"
+        self._start(run_id, parent_run_id, name, TOOL, input_chars=len(input_str or ""))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        content = getattr(output, "content", output)
+        self._end(run_id, result_chars=_content_chars(content) if isinstance(content, (str, list)) else len(str(content)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, invocation_params=None, **kwargs):
+        model = (invocation_params or {}).get("model") or (metadata or {}).get("ls_model_name")
+        prompt = messages[0] if messages else []
+        self._start(run_id, parent_run_id, "chat_model", MODEL, model=model, messages=len(prompt),
+                    prompt_chars=sum(_content_chars(m.content) for m in prompt))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            span = self._spans.get(run_id)
+        if span is not None and "time_to_first_token_ms" not in span.attributes:
+            span.set(time_to_first_token_ms=round(span.duration_ms, 3))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        attributes = {}
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            attributes.update(
+                prompt_tokens=usage.get("input_tokens"),
+                completion_tokens=usage.get("output_tokens"),
+                cached_tokens=(usage.get("input_token_details") or {}).get("cache_read"),
+            )
+        if message is not None:
+            attributes.update(completion_chars=_content_chars(message.content), tool_calls=len(getattr(message, "tool_calls", None) or ()))
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+class TracingCheckpointer(BaseCheckpointSaver):
+    """Times the reads and writes of another checkpointer."""
+
+    def __init__(self, saver: BaseCheckpointSaver):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        # The latest span seen per conversation: LangGraph saves task writes from a
+        # background thread that does not share the turn's context. Entries are
+        # dropped once their span has ended.
+        self._turn_spans = {}
+        self._lock = threading.Lock()
+
+    def _span(self, name: str, config, **attributes):
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        current = _current.get()
+        with self._lock:
+            if current is not None:
+                if self._turn_spans.get(thread_id) is not current:
+                    self._turn_spans = {t: s for t, s in self._turn_spans.items() if s.end_ns is None}
+                    self._turn_spans[thread_id] = current
+                parent = current
+            else:
+                parent = self._turn_spans.get(thread_id)
+                if parent is not None and parent.end_ns is not None:
+                    del self._turn_spans[thread_id]
+        return span(name, CHECKPOINT, parent, **attributes)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def get_tuple(self, config):
+        with self._span("checkpoint.get", config) as s:
+            result = self.saver.get_tuple(config)
+            s.set(found=result is not None)
+            return result
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self._span("checkpoint.list", config) as s:
+            items = [*self.saver.list(config, filter=filter, before=before, limit=limit)]
+            s.set(count=len(items))
+        yield from items
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._span("checkpoint.put", config, channels=len(new_versions)):
+            return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._span("checkpoint.put_writes", config, writes=len(writes)):
+            return self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._span("checkpoint.delete_thread", {"configurable": {"thread_id": thread_id}}):
+            return self.saver.delete_thread(thread_id)
+
+    async def aget_tuple(self, config):
+        with self._span("checkpoint.get", config) as s:
+            result = await self.saver.aget_tuple(config)
+            s.set(found=result is not None)
+            return result
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        with self._span("checkpoint.list", config) as s:
+            items = [item async for item in self.saver.alist(config, filter=filter, before=before, limit=limit)]
+            s.set(count=len(items))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with self._span("checkpoint.put", config, channels=len(new_versions)):
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with self._span("checkpoint.put_writes", config, writes=len(writes)):
+            return await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        with self._span("checkpoint.delete_thread", {"configurable": {"thread_id": thread_id}}):
+            return await self.saver.adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+
+def _seconds(ms: float) -> str:
+    return f"{ms / 1000:.2f}s" if ms >= 1000 else f"{ms:.0f}ms"
+
+
+def format_breakdown(turn: Span, spans: list[Span]) -> str:
+    """A summary of where the time of one turn went: model calls, tools, nodes and checkpoints."""
+    by_kind = {}
+    for s in spans:
+        by_kind.setdefault(s.kind, []).append(s)
+    lines = [f"[Profile] {turn.name} {_seconds(turn.duration_ms)}"]
+
+    models = by_kind.get(MODEL, [])
+    if models:
+        total = lambda key: sum(m.attributes.get(key) or 0 for m in models)
+        ttft = [m.attributes["time_to_first_token_ms"] for m in models if "time_to_first_token_ms" in m.attributes]
+        line = f"  model       {len(models)} call(s)  {_seconds(sum(m.duration_ms for m in models))}"
+        if ttft:
+            line += f", first token after {_seconds(sum(ttft) / len(ttft))} on average"
+        line += f"; tokens: {total('prompt_tokens')} prompt ({total('cached_tokens')} cached), {total('completion_tokens')} completion"
+        lines.append(line)
+
+    tools = by_kind.get(TOOL, [])
+    if tools:
+        per_tool = {}
+        for t in tools:
+            count, ms, chars = per_tool.get(t.name, (0, 0.0, 0))
+            per_tool[t.name] = (count + 1, ms + t.duration_ms, chars + (t.attributes.get("result_chars") or 0))
+        details = ", ".join(f"{name} x{count} {_seconds(ms)} ({chars} chars)" for name, (count, ms, chars) in per_tool.items())
+        lines.append(f"  tools       {len(tools)} call(s)  {_seconds(sum(t.duration_ms for t in tools))}: {details}")
+
+    nodes = by_kind.get(NODE, [])
+    if nodes:
+        per_node = {}
+        for n in nodes:
+            per_node[n.name] = per_node.get(n.name, 0.0) + n.duration_ms
+        lines.append("  nodes       " + ", ".join(f"{name} {_seconds(ms)}" for name, ms in per_node.items()))
+
+    for kind, label in ((CHECKPOINT, "checkpoint"), (PROMPT, "prompt")):
+        group = by_kind.get(kind, [])
+        if group:
+            lines.append(f"  {label:<11} {len(group)} op(s)  {_seconds(sum(s.duration_ms for s in group))}")
+
+    graphs = by_kind.get(GRAPH, [])
+    if graphs:
+        accounted = sum(n.duration_ms for n in nodes) + sum(s.duration_ms for s in by_kind.get(CHECKPOINT, []))
+        lines.append(f"  other       {_seconds(max(0.0, sum(g.duration_ms for g in graphs) - accounted))} (graph scheduling, state updates, streaming)")
+    return "\n".join(lines)
+
+
+class ThreadProfiler:
+    """
+    cProfile of the calling thread and of every thread started while enabled,
+    since graph nodes and tools run on executor threads.
+    """
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._main = None
+
+    def _new_profile(self) -> cProfile.Profile:
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def _start_thread(self, frame, event, arg):
+        # `threading.setprofile` calls this once at the start of each new thread: hand it over to its own profiler.
+        sys.setprofile(None)
+        self._new_profile().enable()
+
+    def enable(self):
+        if self._main is None:
+            self._main = self._new_profile()
+        threading.setprofile(self._start_thread)
+        self._main.enable()
+
+    def disable(self):
+        threading.setprofile(None)
+        if self._main is not None:
+            self._main.disable()
+
+    def stats(self):
+        """The combined stats of all profiled threads, or None before anything was profiled."""
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+
+def format_hotspots(stats: pstats.Stats, root: str, limit: int = 15) -> str:
+    """The functions defined under `root` that took the most cumulative time."""
+    root = os.path.abspath(root) + os.sep
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        if os.path.isabs(filename) and filename.startswith(root):
+            rows.append((cumulative, own, calls, f"{os.path.relpath(filename, root)}:{line}({function})"))
+    rows.sort(reverse=True)
+    lines = [f"{'cumulative':>10} {'own':>8} {'calls':>7}  function"]
+    lines += [f"{cumulative:>9.3f}s {own:>7.3f}s {calls:>7}  {where}" for cumulative, own, calls, where in rows[:limit]]
+    return "\n".join(lines)
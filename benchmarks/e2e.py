@@ -0,0 +1,436 @@
+"""
+End-to-end latency benchmark of the agent against the local chat-completions stub.
+
+Every scenario is a scripted conversation: its turns give the user's message
+and the responses the stub answers it with, tool calls first and the final
+answer last. `run_benchmark` points `core.models.get_model` at a
+`StubServer`, builds the graph with `create_graph` and a `MemorySaver`, and
+plays each scenario `repeat` times in a fresh copy of a small workspace, so
+the real tools run against real files. For every turn it reports:
+
+* `wall_ms`: the whole `graph.invoke` (or `ainvoke`);
+* `model_ms`: the model calls, as seen by the client (request building, HTTP to
+  the stub, parsing the stream), which with the stub's default zero latency is
+  all client-side cost;
+* `stub_ms`: the part of `model_ms` the stub spent answering;
+* `tools_ms`: the `tools` node, i.e. the tool calls including their scheduling;
+* `serde_ms`: serializing and loading checkpoints;
+* `overhead_ms`: the rest, i.e. the graph itself, the context node, state
+  updates and callbacks;
+* `rss_kb` (and `heap_kb` with `--tracemalloc`): memory growth over the turn.
+
+Run it with `python -m benchmarks.e2e [--repeat N] [--async] [--json results.json]`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from benchmarks.stub_server import StubServer
+
+# A small project the scenarios work on; "{root}" is its absolute path.
+WORKSPACE_FILES = {
+    "README.md": "# Sample project\n\nA small application used by the agent benchmark.\n",
+    "src/app.py": (
+        "from util import slugify\n\n\n"
+        "def greet(name):\n"
+        "    # TODO: localize the greeting\n"
+        "    return f\"Hello, {name}!\"\n\n\n"
+        "def main():\n"
+        "    print(greet(slugify(\"World\")))\n"
+    ),
+    "src/util.py": (
+        "def slugify(text):\n"
+        "    # TODO: handle unicode\n"
+        "    return text.strip().lower().replace(\" \", \"-\")\n"
+    ),
+    "notes/todo.txt": "TODO: write a changelog\nTODO: add tests\n",
+    "data/numbers.txt": "".join(f"{i}\n" for i in range(1, 5001)),
+}
+
+
+def _call(name: str, **args) -> dict:
+    return {"name": name, "args": args}
+
+
+SCENARIOS = [
+    {
+        "name": "explore",
+        "turns": [
+            {
+                "user": "What is in this project?",
+                "responses": [
+                    {"tool_calls": [_call("list_directory", path="{root}", tree=True), _call("glob", pattern="**/*.py", path="{root}")]},
+                    {"content": "A small Python application: src/app.py, src/util.py, notes and data."},
+                ],
+            },
+            {
+                "user": "Where are the TODOs?",
+                "responses": [
+                    {"tool_calls": [_call("search_file_content", pattern="TODO", path="{root}"), _call("read_many_files", paths=["{root}/src"])]},
+                    {"tool_calls": [_call("read_file", absolute_path="{root}/src/app.py", offset=0, limit=50)]},
+                    {"content": "There are TODOs in src/app.py, src/util.py and notes/todo.txt."},
+                ],
+            },
+        ],
+    },
+    {
+        "name": "edit",
+        "turns": [
+            {
+                "user": "Rename greet to greeting.",
+                "responses": [
+                    {"tool_calls": [_call("read_file", absolute_path="{root}/src/app.py")]},
+                    {"tool_calls": [_call("replace", file_path="{root}/src/app.py", edits=[
+                        {"old_string": "def greet(", "new_string": "def greeting("},
+                        {"old_string": "print(greet(", "new_string": "print(greeting("},
+                    ])]},
+                    {"tool_calls": [_call("run_shell_command", command="grep -rn greeting src", directory="{root}")]},
+                    {"content": "Renamed greet to greeting in src/app.py."},
+                ],
+            },
+            {
+                "user": "Add a changelog and keep a copy in notes.",
+                "responses": [
+                    {"tool_calls": [_call("write_file", file_path="{root}/CHANGELOG.md", content="# Changelog\n\n- Renamed greet to greeting.\n")]},
+                    {"tool_calls": [_call("copy_file", source_path="{root}/CHANGELOG.md", destination_path="{root}/notes/CHANGELOG.md")]},
+                    {"content": "Added CHANGELOG.md and a copy in notes/."},
+                ],
+            },
+        ],
+    },
+    {
+        "name": "large_output",
+        "turns": [
+            {
+                "user": "Print the numbers up to 50000 and show the data file.",
+                "responses": [
+                    {"tool_calls": [_call("run_shell_command", command="seq 1 50000", directory="{root}"), _call("read_file", absolute_path="{root}/data/numbers.txt")]},
+                    {"content": "The output was stored; the data file holds the numbers 1 to 5000."},
+                ],
+            },
+        ],
+    },
+]
+
+
+@dataclass
+class TurnResult:
+    scenario: str
+    repeat: int
+    turn: int
+    wall_ms: float
+    model_ms: float
+    stub_ms: float
+    tools_ms: float
+    serde_ms: float
+    overhead_ms: float
+    model_requests: int
+    tool_calls: int
+    tool_errors: int
+    rss_kb: int
+    heap_kb: int = 0
+
+
+class TimedSerializer:
+    """A checkpoint serializer that adds up the time spent in the one it wraps."""
+
+    def __init__(self, serde=None):
+        self.serde = serde or JsonPlusSerializer()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            with self._lock:
+                self.seconds += time.perf_counter() - started
+
+    def dumps(self, obj):
+        return self._timed(self.serde.dumps, obj)
+
+    def loads(self, data):
+        return self._timed(self.serde.loads, data)
+
+    def dumps_typed(self, obj):
+        return self._timed(self.serde.dumps_typed, obj)
+
+    def loads_typed(self, data):
+        return self._timed(self.serde.loads_typed, data)
+
+
+class TurnTimer(BaseCallbackHandler):
+    """Adds up the time of model calls and of each graph node during a turn."""
+
+    # Called on the event loop itself under `ainvoke`, so the timings are not delayed by an executor.
+    run_inline = True
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.model_seconds = 0.0
+        self.node_seconds = {}
+        self._root = None
+        self._started = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        if parent_run_id is None:
+            self._root = run_id
+        elif parent_run_id == self._root and metadata and "langgraph_node" in metadata:
+            self._started[run_id] = (metadata["langgraph_node"], time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_node(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_node(run_id)
+
+    def _end_node(self, run_id):
+        node, started = self._started.pop(run_id, (None, None))
+        if node is not None:
+            self.node_seconds[node] = self.node_seconds.get(node, 0.0) + time.perf_counter() - started
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = (None, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end_model(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end_model(run_id)
+
+    def _end_model(self, run_id):
+        _, started = self._started.pop(run_id, (None, None))
+        if started is not None:
+            self.model_seconds += time.perf_counter() - started
+
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        # Without /proc, the peak RSS is the closest available figure (bytes on macOS).
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _fill(value, root: str):
+    if isinstance(value, str):
+        return value.replace("{root}", root)
+    if isinstance(value, list):
+        return [_fill(item, root) for item in value]
+    if isinstance(value, dict):
+        return {key: _fill(item, root) for key, item in value.items()}
+    return value
+
+
+def make_workspace(root: str):
+    for name, content in WORKSPACE_FILES.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+
+def default_tools() -> list:
+    from agent.composition import TOOLS
+    return TOOLS
+
+
+class _Run:
+    """One play-through of a scenario: its graph, workspace and measurements."""
+
+    def __init__(self, scenario: dict, repeat: int, llm, tools, server: StubServer, base_dir: str, context_settings):
+        from agent.graph import create_graph
+
+        self.scenario = scenario
+        self.repeat = repeat
+        self.server = server
+        self.root = tempfile.mkdtemp(prefix=f"{scenario['name']}-", dir=base_dir)
+        make_workspace(self.root)
+        self.turns = _fill(scenario["turns"], self.root)
+        self.serde = TimedSerializer()
+        self.timer = TurnTimer()
+        self.graph = create_graph(llm, tools, checkpointer=MemorySaver(serde=self.serde), context_settings=context_settings)
+        thread_id = f"bench-{scenario['name']}-{repeat}-{os.path.basename(self.root)}"
+        self.config = {"configurable": {"thread_id": thread_id}, "callbacks": [self.timer]}
+
+    def start(self):
+        """Points the stub at this scenario and seeds the conversation with the system prompt."""
+        from agent.prompt import build_system_message
+
+        os.chdir(self.root)
+        self.server.reset([response for turn in self.turns for response in turn["responses"]])
+        self.graph.update_state({"configurable": self.config["configurable"]}, {"messages": [build_system_message()]})
+
+    def begin_turn(self):
+        self.timer.reset()
+        self.serde.seconds = 0.0
+        self._requests = len(self.server.requests)
+        self._stub_seconds = self.server.handler_seconds
+        self._rss = _rss_kb()
+        self._heap = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        self._started = time.perf_counter()
+
+    def end_turn(self, index: int, state: dict) -> TurnResult:
+        wall = time.perf_counter() - self._started
+        turn = self.turns[index]
+        messages = state["messages"]
+        requests = len(self.server.requests) - self._requests
+        final = messages[-1]
+        if requests != len(turn["responses"]) or not isinstance(final, AIMessage) or final.tool_calls:
+            raise RuntimeError(
+                f"Scenario {self.scenario['name']!r} went off script in turn {index + 1}: "
+                f"{requests} model requests for {len(turn['responses'])} scripted responses."
+            )
+        start = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        tool_messages = [m for m in messages[start:] if isinstance(m, ToolMessage)]
+        tools = self.timer.node_seconds.get("tools", 0.0)
+        return TurnResult(
+            scenario=self.scenario["name"],
+            repeat=self.repeat,
+            turn=index + 1,
+            wall_ms=wall * 1000,
+            model_ms=self.timer.model_seconds * 1000,
+            stub_ms=(self.server.handler_seconds - self._stub_seconds) * 1000,
+            tools_ms=tools * 1000,
+            serde_ms=self.serde.seconds * 1000,
+            overhead_ms=(wall - self.timer.model_seconds - tools - self.serde.seconds) * 1000,
+            model_requests=requests,
+            tool_calls=len(tool_messages),
+            tool_errors=sum(1 for m in tool_messages if m.status == "error" or str(m.content).startswith("Error")),
+            rss_kb=_rss_kb() - self._rss,
+            heap_kb=(tracemalloc.get_traced_memory()[0] - self._heap) // 1024 if tracemalloc.is_tracing() else 0,
+        )
+
+    def run(self) -> list[TurnResult]:
+        self.start()
+        results = []
+        for i, turn in enumerate(self.turns):
+            self.begin_turn()
+            state = self.graph.invoke({"messages": [HumanMessage(content=turn["user"])]}, self.config)
+            results.append(self.end_turn(i, state))
+        return results
+
+    async def arun(self) -> list[TurnResult]:
+        self.start()
+        results = []
+        for i, turn in enumerate(self.turns):
+            self.begin_turn()
+            state = await self.graph.ainvoke({"messages": [HumanMessage(content=turn["user"])]}, self.config)
+            results.append(self.end_turn(i, state))
+        return results
+
+
+def run_benchmark(scenarios=None, tools=None, repeat: int = 3, warmup: int = 1, use_async: bool = False,
+                  first_token_latency: float = 0.0, token_interval: float = 0.0, context_settings=None) -> list[TurnResult]:
+    """Plays every scenario `warmup` times unmeasured, then `repeat` times; returns the measured turns."""
+    from agent.tools import shell_session
+    from core.models import get_model
+
+    scenarios = SCENARIOS if scenarios is None else scenarios
+    tools = default_tools() if tools is None else tools
+    cwd = os.getcwd()
+    with StubServer(first_token_latency=first_token_latency, token_interval=token_interval) as server, \
+            tempfile.TemporaryDirectory(prefix="agent-bench-") as base_dir:
+        llm = get_model(cache_mode="passthrough", base_url=server.url, api_key="stub").bind_tools(tools)
+        runs = [
+            (_Run(scenario, i - warmup + 1, llm, tools, server, base_dir, context_settings), i >= warmup)
+            for scenario in scenarios
+            for i in range(warmup + repeat)
+        ]
+
+        async def play_async():
+            measured = []
+            for run, keep in runs:
+                results = await run.arun()
+                measured.extend(results if keep else [])
+            return measured
+
+        try:
+            if use_async:
+                return asyncio.run(play_async())
+            measured = []
+            for run, keep in runs:
+                results = run.run()
+                measured.extend(results if keep else [])
+            return measured
+        finally:
+            os.chdir(cwd)
+            shell_session.pool.close_all()
+
+
+COLUMNS = ["wall_ms", "model_ms", "stub_ms", "tools_ms", "serde_ms", "overhead_ms", "rss_kb", "heap_kb"]
+
+
+def summarize(results: list[TurnResult]) -> list[dict]:
+    """The median of every column per scenario turn, over the repeats."""
+    groups = {}
+    for result in results:
+        groups.setdefault((result.scenario, result.turn), []).append(result)
+    rows = []
+    for (scenario, turn), group in groups.items():
+        row = {"scenario": scenario, "turn": turn, "repeats": len(group),
+               "model_requests": group[0].model_requests, "tool_calls": group[0].tool_calls,
+               "tool_errors": max(r.tool_errors for r in group)}
+        for column in COLUMNS:
+            row[column] = statistics.median(getattr(r, column) for r in group)
+        rows.append(row)
+    return rows
+
+
+def format_table(rows: list[dict]) -> str:
+    headers = ["scenario", "turn", "requests", "tools", "errors", *COLUMNS]
+    lines = [headers]
+    for row in rows:
+        lines.append([
+            row["scenario"], str(row["turn"]), str(row["model_requests"]), str(row["tool_calls"]), str(row["tool_errors"]),
+            *(f"{row[column]:.1f}" if column.endswith("_ms") else str(int(row[column])) for column in COLUMNS),
+        ])
+    widths = [max(len(line[i]) for line in lines) for i in range(len(headers))]
+    return "\n".join("  ".join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in enumerate(zip(line, widths))) for line in lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the agent's own per-turn overhead against a local model stub.")
+    parser.add_argument("--repeat", type=int, default=5, help="Measured play-throughs of each scenario (default: 5).")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured play-throughs before them (default: 1).")
+    parser.add_argument("--scenario", action="append", choices=[s["name"] for s in SCENARIOS], help="Only run these scenarios.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the graph with ainvoke.")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="Simulated seconds before the model's first token.")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="Simulated seconds per generated token.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report Python heap growth (slows everything down).")
+    parser.add_argument("--json", help="Write every measured turn to this JSON file.")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or s["name"] in args.scenario]
+    if args.tracemalloc:
+        tracemalloc.start()
+    results = run_benchmark(scenarios, repeat=args.repeat, warmup=args.warmup, use_async=args.use_async,
+                            first_token_latency=args.first_token_latency, token_interval=args.token_interval)
+    print(format_table(summarize(results)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+        print(f"\nWrote {len(results)} measured turns to {args.json}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+A local stand-in for the OpenAI chat-completions API with scripted answers.
+
+`StubServer` serves `POST /v1/chat/completions` (plain and streamed as
+server-sent events) and `GET /v1/models` on a loopback port, so
+`core.models.get_model(base_url=server.url)` runs the agent without network
+access. Its `script` is the list of assistant responses of a whole
+conversation, each either
+
+    {"content": "text"}
+    {"tool_calls": [{"name": "read_file", "args": {"file_path": "a.txt"}}]}
+
+(or both). A request is answered with the entry at the number of assistant
+messages already in its history, so the answers follow the conversation, not
+the order requests arrive in; past the end of the script it answers
+`DEFAULT_RESPONSE`. `first_token_latency` and `token_interval` add a
+simulated model latency, which is zero by default so only the client side is
+measured. Setting `fail_status` makes every completion request fail with that
+HTTP status, to exercise the client's failover.
+
+Run it on its own with `python -m benchmarks.stub_server --port 8765
+[--script script.json]`.
+"""
+import argparse
+import itertools
+import json
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = {"content": "Done."}
+
+# Characters of content, or of tool-call arguments, sent per streamed chunk.
+CHUNK_CHARS = 16
+
+
+def _tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+        parts.extend(call["function"]["arguments"] for call in message.get("tool_calls") or ())
+    return "".join(parts)
+
+
+def _pieces(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class StubServer:
+    """A scripted chat-completions endpoint running on a background thread."""
+
+    def __init__(self, script=None, host: str = "127.0.0.1", port: int = 0, *,
+                 first_token_latency: float = 0.0, token_interval: float = 0.0, chunk_chars: int = CHUNK_CHARS,
+                 fail_status: int = None):
+        self.script = list(script or [])
+        self.fail_status = fail_status
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.chunk_chars = chunk_chars
+        # Parsed bodies of the requests received, and the seconds spent answering them.
+        self.requests = []
+        self.handler_seconds = 0.0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The base URL to give an OpenAI client."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,), name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset(self, script=None):
+        """Swaps the script and forgets the requests received."""
+        with self._lock:
+            self.script = list(script or [])
+            self.requests = []
+            self.handler_seconds = 0.0
+
+    def response_for(self, messages: list) -> dict:
+        """The scripted response for a request with these messages."""
+        turn = sum(1 for message in messages if message.get("role") == "assistant")
+        return self.script[turn] if turn < len(self.script) else DEFAULT_RESPONSE
+
+    def completion(self, body: dict):
+        """Returns the chat-completion object for a request, or a generator of its streamed chunks."""
+        response = self.response_for(body.get("messages") or [])
+        with self._lock:
+            self.requests.append(body)
+            number = next(self._ids)
+        completion_id = f"chatcmpl-stub-{number}"
+        content = response.get("content") or ""
+        tool_calls = [
+            {
+                "id": call.get("id") or f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("args") or {})},
+            }
+            for call in response.get("tool_calls") or ()
+        ]
+        prompt_tokens = _tokens(_prompt_text(body.get("messages") or []))
+        completion_tokens = _tokens(content) + sum(_tokens(c["function"]["arguments"]) for c in tool_calls)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        common = {"id": completion_id, "created": int(time.time()), "model": body.get("model", "stub")}
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return self._chunks(common, content, tool_calls, finish_reason, usage if include_usage else None)
+        if self.first_token_latency or self.token_interval:
+            time.sleep(self.first_token_latency + self.token_interval * completion_tokens)
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return {
+            **common,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def _chunks(self, common, content, tool_calls, finish_reason, usage):
+        def chunk(delta, finish=None):
+            return {**common, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        yield chunk({"role": "assistant", "content": ""})
+        if content:
+            for piece in _pieces(content, self.chunk_chars):
+                yield chunk({"content": piece})
+                if self.token_interval:
+                    time.sleep(self.token_interval * _tokens(piece))
+        for index, call in enumerate(tool_calls):
+            yield chunk({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                         "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            for piece in _pieces(call["function"]["arguments"], self.chunk_chars):
+                yield chunk({"tool_calls": [{"index": index, "function": {"arguments": piece}}]})
+                if self.token_interval:
+                    time.sleep(self.token_interval * _tokens(piece))
+        yield chunk({}, finish_reason)
+        if usage is not None:
+            yield {**common, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+
+
+def _handler(server: StubServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Streamed chunks are small writes; without this, Nagle's algorithm delays each by the peer's ACK.
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/v1/models":
+                return self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+
+        def do_POST(self):
+            started = time.perf_counter()
+            try:
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    return self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError as e:
+                    return self._send_json(400, {"error": {"message": f"Invalid JSON: {e}", "type": "invalid_request_error"}})
+                if server.fail_status:
+                    with server._lock:
+                        server.requests.append(body)
+                    return self._send_json(server.fail_status, {"error": {"message": "Injected failure", "type": "server_error"}})
+                result = server.completion(body)
+                if isinstance(result, dict):
+                    return self._send_json(200, result)
+                self._send_events(result)
+            finally:
+                with server._lock:
+                    server.handler_seconds += time.perf_counter() - started
+
+        def _send_json(self, status: int, payload: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_events(self, chunks):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in chunks:
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a scripted OpenAI-compatible chat-completions API locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="JSON file with the list of scripted assistant responses.")
+    parser.add_argument("--first-token-latency", type=float, default=0.0, help="Seconds before the first token.")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="Seconds per generated token.")
+    args = parser.parse_args()
+    script = []
+    if args.script:
+        with open(args.script, "r") as f:
+            script = json.load(f)
+    server = StubServer(script, args.host, args.port,
+                        first_token_latency=args.first_token_latency, token_interval=args.token_interval)
+    print(f"Serving the chat-completions stub at {server.url} (set model_settings.base_url or LLM_BASE_URL to it).")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
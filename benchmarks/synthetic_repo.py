@@ -0,0 +1,166 @@
+"""
+Deterministic synthetic repositories for the tool benchmarks.
+
+`generate(root, spec)` lays out `spec.files` files in a directory tree at most
+`spec.depth` levels deep, with sizes spread log-uniformly between
+`min_file_bytes` and `max_file_bytes`. A `binary_fraction` of them are binary
+(they contain NUL bytes), an `ignored_fraction` lie in the git-ignored
+`ignored_dirs`, and a `needle_fraction` of the text files contain
+`spec.needle` on one line. One `large_file_bytes` file holds `REPLACE_MARKER`
+once, in its middle, for `replace`. Everything is derived from `spec.seed`, so
+the same spec always produces the same repository.
+
+`ensure(root, spec)` generates a repository only when `root` does not
+already hold one made from the same spec, so large ones are built once.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import shutil
+from dataclasses import asdict, dataclass
+
+MANIFEST_NAME = ".synthetic_repo.json"
+
+REPLACE_MARKER = "REPLACE_ME_MARKER"
+
+_WORDS = (
+    "alpha beta gamma delta value result buffer index cache error config parse render "
+    "request response handler session token stream reader writer client server worker "
+    "queue batch record schema table column filter order limit offset count total"
+).split()
+
+_TEXT_EXTENSIONS = (".py", ".js", ".ts", ".md", ".txt", ".json", ".yaml")
+_BINARY_EXTENSIONS = (".bin", ".dat", ".png")
+
+
+@dataclass(frozen=True)
+class RepoSpec:
+    files: int = 1000
+    depth: int = 4
+    # Average number of files per directory, which sets the number of directories.
+    files_per_dir: int = 20
+    min_file_bytes: int = 256
+    max_file_bytes: int = 8 * 1024
+    binary_fraction: float = 0.05
+    ignored_dirs: tuple = ("node_modules", "build")
+    ignored_fraction: float = 0.1
+    needle: str = "NEEDLE_7f3a"
+    needle_fraction: float = 0.01
+    large_file_bytes: int = 4 * 1024 * 1024
+    seed: int = 0
+
+    def digest(self) -> str:
+        return hashlib.sha1(json.dumps(asdict(self), sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def _corpus(rng: random.Random, size: int) -> str:
+    """Source-like text to cut file contents from."""
+    lines = []
+    total = 0
+    while total < size:
+        indent = "    " * rng.randrange(3)
+        words = " ".join(rng.choice(_WORDS) for _ in range(rng.randrange(2, 10)))
+        kind = rng.random()
+        if kind < 0.15:
+            line = f"{indent}def {rng.choice(_WORDS)}_{rng.randrange(1000)}({rng.choice(_WORDS)}):"
+        elif kind < 0.25:
+            line = f"{indent}# {words}"
+        else:
+            line = f"{indent}{rng.choice(_WORDS)} = {words!r}"
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+
+def _directories(rng: random.Random, spec: RepoSpec) -> list[str]:
+    """Relative directory paths (the root is ""), grown by attaching each new one to a random shallower one."""
+    target = max(1, spec.files // max(1, spec.files_per_dir))
+    directories = [""]
+    parents = [""] if spec.depth > 0 else []
+    while len(directories) < target and parents:
+        parent = rng.choice(parents)
+        child = os.path.join(parent, f"{rng.choice(_WORDS)}_{len(directories)}")
+        directories.append(child)
+        if child.count(os.sep) + 1 < spec.depth:
+            parents.append(child)
+    return directories
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate(root: str, spec: RepoSpec = RepoSpec()) -> dict:
+    """Writes the repository described by `spec` into an empty or missing `root`; returns its manifest."""
+    rng = random.Random(spec.seed)
+    corpus = _corpus(rng, 256 * 1024 + spec.max_file_bytes)
+    directories = _directories(rng, spec)
+    ignored_roots = [os.path.join(name, f"pkg_{i}") for name in spec.ignored_dirs for i in range(4)]
+    log_min, log_max = math.log(spec.min_file_bytes), math.log(max(spec.min_file_bytes, spec.max_file_bytes))
+
+    counts = {"text": 0, "binary": 0, "ignored": 0, "needle": 0}
+    total_bytes = 0
+    for i in range(spec.files):
+        size = int(math.exp(rng.uniform(log_min, log_max)))
+        ignored = bool(spec.ignored_dirs) and rng.random() < spec.ignored_fraction
+        directory = rng.choice(ignored_roots) if ignored else rng.choice(directories)
+        if rng.random() < spec.binary_fraction:
+            name = f"blob_{i}{rng.choice(_BINARY_EXTENSIONS)}"
+            data = bytearray(rng.randbytes(size))
+            data[::7] = bytes(len(data[::7]))
+            data = bytes(data)
+            counts["binary"] += 1
+        else:
+            name = f"{rng.choice(_WORDS)}_{i}{rng.choice(_TEXT_EXTENSIONS)}"
+            start = corpus.index("\n", rng.randrange(len(corpus) - size - 1)) + 1
+            text = corpus[start:start + size]
+            if rng.random() < spec.needle_fraction:
+                cut = text.find("\n", len(text) // 2) + 1
+                text = f"{text[:cut]}# {spec.needle} {i}\n{text[cut:]}"
+                counts["needle"] += 1 if not ignored else 0
+            data = text.encode("utf-8")
+            counts["text"] += 1
+        counts["ignored"] += ignored
+        total_bytes += len(data)
+        _write(os.path.join(root, directory, name), data)
+
+    if spec.ignored_dirs:
+        _write(os.path.join(root, ".gitignore"), "".join(f"{name}/\n" for name in spec.ignored_dirs).encode("utf-8"))
+    large = b""
+    if spec.large_file_bytes:
+        half = corpus.encode("utf-8") * (spec.large_file_bytes // (2 * len(corpus)) + 1)
+        half = half[:spec.large_file_bytes // 2]
+        large = half + f"\n{REPLACE_MARKER}\n".encode("utf-8") + half
+        _write(os.path.join(root, "data", "large.txt"), large)
+
+    manifest = {
+        "spec": asdict(spec),
+        "digest": spec.digest(),
+        "files": spec.files,
+        "directories": len(directories) - 1,
+        "bytes": total_bytes + len(large),
+        **{f"{kind}_files": count for kind, count in counts.items()},
+        "top_directories": sorted(d for d in directories if d and os.sep not in d),
+        "large_file": os.path.join(root, "data", "large.txt") if large else None,
+    }
+    with open(os.path.join(root, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def ensure(root: str, spec: RepoSpec = RepoSpec()) -> dict:
+    """Returns the manifest of the repository at `root`, regenerating it unless it was made from `spec`."""
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("digest") == spec.digest():
+            return manifest
+    except (OSError, json.JSONDecodeError):
+        pass
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    return generate(root, spec)
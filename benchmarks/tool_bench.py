@@ -0,0 +1,248 @@
+"""
+Micro-benchmarks of the file-system tools over synthetic repositories.
+
+For each scale in `SCALES` a repository is generated once (see
+benchmarks/synthetic_repo.py) under the work directory, and each case (two
+listings, two globs, a literal and a regex search, `read_many_files` of a
+directory and a `replace` in a large file) is run against it with the
+repository as the working directory, the way the agent calls the tools:
+
+* `cold_ms`: the median of `cold_repeat` first calls, each after dropping the
+  directory snapshots and with an empty trigram index, so it includes scanning
+  and indexing;
+* `warm_ms`: the median of `repeat` further calls;
+* `peak_kb`: the peak Python heap during one more call (tracemalloc; memory of
+  indexing worker processes is not included).
+
+The results are compared with a stored baseline (`BASELINE_PATH`). A value
+above `threshold` times its baseline plus a small absolute slack (timer and
+allocator noise) is a regression, and the command exits with status 1.
+`--update-baseline` records the current results instead. The numbers depend on
+the machine, so the baseline should be updated on the machine that checks it.
+
+Run it with `python -m benchmarks.tool_bench [--scale 1k --scale 10k] [--repeat N]`.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import synthetic_repo
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+DEFAULT_SCALES = ("1k", "10k")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "tool_bench.json")
+
+WORK_DIR = os.path.join(tempfile.gettempdir(), "gemini_agent_bench")
+
+# A result regresses when it exceeds threshold * baseline + slack.
+DEFAULT_THRESHOLD = 1.5
+SLACK_MS = 5.0
+SLACK_KB = 256
+
+METRICS = ("cold_ms", "warm_ms", "peak_kb")
+
+
+def _cases(root: str, manifest: dict) -> dict:
+    """The tool calls measured on one repository, as name: (tool, args)."""
+    from agent.tools import file_system
+
+    top = manifest["top_directories"][0] if manifest["top_directories"] else "."
+    large = manifest["large_file"]
+    marker = synthetic_repo.REPLACE_MARKER
+    return {
+        "list_directory": (file_system.list_directory, {"path": root}),
+        "list_directory_tree": (file_system.list_directory, {"path": root, "tree": True}),
+        "glob": (file_system.glob, {"pattern": "**/*.py", "path": root}),
+        "glob_limit": (file_system.glob, {"pattern": "**/*.md", "path": root, "limit": 20}),
+        "search_literal": (file_system.search_file_content, {"pattern": manifest["spec"]["needle"], "path": root}),
+        "search_regex": (file_system.search_file_content, {"pattern": r"[A-Z]{2}\d", "path": root}),
+        "read_many_files": (file_system.read_many_files, {"paths": [os.path.join(root, top)]}),
+        # Applied twice per measurement (there and back), so the file stays the same.
+        "replace_large_file": (_replace_round_trip, {"file_path": large, "marker": marker}),
+    }
+
+
+class _RoundTrip:
+    """`replace` of the marker in the large file, and back."""
+
+    name = "replace"
+
+    def invoke(self, args: dict) -> str:
+        from agent.tools.file_system import replace
+        there = replace.invoke({"file_path": args["file_path"], "old_string": args["marker"], "new_string": args["marker"].lower()})
+        back = replace.invoke({"file_path": args["file_path"], "old_string": args["marker"].lower(), "new_string": args["marker"]})
+        return there + "\n" + back
+
+
+_replace_round_trip = _RoundTrip()
+
+
+def _check(case: str, output: str):
+    if output.startswith(("Error", "An unexpected error", "Failed to edit", "File not found")):
+        raise RuntimeError(f"Benchmark case {case} failed: {output[:500]}")
+
+
+def _cold_state(index_dir: str):
+    from agent.tools import gitignore, snapshot, trigram_index
+
+    snapshot.clear()
+    with gitignore._matchers_lock:
+        gitignore._matchers.clear()
+    shutil.rmtree(index_dir, ignore_errors=True)
+    trigram_index.INDEX_DIR = index_dir
+
+
+def measure(tool, args: dict, case: str, repeat: int, index_dir: str, cold_repeat: int = 3) -> dict:
+    """Median cold and warm times and the peak Python heap of one tool call."""
+    cold = []
+    for _ in range(cold_repeat):
+        _cold_state(index_dir)
+        started = time.perf_counter()
+        output = tool.invoke(args)
+        cold.append(time.perf_counter() - started)
+        _check(case, output)
+
+    warm = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        tool.invoke(args)
+        warm.append(time.perf_counter() - started)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    tool.invoke(args)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    if not tracing:
+        tracemalloc.stop()
+    return {
+        "cold_ms": round(statistics.median(cold) * 1000, 2),
+        "warm_ms": round(statistics.median(warm) * 1000, 2),
+        "peak_kb": max(0, peak) // 1024,
+    }
+
+
+def run(scales=DEFAULT_SCALES, repeat: int = 5, cold_repeat: int = 3, work_dir: str = WORK_DIR, spec_overrides: dict = None, cases=None) -> dict:
+    """Returns {scale: {case: {metric: value}}}, generating the repositories that are missing."""
+    from agent.tools import trigram_index
+
+    results = {}
+    cwd = os.getcwd()
+    index_dir_before = trigram_index.INDEX_DIR
+    try:
+        for scale in scales:
+            spec = synthetic_repo.RepoSpec(files=SCALES[scale], **(spec_overrides or {}))
+            root = os.path.join(work_dir, f"repo-{scale}-{spec.digest()}")
+            print(f"[{scale}] preparing {root} ...", file=sys.stderr)
+            manifest = synthetic_repo.ensure(root, spec)
+            os.chdir(root)
+            results[scale] = {}
+            for case, (tool, args) in _cases(root, manifest).items():
+                if cases and case not in cases:
+                    continue
+                results[scale][case] = measure(tool, args, case, repeat, os.path.join(work_dir, "trigram_index"), cold_repeat)
+                print(f"[{scale}] {case}: " + ", ".join(f"{k}={v:.1f}" for k, v in results[scale][case].items()), file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        trigram_index.INDEX_DIR = index_dir_before
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """Describes every result that regressed against the baseline's results."""
+    regressions = []
+    for scale, cases in results.items():
+        for case, metrics in cases.items():
+            expected = baseline.get(scale, {}).get(case)
+            if not expected:
+                continue
+            for metric in METRICS:
+                if metric not in expected:
+                    continue
+                slack = SLACK_KB if metric.endswith("_kb") else SLACK_MS
+                limit = expected[metric] * threshold + slack
+                if metrics[metric] > limit:
+                    regressions.append(
+                        f"{scale} {case} {metric}: {metrics[metric]:.1f} > {limit:.1f} "
+                        f"(baseline {expected[metric]:.1f} x {threshold} + {slack})"
+                    )
+    return regressions
+
+
+def format_table(results: dict, baseline: dict = None) -> str:
+    lines = [f"{'scale':<6} {'case':<22} {'cold_ms':>10} {'warm_ms':>10} {'peak_kb':>10} {'base_warm':>10}"]
+    for scale, cases in results.items():
+        for case, m in cases.items():
+            base = ((baseline or {}).get(scale) or {}).get(case) or {}
+            base_warm = f"{base['warm_ms']:.1f}" if "warm_ms" in base else "-"
+            lines.append(f"{scale:<6} {case:<22} {m['cold_ms']:>10.1f} {m['warm_ms']:>10.1f} {m['peak_kb']:>10} {base_warm:>10}")
+    return "\n".join(lines)
+
+
+def load_baseline(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("results", {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, results: dict, repeat: int):
+    existing = load_baseline(path)
+    existing.update(results)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+            "repeat": repeat,
+            "results": existing,
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the file-system tools over synthetic repositories and check for regressions.")
+    parser.add_argument("--scale", action="append", choices=list(SCALES), help="Repository sizes to run (default: 1k and 10k).")
+    parser.add_argument("--case", action="append", help="Only run these cases.")
+    parser.add_argument("--repeat", type=int, default=5, help="Warm calls per case (default: 5).")
+    parser.add_argument("--cold-repeat", type=int, default=3, help="Cold calls per case (default: 3).")
+    parser.add_argument("--work-dir", default=WORK_DIR, help=f"Where the repositories are generated and kept (default: {WORK_DIR}).")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare with or update.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed factor over the baseline (default: 1.5).")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline instead of comparing.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = run(args.scale or DEFAULT_SCALES, repeat=args.repeat, cold_repeat=args.cold_repeat, work_dir=args.work_dir, cases=args.case)
+    baseline = load_baseline(args.baseline)
+    print(format_table(results, baseline))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        save_baseline(args.baseline, results, args.repeat)
+        print(f"\nBaseline updated: {args.baseline}")
+        return
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to record one.")
+        return
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\nPERFORMANCE REGRESSIONS:\n" + "\n".join(f"  {line}" for line in regressions), file=sys.stderr)
+        sys.exit(1)
+    print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+Conversation checkpoints on disk.
+
+`SQLiteCheckpointer` is a LangGraph checkpoint saver backed by one SQLite
+database in WAL mode, so conversations survive restarts and memory does not
+grow with the number of chats. It stores what `MemorySaver` keeps in RAM:
+checkpoints without their channel values, each channel value once per
+version (a step that only changes `messages` does not store anything else
+again), and the pending writes of each checkpoint.
+
+Only the latest checkpoint of a thread is read in normal operation, so
+`hot_threads` of them are kept (serialized) in an LRU, and threads idle for
+`idle_seconds` are dropped from it. After every checkpoint, all but the
+`keep_checkpoints` most recent ones of the thread are deleted together with
+their writes and the channel values nothing refers to any more; each one
+holds the whole conversation, so keeping every step of every turn would
+grow the database quadratically.
+
+`get_checkpointer()` returns the saver selected by `checkpointer.backend` in
+config.yaml (overridden by its `backend` argument or the CHECKPOINTER
+environment variable): "sqlite", or "memory" for the in-memory `MemorySaver`.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+DEFAULT_PATH = os.path.join(
+    os.getenv("XDG_STATE_HOME", os.path.join(os.path.expanduser("~"), ".local", "state")),
+    "gemini_agent",
+    "checkpoints.sqlite",
+)
+
+BACKENDS = ("sqlite", "memory")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    -- JSON of the checkpoint's channel versions, to find unreferenced blobs without deserializing.
+    versions TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class _Latest:
+    """The serialized latest checkpoint of one thread and namespace, as cached in the LRU."""
+
+    __slots__ = ("checkpoint_id", "parent_id", "checkpoint", "metadata", "versions", "blobs", "writes", "used")
+
+    def __init__(self, checkpoint_id, parent_id, checkpoint, metadata, versions, blobs, writes):
+        self.checkpoint_id = checkpoint_id
+        self.parent_id = parent_id
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        # {channel: version as a string}
+        self.versions = versions
+        # {channel: (type, bytes)} of the values at the checkpoint's versions.
+        self.blobs = blobs
+        # {(task_id, idx): (task_id, channel, (type, bytes), task_path)}
+        self.writes = writes
+        self.used = time.monotonic()
+
+
+def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver[str]):
+    """A checkpoint saver in a SQLite database, with an LRU of the latest checkpoints of hot threads."""
+
+    def __init__(self, path: str = DEFAULT_PATH, *, hot_threads: int = 64, idle_seconds: float = 600.0,
+                 keep_checkpoints: int = 4, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.hot_threads = hot_threads
+        self.idle_seconds = idle_seconds
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Shared by the graph's threads (put_writes runs in the background), so guarded by the lock.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at WAL checkpoints: a crash can lose the last commits, not corrupt.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._hot = OrderedDict()
+
+    def close(self):
+        with self._lock:
+            self._hot.clear()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- LRU of latest checkpoints ---
+
+    def _remember(self, key: tuple, latest: _Latest):
+        self._hot[key] = latest
+        self._hot.move_to_end(key)
+        self._evict()
+
+    def _recall(self, key: tuple):
+        latest = self._hot.get(key)
+        if latest is not None:
+            latest.used = time.monotonic()
+            self._hot.move_to_end(key)
+        self._evict()
+        return latest
+
+    def _evict(self):
+        """Drops the least recently used threads beyond `hot_threads` and those idle for `idle_seconds`."""
+        idle_before = time.monotonic() - self.idle_seconds
+        while self._hot:
+            key, oldest = next(iter(self._hot.items()))
+            if len(self._hot) <= self.hot_threads and oldest.used >= idle_before:
+                break
+            del self._hot[key]
+
+    def hot_thread_count(self) -> int:
+        with self._lock:
+            self._evict()
+            return len(self._hot)
+
+    # --- Reading ---
+
+    def _load(self, thread_id: str, checkpoint_ns: str, row) -> _Latest:
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata, versions = row
+        versions = json.loads(versions)
+        blobs = {}
+        for channel, version in versions.items():
+            found = self._conn.execute(
+                "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, version),
+            ).fetchone()
+            if found is not None:
+                blobs[channel] = (found[0], found[1])
+        writes = {}
+        for task_id, idx, channel, value_type, value, task_path in self._conn.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ):
+            writes[(task_id, idx)] = (task_id, channel, (value_type, value), task_path)
+        return _Latest(checkpoint_id, parent_id, (type_, checkpoint), (metadata_type, metadata), versions, blobs, writes)
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, latest: _Latest, metadata=None) -> CheckpointTuple:
+        checkpoint = self.serde.loads_typed(latest.checkpoint)
+        return CheckpointTuple(
+            config=_config(thread_id, checkpoint_ns, latest.checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": {
+                    channel: self.serde.loads_typed(value)
+                    for channel, value in latest.blobs.items()
+                    if value[0] != "empty"
+                },
+            },
+            metadata=metadata if metadata is not None else self.serde.loads_typed(latest.metadata),
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value)) for task_id, channel, value, _ in latest.writes.values()],
+            parent_config=_config(thread_id, checkpoint_ns, latest.parent_id) if latest.parent_id else None,
+        )
+
+    _COLUMNS = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata, versions"
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            latest = self._recall(key)
+            if latest is not None and checkpoint_id in (None, latest.checkpoint_id):
+                return self._tuple(thread_id, checkpoint_ns, latest)
+            if checkpoint_id:
+                row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            loaded = self._load(thread_id, checkpoint_ns, row)
+            if not checkpoint_id:
+                self._remember(key, loaded)
+            return self._tuple(thread_id, checkpoint_ns, loaded)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = f"SELECT thread_id, checkpoint_ns, {self._COLUMNS} FROM checkpoints"
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                metadata = self.serde.loads_typed((row[4], row[5]))
+                if filter and not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(self._tuple(thread_id, checkpoint_ns, self._load(thread_id, checkpoint_ns, row), metadata))
+        yield from results
+
+    # --- Writing ---
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        key = (thread_id, checkpoint_ns)
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        new_blobs = {
+            channel: self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")
+            for channel in new_versions
+        }
+        serialized = self.serde.dumps_typed(c)
+        serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        versions = {channel: str(version) for channel, version in checkpoint["channel_versions"].items()}
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, blob) VALUES (?, ?, ?, ?, ?, ?)",
+                [(thread_id, checkpoint_ns, channel, str(new_versions[channel]), *value) for channel, value in new_blobs.items()],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                "type, checkpoint, metadata_type, metadata, versions) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, *serialized, *serialized_metadata, json.dumps(versions)),
+            )
+            self._prune(thread_id, checkpoint_ns)
+
+            # The new checkpoint becomes the thread's cached latest one, if its other channels are cached too.
+            previous = self._hot.pop(key, None)
+            blobs = dict(new_blobs)
+            if previous is not None:
+                for channel, value in previous.blobs.items():
+                    if channel not in blobs and previous.versions.get(channel) == versions.get(channel):
+                        blobs[channel] = value
+            if all(channel in blobs for channel in versions):
+                self._remember(key, _Latest(checkpoint["id"], parent_id, serialized, serialized_metadata, versions, blobs, {}))
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        """Deletes all but the newest `keep_checkpoints` checkpoints of a thread, with their writes and orphaned blobs."""
+        deleted = self._conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT ?)",
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_checkpoints),
+        ).rowcount
+        if not deleted:
+            return
+        self._conn.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+        )
+        referenced = set()
+        for (versions,) in self._conn.execute(
+            "SELECT versions FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)
+        ):
+            referenced.update(json.loads(versions).items())
+        stale = [
+            (thread_id, checkpoint_ns, channel, version)
+            for channel, version in self._conn.execute(
+                "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)
+            ).fetchall()
+            if (channel, version) not in referenced
+        ]
+        self._conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", stale
+        )
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            rows.append((idx, channel, self.serde.dumps_typed(value)))
+        with self._lock, self._conn:
+            latest = self._hot.get((thread_id, checkpoint_ns))
+            if latest is not None and latest.checkpoint_id != checkpoint_id:
+                latest = None
+            for idx, channel, value in rows:
+                # Like MemorySaver: regular writes are kept once, special ones (errors, interrupts) replaced.
+                verb = "INSERT OR IGNORE" if idx >= 0 else "INSERT OR REPLACE"
+                self._conn.execute(
+                    f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, *value, task_path),
+                )
+                if latest is not None and (idx < 0 or (task_id, idx) not in latest.writes):
+                    latest.writes[(task_id, idx)] = (task_id, channel, value, task_path)
+
+    def latest_thread(self, prefix: str = ""):
+        """The id of the thread starting with `prefix` that was checkpointed last, or None."""
+        with self._lock:
+            # Checkpoint ids are time-ordered UUIDs, so they sort across threads too.
+            row = self._conn.execute(
+                "SELECT thread_id FROM checkpoints WHERE substr(thread_id, 1, ?) = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                (len(prefix), prefix),
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete_thread(self, thread_id: str):
+        with self._lock, self._conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            for key in [key for key in self._hot if key[0] == thread_id]:
+                del self._hot[key]
+
+    def get_next_version(self, current, channel=None) -> str:
+        # The scheme of MemorySaver: the version number, zero-padded so versions sort as strings.
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # --- Async: the same operations in a worker thread, off the event loop ---
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def get_checkpointer(backend: str = None, settings: dict = None):
+    """
+    The checkpoint saver selected by `backend`, else the CHECKPOINTER environment
+    variable, else `checkpointer.backend` in config.yaml, configured by `settings`
+    (default: the `checkpointer` section of config.yaml).
+    """
+    if settings is None:
+        from core.models import config
+        settings = config.get('checkpointer') or {}
+    backend = backend or os.getenv("CHECKPOINTER") or settings.get('backend', 'memory')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown checkpointer backend {backend!r}; expected one of {', '.join(BACKENDS)}.")
+    if backend == "memory":
+        return MemorySaver()
+    return SQLiteCheckpointer(
+        os.path.expanduser(settings.get('path') or DEFAULT_PATH),
+        hot_threads=settings.get('hot_threads', 64),
+        idle_seconds=settings.get('idle_seconds', 600),
+        keep_checkpoints=settings.get('keep_checkpoints', 4),
+    )
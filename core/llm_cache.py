@@ -0,0 +1,272 @@
+"""
+A record/replay cache around a chat model.
+
+`CachedChatModel` wraps the model from `get_model` and keys every request by
+the SHA-256 of its normalized messages, bound tools, call parameters and the
+model's own identifying parameters. In `record` mode a hit is served from the
+store and a miss goes to the model and is stored; in `replay` mode a miss
+raises `CacheMiss`, so a replayed run never reaches the network; `passthrough`
+always calls the model.
+
+Normalization leaves out what changes between otherwise identical runs: the
+per-conversation part of the system prompt (date, directory listing, memory,
+see agent/prompt.py), message ids, and the PIDs, timings and other run-specific
+numbers in tool outputs matched by `VOLATILE_PATTERNS`.
+
+Responses are stored as one JSON file per key under the cache directory. Files
+are touched when read, and the least recently used ones are deleted once the
+store grows past its `max_bytes`.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    SystemMessage,
+    message_chunk_to_message,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "gemini_agent",
+    "llm_responses",
+)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+MODES = ("record", "replay", "passthrough")
+
+# Run-specific details of tool outputs, replaced before hashing.
+VOLATILE_PATTERNS = [
+    (re.compile(r"Process Group PGID: \d+"), "Process Group PGID: <pgid>"),
+    (re.compile(r"Background PIDs: [\d, ]+"), "Background PIDs: <pids>"),
+    (re.compile(r"Resources: [^\n]*"), "Resources: <usage>"),
+    (re.compile(r"\bPID \d+"), "PID <pid>"),
+    (re.compile(r"process group \d+"), "process group <pgid>"),
+    (re.compile(r"running for \d+s"), "running for <seconds>"),
+    (re.compile(r"timed out after [\d.]+ seconds"), "timed out after <seconds> seconds"),
+]
+
+
+class CacheMiss(LookupError):
+    """A request that replay mode has no recorded response for."""
+
+
+class ResponseStore:
+    """Model responses on disk, one JSON file per request key, with size-based LRU eviction."""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Bytes of all entries, counted by the first `put` and kept up to date from then on.
+        self._total = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return messages_from_dict([entry["message"]])[0]
+
+    def put(self, key: str, message: AIMessage):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"key": key, "message": message_to_dict(message)}, f)
+        size = os.path.getsize(temp_path)
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._entries())
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp_path, path)
+            self._total += size - replaced
+            if self._total > self.max_bytes:
+                self._evict(keep=path)
+
+    def _entries(self) -> list:
+        """(mtime, size, path) of every entry on disk."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _evict(self, keep: str):
+        """Removes the least recently used entries until the store fits `max_bytes`. The caller holds the lock."""
+        # Recounted from disk, which also corrects for entries other processes added or removed.
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self._total = total
+
+
+def _normalize_text(text: str) -> str:
+    for pattern, replacement in VOLATILE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _normalize_content(content):
+    if isinstance(content, str):
+        return _normalize_text(content)
+    return [_normalize_text(part) if isinstance(part, str) else part for part in content]
+
+
+def normalize_messages(messages: list) -> list:
+    """The parts of the messages that determine the model's answer, as plain data."""
+    normalized = []
+    for i, message in enumerate(messages):
+        content = message.content
+        if i == 0 and isinstance(message, SystemMessage) and isinstance(content, list):
+            # Only the stable prefix: the rest is rendered anew for every conversation.
+            content = content[:1]
+        item = {"type": message.type, "content": _normalize_content(content)}
+        if getattr(message, "tool_calls", None):
+            item["tool_calls"] = [{"id": c["id"], "name": c["name"], "args": c["args"]} for c in message.tool_calls]
+        if getattr(message, "tool_call_id", None):
+            item["tool_call_id"] = message.tool_call_id
+        normalized.append(item)
+    return normalized
+
+
+def _to_chunk(message: AIMessage) -> AIMessageChunk:
+    """A recorded message as the single chunk of a replayed stream."""
+    return AIMessageChunk(
+        content=message.content,
+        id=message.id,
+        additional_kwargs=message.additional_kwargs,
+        response_metadata=message.response_metadata,
+        usage_metadata=message.usage_metadata,
+        tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+            for i, call in enumerate(message.tool_calls)
+        ],
+    )
+
+
+class CachedChatModel(BaseChatModel):
+    """A chat model that records its responses and can replay them without the wrapped model."""
+
+    model: BaseChatModel
+    store: ResponseStore
+    mode: str = "record"
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.model._llm_type}"
+
+    def bind_tools(self, tools, **kwargs):
+        # The wrapped model formats the tools; its request arguments then become ours.
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    def request_key(self, messages: list, stop=None, **kwargs) -> str:
+        request = {
+            "model": {k: v for k, v in self.model._identifying_params.items() if isinstance(v, (str, int, float, bool, type(None), dict, list))},
+            "messages": normalize_messages(messages),
+            "stop": stop,
+            "kwargs": kwargs,
+        }
+        data = json.dumps(request, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _lookup(self, messages, stop, kwargs):
+        """Returns (key, recorded message or None); raises CacheMiss in replay mode."""
+        if self.mode == "passthrough":
+            return None, None
+        key = self.request_key(messages, stop, **kwargs)
+        message = self.store.get(key)
+        if message is None and self.mode == "replay":
+            raise CacheMiss(f"No recorded response for request {key} ({len(messages)} messages); record it first.")
+        return key, message
+
+    def _record(self, key, message):
+        if key is not None and self.mode == "record":
+            self.store.put(key, message)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key, message = self._lookup(messages, stop, kwargs)
+        if message is not None:
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        result = self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._record(key, result.generations[0].message)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key, message = self._lookup(messages, stop, kwargs)
+        if message is not None:
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        result = await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self._record(key, result.generations[0].message)
+        return result
+
+    def _model_streams(self) -> bool:
+        return type(self.model)._stream is not BaseChatModel._stream
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        key, message = self._lookup(messages, stop, kwargs)
+        if message is None and not self._model_streams():
+            message = self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs).generations[0].message
+            self._record(key, message)
+        if message is not None:
+            yield ChatGenerationChunk(message=_to_chunk(message))
+            return
+        response = None
+        for chunk in self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            self._record(key, message_chunk_to_message(response.message))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        key, message = self._lookup(messages, stop, kwargs)
+        if message is None and type(self.model)._astream is BaseChatModel._astream and not self._model_streams():
+            message = (await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)).generations[0].message
+            self._record(key, message)
+        if message is not None:
+            yield ChatGenerationChunk(message=_to_chunk(message))
+            return
+        response = None
+        async for chunk in self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            self._record(key, message_chunk_to_message(response.message))
+
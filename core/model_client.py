@@ -0,0 +1,381 @@
+"""
+Pooled HTTP clients and a chat model that fails over and hedges its requests.
+
+`http_clients(settings)` returns one shared pair of httpx clients per
+`model_settings.http` configuration: bounded connection pools whose idle
+connections are kept alive for `keepalive_expiry` seconds (httpx closes them
+after 5 by default, so a turn that spent longer in tools reconnected and
+redid the TLS handshake), and `http_timeout(settings)` the separate connect,
+read, write and pool timeouts of every request, so a stalled upstream fails
+after `read_timeout` instead of the client's default ten minutes.
+
+`FailoverChatModel` calls the first of its `models` (the configured endpoint
+followed by `model_settings.fallbacks`) and moves on to the next one when a
+request fails with a connection error, a timeout, 408, 409, 429 or a 5xx
+status. An endpoint that failed that way is tried after the others for
+`cooldown` seconds. A streamed response is not retried once it has produced
+its first chunk, since its tokens have already been passed on. The endpoint
+models should not retry by themselves (`max_retries=0`, as `get_model` sets
+them up), or a stalled endpoint costs several read timeouts before failover.
+
+With `hedge_percentile` set, a request that has not answered (produced its
+first chunk, when streaming) within that percentile of the endpoint's recent
+latencies is sent again, to the next endpoint if there is one and else to
+the same one, and whichever answers first is used; the other is abandoned
+and its connection closed.
+Hedging waits for `hedge_min_samples` latencies and never fires before
+`hedge_min_delay` seconds, so it only duplicates requests from the tail.
+"""
+import asyncio
+import contextvars
+import functools
+import math
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import httpx
+import openai
+from langchain_core.language_models import BaseChatModel
+from pydantic import PrivateAttr
+
+DEFAULT_HTTP_SETTINGS = {
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 90.0,
+    "connect_timeout": 5.0,
+    "read_timeout": 120.0,
+    "write_timeout": 30.0,
+    "pool_timeout": 10.0,
+}
+
+# Statuses that another endpoint (or a later attempt) may well answer.
+RETRYABLE_STATUSES = (408, 409, 429)
+
+_ITEM, _DONE, _ERROR = "item", "done", "error"
+
+# The race attempt a sync request belongs to, for `_track_response`.
+_current_attempt = contextvars.ContextVar("model_request_attempt", default=None)
+
+
+def _http_settings(settings: Optional[dict]) -> dict:
+    return {**DEFAULT_HTTP_SETTINGS, **{k: v for k, v in (settings or {}).items() if k in DEFAULT_HTTP_SETTINGS}}
+
+
+def http_timeout(settings: Optional[dict] = None) -> httpx.Timeout:
+    """The per-request timeouts of `model_settings.http`."""
+    s = _http_settings(settings)
+    return httpx.Timeout(connect=s["connect_timeout"], read=s["read_timeout"], write=s["write_timeout"], pool=s["pool_timeout"])
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """An async connection pool per event loop, since pooled connections cannot move between loops."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Pools of closed loops are unusable; dropping them frees their connections.
+            for key, (other, _) in list(self._pools.items()):
+                if other.is_closed():
+                    del self._pools[key]
+            if id(loop) not in self._pools:
+                self._pools[id(loop)] = (loop, httpx.AsyncHTTPTransport(**self._kwargs))
+            return self._pools[id(loop)][1]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._pool().handle_async_request(request)
+
+    async def aclose(self):
+        await self._pool().aclose()
+
+
+@functools.lru_cache(maxsize=None)
+def _clients(items: tuple) -> tuple:
+    s = dict(items)
+    limits = httpx.Limits(
+        max_connections=s["max_connections"],
+        max_keepalive_connections=s["max_keepalive_connections"],
+        keepalive_expiry=s["keepalive_expiry"],
+    )
+    timeout = http_timeout(s)
+    return (
+        openai.DefaultHttpxClient(limits=limits, timeout=timeout, event_hooks={"response": [_track_response]}),
+        openai.DefaultAsyncHttpxClient(transport=_LoopLocalTransport(limits=limits), timeout=timeout),
+    )
+
+
+def http_clients(settings: Optional[dict] = None) -> tuple:
+    """The shared (sync, async) httpx clients for `model_settings.http`, so all models reuse one pool."""
+    return _clients(tuple(sorted(_http_settings(settings).items())))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed request may succeed on another endpoint."""
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+class _Attempt:
+    """One request to one endpoint within a race."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.started = time.monotonic()
+        self.finished = False
+        self.cancelled = threading.Event()
+        self.task = None
+        # The sync response, once its headers have arrived.
+        self.response = None
+
+    def cancel(self):
+        """Abandons the attempt, closing its connection if it is still reading a response."""
+        self.cancelled.set()
+        response = self.response
+        if response is None or response.is_closed:
+            return
+        # A thread blocked reading the response cannot be interrupted otherwise: shutting the
+        # socket down wakes it with an error, and the connection leaves the pool.
+        stream = response.extensions.get("network_stream")
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _track_response(response: httpx.Response):
+    """Response hook of the sync client: hands the response to the race attempt that made it."""
+    attempt = _current_attempt.get()
+    if attempt is not None:
+        attempt.response = response
+        if attempt.cancelled.is_set():
+            attempt.cancel()
+
+
+class FailoverChatModel(BaseChatModel):
+    """A chat model that tries its `models` in order and optionally hedges slow requests."""
+
+    models: list[BaseChatModel]
+    # None disables hedging.
+    hedge_percentile: Optional[float] = None
+    hedge_min_samples: int = 20
+    hedge_min_delay: float = 1.0
+    latency_window: int = 200
+    cooldown: float = 30.0
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    _latencies: dict = PrivateAttr(default_factory=dict)
+    _down_until: dict = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"failover-{self.models[0]._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        # The primary model's, so cache keys (core/llm_cache.py) do not depend on the fallbacks.
+        return self.models[0]._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # All endpoints speak the same API, so the primary model formats the tools for every one.
+        return self.bind(**self.models[0].bind_tools(tools, **kwargs).kwargs)
+
+    def _order(self) -> list[int]:
+        """Indices of the models to try, those cooling down after a failure last."""
+        now = time.monotonic()
+        with self._lock:
+            return sorted(range(len(self.models)), key=lambda i: self._down_until.get(i, 0) > now)
+
+    def _failed(self, index: int, error: BaseException):
+        if is_retryable(error):
+            with self._lock:
+                self._down_until[index] = time.monotonic() + self.cooldown
+
+    def _answered(self, index: int, seconds: float):
+        with self._lock:
+            self._down_until.pop(index, None)
+            self._latencies.setdefault(index, deque(maxlen=self.latency_window)).append(seconds)
+
+    def hedge_delay(self, index: int = 0) -> Optional[float]:
+        """Seconds after which a request to model `index` is hedged, or None while that is off."""
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(index, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        rank = max(0, math.ceil(self.hedge_percentile / 100 * len(samples)) - 1)
+        return max(self.hedge_min_delay, samples[rank])
+
+    def _wait(self, latest: _Attempt, hedged: bool, winner) -> Optional[float]:
+        if winner is not None or hedged:
+            return None
+        delay = self.hedge_delay(latest.index)
+        return None if delay is None else max(0.0, latest.started + delay - time.monotonic())
+
+    def _race(self, start):
+        """Yields the items of the first attempt to produce one; `start(model)` returns an attempt's items."""
+        order = self._order()
+        events = queue.Queue()
+        attempts = []
+
+        def launch(index):
+            attempt = _Attempt(index)
+            attempts.append(attempt)
+            thread = threading.Thread(
+                target=contextvars.copy_context().run, args=(self._pump, attempt, start, events),
+                name=f"model-request-{index}", daemon=True,
+            )
+            thread.start()
+            return attempt
+
+        latest = launch(order.pop(0))
+        hedged = False
+        winner = None
+        try:
+            while True:
+                try:
+                    attempt, kind, payload = events.get(timeout=self._wait(latest, hedged, winner))
+                except queue.Empty:
+                    hedged = True
+                    latest = launch(order.pop(0) if order else latest.index)
+                    continue
+                if winner is None:
+                    if kind == _ERROR:
+                        attempt.finished = True
+                        self._failed(attempt.index, payload)
+                        if not is_retryable(payload) or (not order and all(a.finished for a in attempts)):
+                            raise payload
+                        if all(a.finished for a in attempts):
+                            latest = launch(order.pop(0))
+                        continue
+                    winner = attempt
+                    self._answered(attempt.index, time.monotonic() - attempt.started)
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancel()
+                if attempt is not winner:
+                    continue
+                if kind == _ERROR:
+                    raise payload
+                if kind == _DONE:
+                    return
+                yield payload
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    @staticmethod
+    def _pump(attempt: _Attempt, start, events: queue.Queue):
+        _current_attempt.set(attempt)
+        try:
+            items = iter(start(attempt.index))
+            try:
+                for item in items:
+                    if attempt.cancelled.is_set():
+                        return
+                    events.put((attempt, _ITEM, item))
+            finally:
+                # Closes the response of an abandoned stream.
+                close = getattr(items, "close", None)
+                if close is not None:
+                    close()
+            events.put((attempt, _DONE, None))
+        except Exception as e:
+            if not attempt.cancelled.is_set():
+                events.put((attempt, _ERROR, e))
+
+    async def _arace(self, start):
+        """`_race` for async attempts: `start(model)` returns an async iterator of its items."""
+        order = self._order()
+        events = asyncio.Queue()
+        attempts = []
+
+        def launch(index):
+            attempt = _Attempt(index)
+            attempt.task = asyncio.ensure_future(self._apump(attempt, start, events))
+            attempts.append(attempt)
+            return attempt
+
+        latest = launch(order.pop(0))
+        hedged = False
+        winner = None
+        try:
+            while True:
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(events.get(), self._wait(latest, hedged, winner))
+                except asyncio.TimeoutError:
+                    hedged = True
+                    latest = launch(order.pop(0) if order else latest.index)
+                    continue
+                if winner is None:
+                    if kind == _ERROR:
+                        attempt.finished = True
+                        self._failed(attempt.index, payload)
+                        if not is_retryable(payload) or (not order and all(a.finished for a in attempts)):
+                            raise payload
+                        if all(a.finished for a in attempts):
+                            latest = launch(order.pop(0))
+                        continue
+                    winner = attempt
+                    self._answered(attempt.index, time.monotonic() - attempt.started)
+                    for other in attempts:
+                        if other is not winner:
+                            other.task.cancel()
+                if attempt is not winner:
+                    continue
+                if kind == _ERROR:
+                    raise payload
+                if kind == _DONE:
+                    return
+                yield payload
+        finally:
+            for attempt in attempts:
+                attempt.task.cancel()
+
+    @staticmethod
+    async def _apump(attempt: _Attempt, start, events: asyncio.Queue):
+        items = start(attempt.index)
+        try:
+            async for item in items:
+                events.put_nowait((attempt, _ITEM, item))
+            events.put_nowait((attempt, _DONE, None))
+        except Exception as e:
+            events.put_nowait((attempt, _ERROR, e))
+        finally:
+            # Closes the response of an abandoned stream.
+            await items.aclose()
+
+    # The wrapped models get no run manager: BaseChatModel reports the call and its tokens itself.
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        def start(index):
+            return [self.models[index]._generate(messages, stop=stop, **kwargs)]
+        for result in self._race(start):
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        async def start(index):
+            yield await self.models[index]._agenerate(messages, stop=stop, **kwargs)
+        async for result in self._arace(start):
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield from self._race(lambda index: self.models[index]._stream(messages, stop=stop, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self._arace(lambda index: self.models[index]._astream(messages, stop=stop, **kwargs)):
+            yield chunk
@@ -3,6 +3,9 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 import yaml
 
+from core.llm_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, MODES, CachedChatModel, ResponseStore
+from core.model_client import FailoverChatModel, http_clients, http_timeout
+
 # Load environment variables, overriding any existing ones
 load_dotenv(override=True)
 
@@ -11,32 +14,118 @@ CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'config.yaml')
 with open(CONFIG_FILE, 'r') as f:
     config = yaml.safe_load(f)
 
-def get_model():
+class CachingChatOpenAI(ChatOpenAI):
     """
-    Initializes and returns a ChatOpenAI model configured for OpenRouter.
-    Settings are loaded from config.yaml.
+    A ChatOpenAI that marks the first text block of the system prompt (its stable
+    prefix, see agent/prompt.py) with `cache_control`, so providers that cache
+    explicitly (Anthropic and Gemini through OpenRouter) reuse it across requests.
     """
-    model_settings = config['model_settings']
-    model_name = model_settings['model_name']
-    api_key_env_var = model_settings['api_key_env_var']
-    base_url = model_settings['base_url']
-    llm_parameters = model_settings.get('llm_parameters')
+
+    def _get_request_payload(self, input_, *, stop=None, **kwargs):
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        messages = payload.get("messages") or []
+        if messages and messages[0].get("role") == "system" and isinstance(messages[0].get("content"), list):
+            first = messages[0]["content"][0]
+            if isinstance(first, dict) and first.get("type") == "text":
+                first["cache_control"] = {"type": "ephemeral"}
+        return payload
+
+
+def _endpoint_model(settings: dict, api_key: str, base_url: str, http_settings: dict, max_retries: int):
+    """The ChatOpenAI of one configured endpoint, on the shared connection pool."""
+    llm_parameters = settings.get('llm_parameters')
     if llm_parameters is None:
         llm_parameters = {}
-    openrouter_reasoning_config = model_settings.get('openrouter_reasoning_config', {})
-
-    api_key = os.getenv(api_key_env_var)
-    if not api_key:
-        raise ValueError(f"{api_key_env_var} environment variable not set.")
+    openrouter_reasoning_config = settings.get('openrouter_reasoning_config', {})
 
     extra_body = {}
     if openrouter_reasoning_config:
         extra_body["reasoning"] = openrouter_reasoning_config
 
-    return ChatOpenAI(
-        model=model_name,
+    http_client, http_async_client = http_clients(http_settings)
+    model_class = CachingChatOpenAI if settings.get('prompt_caching', True) else ChatOpenAI
+    return model_class(
+        model=settings['model_name'],
         api_key=api_key,
         base_url=base_url,
         extra_body=extra_body,
-        **llm_parameters,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        timeout=http_timeout(http_settings),
+        max_retries=max_retries,
+        # Token counts of streamed responses too, for tracing (see agent/tracing.py).
+        **{'stream_usage': True, **llm_parameters},
+    )
+
+
+def get_model(cache_mode: str = None, base_url: str = None, api_key: str = None):
+    """
+    Initializes and returns a ChatOpenAI model configured for OpenRouter.
+    Settings are loaded from config.yaml.
+
+    `base_url` (else the LLM_BASE_URL environment variable) and `api_key`
+    override the configured endpoint and key, e.g. to point the agent at the
+    local stub of benchmarks/stub_server.py.
+
+    All models share the connection pool and timeouts of `model_settings.http`.
+    With `model_settings.fallbacks` or `model_settings.hedging` configured, the
+    model is a FailoverChatModel (see core/model_client.py) over the configured
+    endpoint followed by the fallbacks, which take the fields they leave out
+    from `model_settings`, except that a fallback without a `base_url` uses
+    the resolved endpoint and key (overridden or not).
+
+    The model is wrapped in a record/replay response cache unless its mode
+    (`cache_mode`, else the LLM_CACHE_MODE environment variable, else
+    `llm_cache.mode` in config.yaml) is "passthrough".
+    """
+    cache_settings = config.get('llm_cache') or {}
+    cache_mode = cache_mode or os.getenv("LLM_CACHE_MODE") or cache_settings.get('mode', 'passthrough')
+    if cache_mode not in MODES:
+        raise ValueError(f"Unknown LLM cache mode {cache_mode!r}; expected one of {', '.join(MODES)}.")
+
+    model_settings = config['model_settings']
+    api_key_env_var = model_settings['api_key_env_var']
+    base_url = base_url or os.getenv("LLM_BASE_URL") or model_settings['base_url']
+    http_settings = model_settings.get('http') or {}
+
+    api_key = api_key or os.getenv(api_key_env_var)
+    if not api_key and cache_mode == "replay":
+        # Replays never reach the provider.
+        api_key = "replay"
+    if not api_key:
+        raise ValueError(f"{api_key_env_var} environment variable not set.")
+
+    fallbacks = model_settings.get('fallbacks') or []
+    hedging = model_settings.get('hedging') or {}
+    failover = bool(fallbacks or hedging.get('enabled'))
+    # The client's own retries (with backoff) would delay every failover by several timeouts.
+    max_retries = 0 if failover else http_settings.get('max_retries', 2)
+    model = _endpoint_model(model_settings, api_key, base_url, http_settings, max_retries)
+    if failover:
+        models = [model]
+        for fallback in fallbacks:
+            settings = {**model_settings, **fallback}
+            # A fallback without its own endpoint shares the overridden one and its key.
+            fallback_url = fallback.get('base_url', base_url)
+            fallback_key = api_key
+            if 'base_url' in fallback and 'api_key_env_var' not in fallback:
+                fallback_key = os.getenv(api_key_env_var) or api_key
+            if 'api_key_env_var' in fallback:
+                fallback_key = os.getenv(fallback['api_key_env_var']) or (api_key if cache_mode == "replay" else None)
+                if not fallback_key:
+                    raise ValueError(f"{fallback['api_key_env_var']} environment variable not set (fallback {settings['model_name']}).")
+            models.append(_endpoint_model(settings, fallback_key, fallback_url, http_settings, max_retries))
+        model = FailoverChatModel(
+            models=models,
+            hedge_percentile=hedging.get('percentile', 95) if hedging.get('enabled') else None,
+            hedge_min_samples=hedging.get('min_samples', 20),
+            hedge_min_delay=hedging.get('min_delay', 1.0),
+            cooldown=model_settings.get('failover_cooldown', 30.0),
+        )
+    if cache_mode == "passthrough":
+        return model
+    store = ResponseStore(
+        os.path.expanduser(cache_settings.get('directory') or DEFAULT_CACHE_DIR),
+        cache_settings.get('max_bytes', DEFAULT_MAX_BYTES),
     )
+    return CachedChatModel(model=model, store=store, mode=cache_mode)
@@ -5,13 +5,18 @@ import platform
 import json
 from datetime import datetime
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, ToolMessage
 
+from agent import tracing
 from agent.graph import create_graph
-from agent.composition import TOOLS, assemble_system_prompt
+from agent.composition import TOOLS, build_system_message
+from core.checkpointer import BACKENDS, get_checkpointer
 from core.models import get_model
 
+# Thread ids of CLI conversations start with this, telling them apart from the bot's chats.
+SESSION_PREFIX = "cli-"
+LAST_SESSION = "last"
+
 
 def print_input_header():
     """Prints the header for human input."""
@@ -43,12 +48,69 @@ def print_tool_result(tool_name: str, stdout: str):
     formatted = "\n".join([f"│  {line}" for line in stdout.splitlines()])
     print(f"\n{formatted}\n")
 
-def print_compact_output(node, output):
-    """Prints the output in a compact, technical format."""
+class StreamRenderer:
+    """
+    Prints model tokens as they are streamed, in the same layout as `print_agent_answer`
+    and `print_tool_call`; tool-call arguments appear as their raw JSON fragments.
+    Remembers which messages it printed so `print_compact_output` can skip them.
+    """
+
+    def __init__(self):
+        self.streamed = set()
+        self.message_id = None
+        self.tool_call_index = None
+        self.at_line_start = True
+
+    def token(self, chunk, metadata):
+        if not isinstance(chunk, AIMessageChunk):
+            return
+        if chunk.id != self.message_id:
+            self.finish()
+            self.message_id = chunk.id
+            self.streamed.add(chunk.id)
+            print(f"\n[Node: {metadata.get('langgraph_node', 'agent')}]")
+        if chunk.content and isinstance(chunk.content, str):
+            if self.tool_call_index is not None:
+                self._end_line()
+                self.tool_call_index = None
+            self._write_text(chunk.content)
+        for tool_call_chunk in chunk.tool_call_chunks:
+            if tool_call_chunk.get("index") != self.tool_call_index or tool_call_chunk.get("name"):
+                self._end_line()
+                self.tool_call_index = tool_call_chunk.get("index")
+                print(f"   -> Tool Call: {tool_call_chunk.get('name') or ''} ", end="", flush=True)
+                self.at_line_start = False
+            print(tool_call_chunk.get("args") or "", end="", flush=True)
+
+    def finish(self):
+        """Ends the message being streamed."""
+        self._end_line()
+        self.message_id = None
+        self.tool_call_index = None
+
+    def _write_text(self, text: str):
+        for piece in text.splitlines(keepends=True):
+            if self.at_line_start:
+                print("   ", end="")
+            print(piece, end="", flush=True)
+            self.at_line_start = piece.endswith("\n")
+
+    def _end_line(self):
+        if not self.at_line_start:
+            print()
+            self.at_line_start = True
+
+def print_compact_output(node, output, streamed=frozenset()):
+    """Prints the output in a compact, technical format, skipping messages whose tokens were already streamed."""
+    messages = (output or {}).get("messages", [])
+    if not messages or all(message.id in streamed for message in messages):
+        return
     print(f"\n[Node: {node}]")
     
-    if "messages" in output:
-        for message in output["messages"]:
+    if messages:
+        for message in messages:
+            if message.id in streamed:
+                continue
             if isinstance(message, AIMessage):
                 print_agent_answer(message.content)
                 if message.tool_calls:
@@ -57,6 +119,49 @@ def print_compact_output(node, output):
             elif isinstance(message, ToolMessage):
                 print_tool_result(message.name, message.content)
 
+def stream_turn(graph, user_input: str, config):
+    """Runs one turn of the conversation, printing tokens as they arrive and each node's result."""
+    renderer = StreamRenderer()
+    for mode, event in graph.stream({"messages": [HumanMessage(content=user_input)]}, config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            renderer.token(*event)
+            continue
+        renderer.finish()
+        for node, output in event.items():
+            print_compact_output(node, output, renderer.streamed)
+
+def run_turn(graph, user_input: str, config, profile: bool = False, profiler: tracing.ThreadProfiler = None):
+    """Runs `stream_turn` as one traced turn, optionally under cProfile, and prints its profile if asked to."""
+    with tracing.span("turn", tracing.TURN, input_chars=len(user_input)) as turn:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            stream_turn(graph, user_input, config)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    tracer = tracing.get_tracer()
+    if profile and tracer is not None:
+        print("\n" + tracing.format_breakdown(turn, tracer.children(turn)))
+
+def finish_tracing(args, profiler: tracing.ThreadProfiler = None):
+    """Writes the trace exports and the cProfile dump requested on the command line."""
+    tracer = tracing.get_tracer()
+    stats = profiler.stats() if profiler is not None else None
+    if stats is not None:
+        stats.dump_stats(args.profile_cprofile)
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        print(f"\n--- Hottest project functions (cProfile, all threads; full stats in {args.profile_cprofile}) ---")
+        print(tracing.format_hotspots(stats, project_root))
+    if tracer is None:
+        return
+    if args.trace_jsonl:
+        tracer.export_jsonl(args.trace_jsonl)
+        print(f"Spans appended to {args.trace_jsonl}.")
+    if args.trace_otlp:
+        tracer.export_otlp(args.trace_otlp)
+        print(f"Spans written to {args.trace_otlp} (OTLP/JSON).")
+
 def print_payload(messages_to_send):
     """Prints the full payload to be sent to the model."""
     print("\n--- Payload to be sent to the model ---")
@@ -76,6 +181,19 @@ Examples:
 
   # Execute a single command
   python3 interfaces/cli.py -c "What is the current directory?"
+
+  # Record a test sequence once, then replay it offline
+  python3 interfaces/cli.py --llm-cache record --test-sequence "list the files" "read README.md"
+  python3 interfaces/cli.py --llm-cache replay --test-sequence "list the files" "read README.md"
+  python3 interfaces/cli.py --llm-cache replay --test-sequence-file examples/file_operations_sequence.json
+
+  # Continue the previous conversation, or a given one
+  python3 interfaces/cli.py --resume
+  python3 interfaces/cli.py --resume cli-20250101-120000-1a2b3c
+
+  # Show where each turn's time goes, and export the spans
+  python3 interfaces/cli.py --profile -c "list the files"
+  python3 interfaces/cli.py --profile --profile-cprofile turn.prof --trace-otlp trace.json -c "list the files"
 """
     )
     parser.add_argument(
@@ -93,20 +211,80 @@ Examples:
         nargs='+',
         help="Execute a sequence of commands in a single session for testing."
     )
+    parser.add_argument(
+        '--test-sequence-file',
+        help="Execute the user messages of a recorded conversation (e.g. examples/*.json) as a test sequence."
+    )
+    parser.add_argument(
+        '--llm-cache',
+        choices=["record", "replay", "passthrough"],
+        help="Record model responses to the on-disk cache, replay recorded ones offline, or bypass the cache (default: llm_cache.mode in config.yaml)."
+    )
+    parser.add_argument(
+        '--checkpointer',
+        choices=BACKENDS,
+        help="Save the conversation in a SQLite database, so it can be resumed later, or keep it only in memory (default: checkpointer.backend in config.yaml)."
+    )
+    parser.add_argument(
+        '--resume',
+        nargs='?',
+        const=LAST_SESSION,
+        metavar='SESSION',
+        help="Continue a saved conversation, the most recent one by default, instead of starting a new one."
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="After each turn, print where its time went: model calls (with token counts), tools, graph nodes and checkpoints."
+    )
+    parser.add_argument(
+        '--profile-cprofile',
+        metavar='FILE',
+        help="Also run the turns under cProfile, save the stats to FILE and print the hottest functions of this project."
+    )
+    parser.add_argument(
+        '--trace-jsonl',
+        metavar='FILE',
+        help="Append the spans of the session to FILE as JSON lines."
+    )
+    parser.add_argument(
+        '--trace-otlp',
+        metavar='FILE',
+        help="Write the spans of the session to FILE as OTLP/JSON, for OpenTelemetry tools."
+    )
     args = parser.parse_args()
+    if args.test_sequence_file:
+        with open(args.test_sequence_file, "r") as f:
+            args.test_sequence = [m["content"] for m in json.load(f) if m.get("role") == "user"]
 
     load_dotenv(override=True);
 
     # --- Agent Assembly ---
     # This is now transparent and explicit, following the "Shared Core" approach.
     # Any interface can replicate this logic to get a fully-formed agent.
-    llm = get_model().bind_tools(TOOLS)
-    memory = MemorySaver()
-    graph = create_graph(llm, TOOLS, checkpointer=memory)
+    llm = get_model(cache_mode=args.llm_cache).bind_tools(TOOLS)
+    memory = get_checkpointer(args.checkpointer)
+    tracer = None
+    if args.profile or args.profile_cprofile or args.trace_jsonl or args.trace_otlp:
+        tracer = tracing.enable()
+    graph = create_graph(llm, TOOLS, checkpointer=tracing.TracingCheckpointer(memory) if tracer else memory)
     # --- End of Assembly ---
 
-    session_id = "default-session"
+    if args.resume:
+        session_id = args.resume
+        if session_id == LAST_SESSION:
+            session_id = memory.latest_thread(SESSION_PREFIX) if hasattr(memory, "latest_thread") else None
+        if not session_id or not memory.get({"configurable": {"thread_id": session_id}}):
+            print("No saved conversation to resume (the sqlite checkpointer saves them).")
+            return
+    else:
+        session_id = f"{SESSION_PREFIX}{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+    if hasattr(memory, "latest_thread"):
+        print(f"Session {session_id} (continue it later with --resume {session_id}).")
     config = {"configurable": {"thread_id": session_id}}
+    if tracer:
+        config["callbacks"] = [tracing.TracingCallbackHandler(tracer)]
+    profiler = tracing.ThreadProfiler() if args.profile_cprofile else None
 
     # Determine the initial message list
     current_state = memory.get(config)
@@ -114,11 +292,17 @@ Examples:
     
     if is_new_conversation:
         print("Starting a new conversation. Assembling system prompt...")
-        system_prompt = assemble_system_prompt()
-        initial_messages = [SystemMessage(content=system_prompt)]
+        initial_messages = [build_system_message()]
         graph.update_state(config, {"messages": initial_messages})
     else:
         initial_messages = []
+        # The saved system prompt describes the date, directory and files of when it was made;
+        # a fresh one with the same id replaces it.
+        messages = current_state["channel_values"].get("messages") or []
+        if messages and messages[0].type == "system":
+            system_message = build_system_message()
+            system_message.id = messages[0].id
+            graph.update_state(config, {"messages": [system_message]})
 
     # The checkpointer handles state. We simply send the new message.
     if args.test_sequence:
@@ -127,18 +311,14 @@ Examples:
             print(f"Step {i+1}: > {command}")
             print_input_footer()
             
-            for event in graph.stream({"messages": [HumanMessage(content=command)]}, config, stream_mode="updates"):
-                for node, output in event.items():
-                    print_compact_output(node, output)
+            run_turn(graph, command, config, args.profile, profiler)
 
     elif args.command:
         print_input_header()
         print(f"> {args.command}")
         print_input_footer()
         
-        for event in graph.stream({"messages": [HumanMessage(content=args.command)]}, config, stream_mode="updates"):
-            for node, output in event.items():
-                print_compact_output(node, output)
+        run_turn(graph, args.command, config, args.profile, profiler)
     else:
         print("Welcome to the interactive CLI agent. Type 'exit' or 'quit' to end the session.")
         
@@ -150,14 +330,13 @@ Examples:
                 if user_input.lower() in ["exit", "quit"]:
                     break
                 
-                for event in graph.stream({"messages": [HumanMessage(content=user_input)]}, config, stream_mode="updates"):
-                    for node, output in event.items():
-                        print_compact_output(node, output)
+                run_turn(graph, user_input, config, args.profile, profiler)
             except KeyboardInterrupt:
                 break
             except Exception as e:
                 print(f"An error occurred: {e}")
         print("\nExiting.")
+    finish_tracing(args, profiler)
 
 if __name__ == "__main__":
     main()
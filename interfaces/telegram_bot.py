@@ -12,7 +12,7 @@ from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
-from agent.factory import create_agent, get_initial_messages
+from agent.factory import aget_initial_messages, create_agent
 from langchain_core.messages import HumanMessage
 from telegramify_markdown import markdownify
 # Enable logging
@@ -44,9 +44,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     config = {"configurable": {"thread_id": str(chat_id)}}
 
     # Get the initial system prompt if it's a new conversation
-    initial_messages = get_initial_messages(memory, config)
+    initial_messages = await aget_initial_messages(memory, config)
     if initial_messages:
-        graph.update_state(config, {"messages": initial_messages})
+        await graph.aupdate_state(config, {"messages": initial_messages})
 
     # Stream the agent's response
     response_message = ""
@@ -91,6 +91,8 @@ def main() -> None:
     logger.info("Starting Telegram bot...")
     application.run_polling()
     logger.info("Telegram bot stopped.")
+    if hasattr(memory, "close"):
+        memory.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+import json
+import urllib.request
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import tool
+from langchain_openai import ChatOpenAI
+
+from benchmarks import e2e
+from benchmarks.stub_server import DEFAULT_RESPONSE, StubServer
+
+
+@tool
+def echo(text: str) -> str:
+    """Returns the text."""
+    return f"echo: {text}"
+
+
+SCRIPT = [
+    {"tool_calls": [{"name": "echo", "args": {"text": "a long enough argument to be streamed in pieces"}}]},
+    {"content": "All done, the echo worked as expected."},
+]
+
+
+@pytest.fixture
+def server():
+    with StubServer(SCRIPT) as server:
+        yield server
+
+
+def _model(server, **kwargs):
+    return ChatOpenAI(model="stub", api_key="stub", base_url=server.url, **kwargs).bind_tools([echo])
+
+
+def test_completion_with_tool_calls(server):
+    message = _model(server).invoke([HumanMessage(content="echo something")])
+
+    assert message.tool_calls[0]["name"] == "echo"
+    assert message.tool_calls[0]["args"] == {"text": "a long enough argument to be streamed in pieces"}
+    assert message.usage_metadata["total_tokens"] > 0
+    assert server.requests[0]["tools"][0]["function"]["name"] == "echo"
+
+
+def test_streamed_tool_call_arguments_arrive_in_pieces(server):
+    chunks = list(_model(server, stream_usage=True).stream([HumanMessage(content="echo something")]))
+    message = chunks[0]
+    for chunk in chunks[1:]:
+        message += chunk
+
+    assert sum(1 for chunk in chunks if chunk.tool_call_chunks) > 2
+    assert message.tool_calls[0]["args"] == {"text": "a long enough argument to be streamed in pieces"}
+    assert message.usage_metadata["output_tokens"] > 0
+
+
+def test_responses_follow_the_conversation(server):
+    first = _model(server).invoke([HumanMessage(content="echo something")])
+    history = [HumanMessage(content="echo something"), first,
+               {"role": "tool", "content": "echo: ...", "tool_call_id": first.tool_calls[0]["id"]}]
+
+    assert _model(server).invoke(history).content == SCRIPT[1]["content"]
+    # The same first request gets the same first answer, however many came before it.
+    assert _model(server).invoke([HumanMessage(content="again")]).tool_calls
+    assert _model(server).invoke(history + [{"role": "assistant", "content": "x"}] * 2).content == DEFAULT_RESPONSE["content"]
+
+
+def test_unknown_path_is_404(server):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(server.url.replace("/v1", "/nope"))
+    assert error.value.code == 404
+    with urllib.request.urlopen(f"{server.url}/models") as response:
+        assert json.load(response)["data"][0]["id"] == "stub"
+
+
+def test_get_model_points_at_the_stub(server):
+    from core.models import get_model
+
+    model = get_model(cache_mode="passthrough", base_url=server.url, api_key="stub")
+
+    assert model.openai_api_base == server.url
+    assert model.invoke([HumanMessage(content="hi")]).tool_calls
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_benchmark_plays_a_scripted_conversation(use_async):
+    scenario = {
+        "name": "echo",
+        "turns": [
+            {"user": "first", "responses": SCRIPT},
+            {"user": "second", "responses": [
+                {"tool_calls": [{"name": "echo", "args": {"text": "{root}"}}, {"name": "echo", "args": {"text": "b"}}]},
+                {"content": "Echoed twice."},
+            ]},
+        ],
+    }
+
+    results = e2e.run_benchmark([scenario], tools=[echo], repeat=2, warmup=1, use_async=use_async)
+
+    assert [(r.repeat, r.turn) for r in results] == [(1, 1), (1, 2), (2, 1), (2, 2)]
+    assert [r.model_requests for r in results] == [2, 2, 2, 2]
+    assert [r.tool_calls for r in results] == [1, 2, 1, 2]
+    assert all(r.tool_errors == 0 and r.wall_ms >= r.model_ms > 0 for r in results)
+    rows = e2e.summarize(results)
+    assert [(row["scenario"], row["turn"], row["repeats"]) for row in rows] == [("echo", 1, 2), ("echo", 2, 2)]
+    assert "overhead_ms" in e2e.format_table(rows)
+
+
+def test_benchmark_detects_a_conversation_off_script():
+    scenario = {"name": "short", "turns": [{"user": "hi", "responses": [SCRIPT[0]]}]}
+
+    with pytest.raises(RuntimeError, match="off script"):
+        e2e.run_benchmark([scenario], tools=[echo], repeat=1, warmup=0)
@@ -0,0 +1,90 @@
+import hashlib
+import os
+
+from benchmarks import synthetic_repo, tool_bench
+from benchmarks.synthetic_repo import RepoSpec
+
+SMALL = RepoSpec(files=120, depth=3, files_per_dir=10, max_file_bytes=2048, needle_fraction=0.2, large_file_bytes=64 * 1024)
+
+
+def _tree_digest(root):
+    digest = hashlib.sha256()
+    for directory, dirs, files in sorted(os.walk(root)):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            digest.update(os.path.relpath(path, root).encode())
+            if name != synthetic_repo.MANIFEST_NAME:
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def test_generation_is_deterministic(tmp_path):
+    first = synthetic_repo.generate(str(tmp_path / "a"), SMALL)
+    second = synthetic_repo.generate(str(tmp_path / "b"), SMALL)
+
+    assert _tree_digest(tmp_path / "a") == _tree_digest(tmp_path / "b")
+    assert {k: v for k, v in first.items() if k != "large_file"} == {k: v for k, v in second.items() if k != "large_file"}
+    synthetic_repo.generate(str(tmp_path / "c"), RepoSpec(**{**SMALL.__dict__, "seed": 1}))
+    assert _tree_digest(tmp_path / "a") != _tree_digest(tmp_path / "c")
+
+
+def test_generated_repository_follows_the_spec(tmp_path):
+    root = str(tmp_path / "repo")
+    manifest = synthetic_repo.generate(root, SMALL)
+
+    files = [os.path.join(d, f) for d, _, names in os.walk(root) for f in names]
+    generated = [f for f in files if os.path.basename(f) not in (synthetic_repo.MANIFEST_NAME, ".gitignore", "large.txt")]
+    assert len(generated) == SMALL.files == manifest["text_files"] + manifest["binary_files"]
+    assert max(os.path.relpath(f, root).count(os.sep) for f in generated if "node_modules" not in f and "build" not in f) <= SMALL.depth
+    ignored = [f for f in generated if os.path.relpath(f, root).split(os.sep)[0] in SMALL.ignored_dirs]
+    assert len(ignored) == manifest["ignored_files"] > 0
+    with open(os.path.join(root, ".gitignore")) as f:
+        assert f.read().split() == ["node_modules/", "build/"]
+    with open(manifest["large_file"]) as f:
+        assert f.read().count(synthetic_repo.REPLACE_MARKER) == 1
+
+
+def test_ensure_reuses_a_matching_repository(tmp_path):
+    root = str(tmp_path / "repo")
+    synthetic_repo.ensure(root, SMALL)
+    marker = os.path.join(root, "extra.txt")
+    open(marker, "w").close()
+
+    synthetic_repo.ensure(root, SMALL)
+    assert os.path.exists(marker)
+    synthetic_repo.ensure(root, RepoSpec(**{**SMALL.__dict__, "files": 10}))
+    assert not os.path.exists(marker)
+
+
+def test_compare_flags_results_over_the_threshold():
+    baseline = {"1k": {"glob": {"cold_ms": 10.0, "warm_ms": 10.0, "peak_kb": 1000}}}
+    fine = {"1k": {"glob": {"cold_ms": 19.0, "warm_ms": 4.0, "peak_kb": 1700}, "new_case": {"cold_ms": 1, "warm_ms": 1, "peak_kb": 1}}}
+    slow = {"1k": {"glob": {"cold_ms": 10.0, "warm_ms": 21.0, "peak_kb": 2000}}}
+
+    assert tool_bench.compare(fine, baseline, threshold=1.5) == []
+    regressions = tool_bench.compare(slow, baseline, threshold=1.5)
+    assert [line.split(":")[0] for line in regressions] == ["1k glob warm_ms", "1k glob peak_kb"]
+
+
+def test_run_measures_every_case(tmp_path, monkeypatch):
+    monkeypatch.setitem(tool_bench.SCALES, "tiny", SMALL.files)
+    overrides = {k: v for k, v in SMALL.__dict__.items() if k != "files"}
+    cwd = os.getcwd()
+
+    results = tool_bench.run(["tiny"], repeat=1, cold_repeat=1, work_dir=str(tmp_path), spec_overrides=overrides)
+
+    assert os.getcwd() == cwd
+    assert set(results["tiny"]) == {
+        "list_directory", "list_directory_tree", "glob", "glob_limit",
+        "search_literal", "search_regex", "read_many_files", "replace_large_file",
+    }
+    assert all(set(m) == set(tool_bench.METRICS) and m["warm_ms"] > 0 for m in results["tiny"].values())
+    large = [os.path.join(d, "large.txt") for d, _, names in os.walk(tmp_path) if "large.txt" in names][0]
+    with open(large) as f:
+        assert f.read().count(synthetic_repo.REPLACE_MARKER) == 1
+
+    baseline_path = str(tmp_path / "baseline.json")
+    tool_bench.save_baseline(baseline_path, results, repeat=1)
+    assert tool_bench.compare(results, tool_bench.load_baseline(baseline_path)) == []
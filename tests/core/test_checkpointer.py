@@ -0,0 +1,138 @@
+import asyncio
+import sqlite3
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent.graph import create_graph
+from core.checkpointer import SQLiteCheckpointer, get_checkpointer
+
+
+@tool
+def echo(text: str) -> str:
+    """Returns the text."""
+    return f"echo: {text}"
+
+
+class ScriptedLLM:
+    """Calls `echo` once per user message, then answers with the number of messages it saw."""
+
+    def invoke(self, messages, *args, **kwargs):
+        if isinstance(messages[-1], HumanMessage):
+            return AIMessage(content="", tool_calls=[{"id": f"call_{len(messages)}", "name": "echo", "args": {"text": messages[-1].content}}])
+        return AIMessage(content=f"seen {len(messages)}")
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        return self.invoke(messages)
+
+    def stream(self, messages, *args, **kwargs):
+        yield self.invoke(messages)
+
+    async def astream(self, messages, *args, **kwargs):
+        yield self.invoke(messages)
+
+
+def _graph(checkpointer):
+    return create_graph(ScriptedLLM(), [echo], checkpointer=checkpointer, context_settings={"max_tokens": 10**6})
+
+
+def _count(path, table):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_conversation_resumes_after_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = {"configurable": {"thread_id": "chat"}}
+    with SQLiteCheckpointer(path) as saver:
+        assert saver.get(config) is None
+        result = _graph(saver).invoke({"messages": [HumanMessage(content="one")]}, config)
+        assert result["messages"][-1].content == "seen 3"
+
+    with SQLiteCheckpointer(path) as saver:
+        graph = _graph(saver)
+        assert [m.content for m in graph.get_state(config).values["messages"]] == ["one", "", "echo: one", "seen 3"]
+        result = graph.invoke({"messages": [HumanMessage(content="two")]}, config)
+        assert result["messages"][-1].content == "seen 7"
+        assert saver.get_tuple({"configurable": {"thread_id": "other"}}) is None
+        assert saver.latest_thread() == "chat" and saver.latest_thread("cli-") is None
+
+
+def test_matches_memory_saver(tmp_path):
+    config = {"configurable": {"thread_id": "chat"}}
+    states = []
+    for saver in (MemorySaver(), SQLiteCheckpointer(str(tmp_path / "c.sqlite"), keep_checkpoints=100)):
+        graph = _graph(saver)
+        for text in ("one", "two"):
+            graph.invoke({"messages": [HumanMessage(content=text)]}, config)
+        history = list(graph.get_state_history(config))
+        states.append((
+            [m.content for m in graph.get_state(config).values["messages"]],
+            [(s.metadata["step"], s.next) for s in history],
+            [len(s.values.get("messages", [])) for s in history],
+        ))
+    assert states[0] == states[1]
+
+
+def test_old_checkpoints_are_pruned(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = {"configurable": {"thread_id": "chat"}}
+    with SQLiteCheckpointer(path, keep_checkpoints=3) as saver:
+        graph = _graph(saver)
+        for i in range(5):
+            graph.invoke({"messages": [HumanMessage(content=str(i))]}, config)
+        assert len(list(saver.list(config))) == 3
+        assert len(list(saver.list(config, limit=2))) == 2
+        assert [t.metadata["step"] for t in saver.list(config, filter={"source": "loop"})] == [33, 32, 31]
+        assert list(saver.list(config, filter={"source": "input"})) == []
+        latest = saver.get_tuple(config)
+        assert len(latest.checkpoint["channel_values"]["messages"]) == 20
+        # Only the channel values the kept checkpoints refer to remain.
+        assert _count(path, "checkpoints") == 3
+        assert _count(path, "blobs") <= 3 * len(latest.checkpoint["channel_versions"])
+
+        saver.delete_thread("chat")
+        assert saver.get_tuple(config) is None
+        assert _count(path, "checkpoints") == _count(path, "blobs") == _count(path, "writes") == 0
+
+
+def test_hot_threads_are_bounded(tmp_path):
+    with SQLiteCheckpointer(str(tmp_path / "c.sqlite"), hot_threads=3) as saver:
+        graph = _graph(saver)
+        for chat in range(10):
+            graph.invoke({"messages": [HumanMessage(content="hi")]}, {"configurable": {"thread_id": str(chat)}})
+        assert saver.hot_thread_count() == 3
+        # Evicted threads are read back from the database.
+        assert saver.get_tuple({"configurable": {"thread_id": "0"}}).checkpoint["channel_values"]["messages"][-1].content == "seen 3"
+        saver.idle_seconds = 0
+        assert saver.hot_thread_count() == 0
+
+
+def test_async_graph(tmp_path):
+    config = {"configurable": {"thread_id": "chat"}}
+
+    async def run(saver):
+        graph = _graph(saver)
+        async for _ in graph.astream({"messages": [HumanMessage(content="one")]}, config, stream_mode="values"):
+            pass
+        return [t async for t in saver.alist(config)], await saver.aget_tuple(config)
+
+    with SQLiteCheckpointer(str(tmp_path / "c.sqlite")) as saver:
+        history, latest = asyncio.run(run(saver))
+    assert len(history) == 4 and history[0].config == latest.config
+    assert latest.checkpoint["channel_values"]["messages"][-1].content == "seen 3"
+
+
+def test_get_checkpointer_selects_the_backend(tmp_path, monkeypatch):
+    monkeypatch.delenv("CHECKPOINTER", raising=False)
+    settings = {"backend": "sqlite", "path": str(tmp_path / "c.sqlite"), "hot_threads": 5}
+    saver = get_checkpointer(settings=settings)
+    assert isinstance(saver, SQLiteCheckpointer) and saver.hot_threads == 5
+    saver.close()
+    assert isinstance(get_checkpointer("memory", settings), MemorySaver)
+    monkeypatch.setenv("CHECKPOINTER", "memory")
+    assert isinstance(get_checkpointer(settings=settings), MemorySaver)
+    with pytest.raises(ValueError):
+        get_checkpointer("redis", settings)
@@ -0,0 +1,106 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+
+from core.llm_cache import CacheMiss, CachedChatModel, ResponseStore
+
+
+@tool
+def lookup(query: str) -> str:
+    """Looks something up."""
+    return query
+
+
+class CountingModel(BaseChatModel):
+    """A model that answers with a tool call and counts how often it was asked."""
+
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "counting"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        message = AIMessage(content=f"answer {self.calls}", tool_calls=[{"id": f"call_{self.calls}", "name": "lookup", "args": {"query": "x"}}])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[t.name for t in tools], **kwargs)
+
+
+def _cached(tmp_path, mode, inner=None, max_bytes=10**9):
+    return CachedChatModel(model=inner or CountingModel(), store=ResponseStore(str(tmp_path), max_bytes), mode=mode)
+
+
+def test_record_then_replay(tmp_path):
+    inner = CountingModel()
+    recorder = _cached(tmp_path, "record", inner).bind_tools([lookup])
+    first = recorder.invoke([HumanMessage(content="hi")])
+    assert recorder.invoke([HumanMessage(content="hi")]).content == first.content
+    assert inner.calls == 1
+
+    replayer = _cached(tmp_path, "replay").bind_tools([lookup])
+    replayed = [chunk for chunk in replayer.stream([HumanMessage(content="hi")])]
+    assert len(replayed) == 1
+    assert replayed[0].tool_calls == first.tool_calls
+    with pytest.raises(CacheMiss):
+        replayer.invoke([HumanMessage(content="something new")])
+    # Bound tools are part of the key.
+    with pytest.raises(CacheMiss):
+        _cached(tmp_path, "replay").invoke([HumanMessage(content="hi")])
+
+
+def test_key_ignores_run_specific_details(tmp_path):
+    model = _cached(tmp_path, "replay")
+
+    def history(context, pgid, message_id):
+        return [
+            SystemMessage(content=[{"type": "text", "text": "stable"}, {"type": "text", "text": context}]),
+            HumanMessage(content="run ls", id=message_id),
+            AIMessage(content="", tool_calls=[{"id": "c1", "name": "run_shell_command", "args": {"command": "ls"}}]),
+            ToolMessage(content=f"Stdout: a.txt\nProcess Group PGID: {pgid}\nResources: wall 0.0{pgid % 10}s", tool_call_id="c1"),
+        ]
+
+    assert model.request_key(history("Date: 2025-01-01", 123, "a")) == model.request_key(history("Date: 2025-02-02", 456, "b"))
+    assert model.request_key(history("x", 1, "a")) != model.request_key(history("x", 1, "a")[:2])
+
+
+def test_passthrough_does_not_store(tmp_path):
+    inner = CountingModel()
+    model = _cached(tmp_path, "passthrough", inner)
+    model.invoke([HumanMessage(content="hi")])
+    model.invoke([HumanMessage(content="hi")])
+    assert inner.calls == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = ResponseStore(str(tmp_path), max_bytes=1500)
+    for i in range(5):
+        store.put(f"{i:064x}", AIMessage(content="x" * 200))
+        os.utime(store._path(f"{i:064x}"), (i, i))
+    assert store.get(f"{0:064x}") is None
+    assert store.get(f"{4:064x}").content == "x" * 200
+
+
+def test_store_scans_the_cache_only_when_over_budget(tmp_path, monkeypatch):
+    ResponseStore(str(tmp_path)).put("a" * 64, AIMessage(content="x" * 200))
+    store = ResponseStore(str(tmp_path), max_bytes=2100)
+    scans = []
+    entries = store._entries
+    monkeypatch.setattr(store, "_entries", lambda: scans.append(1) or entries())
+    for i in range(3):
+        store.put(f"{i:064x}", AIMessage(content="x" * 200))
+    store.put(f"{0:064x}", AIMessage(content="y" * 200))
+    # One scan counts what earlier runs left; overwriting an entry does not grow the total.
+    assert len(scans) == 1 and store._total == sum(e[1] for e in entries())
+    for i in range(3, 6):
+        store.put(f"{i:064x}", AIMessage(content="x" * 200))
+    assert len(scans) > 1 and store._total <= 2100
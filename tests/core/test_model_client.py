@@ -0,0 +1,134 @@
+import asyncio
+import socket
+import threading
+import time
+
+import openai
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+from benchmarks.stub_server import StubServer
+from core import models
+from core.model_client import FailoverChatModel, http_clients, http_timeout
+
+HTTP = {"connect_timeout": 1, "read_timeout": 5}
+
+
+def _model(url, **kwargs):
+    sync_client, async_client = http_clients(HTTP)
+    return ChatOpenAI(model="stub", api_key="stub", base_url=url, http_client=sync_client,
+                      http_async_client=async_client, timeout=http_timeout(HTTP), max_retries=0, **kwargs)
+
+
+def _closed_port_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}/v1"
+
+
+@pytest.fixture
+def servers():
+    with StubServer([{"content": "from primary"}]) as primary, StubServer([{"content": "from fallback"}]) as fallback:
+        yield primary, fallback
+
+
+def test_http_clients_are_shared_per_settings():
+    assert http_clients(HTTP) is http_clients(dict(HTTP))
+    assert http_clients(HTTP)[0] is not http_clients({"read_timeout": 1})[0]
+    timeout = http_timeout(HTTP)
+    assert (timeout.connect, timeout.read, timeout.write) == (1, 5, 30.0)
+
+
+def test_fails_over_and_cools_down(servers):
+    primary, fallback = servers
+    primary.fail_status = 503
+    model = FailoverChatModel(models=[_model(primary.url), _model(fallback.url)])
+
+    assert model.invoke([HumanMessage(content="hi")]).content == "from fallback"
+    assert "".join(c.content for c in model.stream([HumanMessage(content="hi")])) == "from fallback"
+    # The failed endpoint is now tried last.
+    assert (len(primary.requests), len(fallback.requests)) == (1, 2)
+
+    unreachable = FailoverChatModel(models=[_model(_closed_port_url()), _model(fallback.url)])
+    assert unreachable.invoke([HumanMessage(content="hi")]).content == "from fallback"
+
+
+def test_client_errors_are_not_failed_over(servers):
+    primary, fallback = servers
+    primary.fail_status = 400
+    model = FailoverChatModel(models=[_model(primary.url), _model(fallback.url)])
+
+    with pytest.raises(openai.BadRequestError):
+        model.invoke([HumanMessage(content="hi")])
+    assert fallback.requests == []
+    fallback.fail_status = 500
+    with pytest.raises(openai.InternalServerError):
+        FailoverChatModel(models=[_model(fallback.url)]).invoke([HumanMessage(content="hi")])
+
+
+def test_slow_requests_are_hedged(servers):
+    primary, fallback = servers
+    model = FailoverChatModel(models=[_model(primary.url), _model(fallback.url)],
+                              hedge_percentile=90, hedge_min_samples=5, hedge_min_delay=0.05)
+    assert model.hedge_delay() is None
+    for _ in range(5):
+        assert model.invoke([HumanMessage(content="hi")]).content == "from primary"
+    # Never below the floor; a collector pause in one sample may lift it above.
+    assert 0.05 <= model.hedge_delay() < 0.5
+
+    primary.first_token_latency = 1.0
+    started = time.monotonic()
+    assert "".join(c.content for c in model.stream([HumanMessage(content="hi")])) == "from fallback"
+    assert model.invoke([HumanMessage(content="hi")]).content == "from fallback"
+    assert time.monotonic() - started < 1.0
+    assert len(fallback.requests) == 2
+
+
+def test_abandoned_hedged_request_releases_its_connection(servers):
+    primary, fallback = servers
+    primary.first_token_latency = 3.0
+    model = FailoverChatModel(models=[_model(primary.url), _model(fallback.url)],
+                              hedge_percentile=50, hedge_min_samples=1, hedge_min_delay=0.05)
+    model._answered(0, 0.01)
+    assert "".join(c.content for c in model.stream([HumanMessage(content="hi")])) == "from fallback"
+    # The losing request was reading a stalled stream; it does not wait for the next chunk.
+    deadline = time.monotonic() + 1.0
+    while any(t.name == "model-request-0" for t in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not any(t.name == "model-request-0" for t in threading.enumerate())
+
+
+def test_async_failover_and_hedging(servers):
+    primary, fallback = servers
+    primary.fail_status = 502
+    model = FailoverChatModel(models=[_model(primary.url), _model(fallback.url)])
+
+    async def collect(model):
+        return "".join([c.content async for c in model.astream([HumanMessage(content="hi")])])
+
+    assert asyncio.run(model.ainvoke([HumanMessage(content="hi")])).content == "from fallback"
+    assert asyncio.run(collect(model)) == "from fallback"
+
+    primary.fail_status = None
+    primary.first_token_latency = 1.0
+    hedged = FailoverChatModel(models=[_model(primary.url), _model(fallback.url)],
+                               hedge_percentile=50, hedge_min_samples=1, hedge_min_delay=0.05)
+    hedged._answered(0, 0.01)
+    started = time.monotonic()
+    assert asyncio.run(collect(hedged)) == "from fallback"
+    assert time.monotonic() - started < 1.0
+
+
+def test_get_model_fallbacks_follow_the_base_url_override(servers, monkeypatch):
+    primary, fallback = servers
+    primary.fail_status = 503
+    settings = {**models.config["model_settings"], "base_url": _closed_port_url(), "http": HTTP,
+                "fallbacks": [{"model_name": "other"}, {"model_name": "last", "base_url": fallback.url}]}
+    monkeypatch.setitem(models.config, "model_settings", settings)
+    model = models.get_model(cache_mode="passthrough", base_url=primary.url, api_key="stub")
+
+    assert model.invoke([HumanMessage(content="hi")]).content == "from fallback"
+    # The fallback without its own endpoint went to the override, not to the configured URL.
+    assert [r["model"] for r in primary.requests] == [settings["model_name"], "other"]
+    assert [r["model"] for r in fallback.requests] == ["last"]
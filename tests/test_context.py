@@ -0,0 +1,71 @@
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+import pytest
+from langgraph.graph.message import add_messages
+
+from agent import context
+from agent.context import SUMMARY_PREFIX, ContextWindow
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    # Four characters per token, whether or not tiktoken's tables can be loaded here.
+    monkeypatch.setattr(context, "_encoding", lambda name: None)
+
+def _turn(i, output_size):
+    return [
+        HumanMessage(content=f"question {i}", id=f"h{i}"),
+        AIMessage(content="", id=f"a{i}", tool_calls=[{"id": f"call{i}", "name": "read_file", "args": {"path": f"/f{i}"}}]),
+        ToolMessage(content="x" * output_size, id=f"t{i}", tool_call_id=f"call{i}", name="read_file"),
+        AIMessage(content=f"answer {i}", id=f"r{i}"),
+    ]
+
+def _history(turns, output_size):
+    return [SystemMessage(content="system prompt", id="s")] + [m for i in range(turns) for m in _turn(i, output_size)]
+
+def _check_pairing(messages):
+    pending = set()
+    for message in messages:
+        if isinstance(message, AIMessage):
+            assert not pending
+            pending = {call["id"] for call in message.tool_calls}
+        elif isinstance(message, ToolMessage):
+            pending.remove(message.tool_call_id)
+
+def test_under_budget_is_left_alone():
+    window = ContextWindow(max_tokens=10_000)
+    assert window.compact(_history(3, 100)) == []
+
+def test_old_tool_outputs_are_elided_first():
+    window = ContextWindow(max_tokens=3_000, keep_recent_turns=1, tool_output_max_tokens=100)
+    messages = _history(3, 8_000)
+    updates = window.compact(messages, summarize=lambda old: "should not be needed")
+    assert [m.id for m in updates] == ["t0", "t1"]
+    assert all("elided to fit the context budget" in m.content for m in updates)
+    result = add_messages(messages, updates)
+    assert result[-2].content == "x" * 8_000
+    assert window.total(result) <= 3_000
+    _check_pairing(result)
+
+def test_older_turns_are_summarized_in_place():
+    window = ContextWindow(max_tokens=200, keep_recent_turns=1, tool_output_max_tokens=20)
+    messages = _history(4, 200)
+    seen = []
+    updates = window.compact(messages, summarize=lambda old: seen.extend(old) or "they asked three questions")
+    assert [m.id for m in seen] == [m.id for m in messages[1:13]]
+    result = add_messages(messages, updates)
+    assert [m.id for m in result] == ["s", "h0", "h3", "a3", "t3", "r3"]
+    assert result[1].content == SUMMARY_PREFIX + "they asked three questions"
+    assert sum(isinstance(m, RemoveMessage) for m in updates) == 11
+    _check_pairing(result)
+
+def test_summary_falls_back_to_a_note():
+    window = ContextWindow(max_tokens=100, keep_recent_turns=1, tool_output_max_tokens=20)
+    result = add_messages(_history(2, 100), window.compact(_history(2, 100)))
+    assert result[1].content == SUMMARY_PREFIX + "[4 earlier messages were removed to fit the context budget.]"
+
+def test_failed_summary_is_logged(caplog):
+    def summarize(old):
+        raise RuntimeError("model unavailable")
+    window = ContextWindow(max_tokens=100, keep_recent_turns=1, tool_output_max_tokens=20)
+    result = add_messages(_history(2, 100), window.compact(_history(2, 100), summarize))
+    assert result[1].content == SUMMARY_PREFIX + "[4 earlier messages were removed to fit the context budget.]"
+    assert "Could not summarize the earlier conversation: model unavailable" in caplog.text
@@ -20,7 +20,7 @@ def test_graph_with_tool_call():
     Tests that the graph correctly calls a tool and returns the result.
     """
     # 1. Define a mock LLM that returns a canned response.
-    # This is a simple function that mimics the behavior of an LLM's invoke method.
+    # This is a simple function that mimics the behavior of an LLM's stream method, in a single chunk.
     def mock_llm(messages, *args, **kwargs):
         # The first time it's called, it returns a tool call.
         # The second time, it returns a final answer.
@@ -40,7 +40,7 @@ def test_graph_with_tool_call():
 
     # 2. Create the graph with the placeholder tool and the mock LLM
     tools = [placeholder_shell_tool]
-    mock_llm_instance = type("MockLLM", (), {"invoke": staticmethod(mock_llm)})()
+    mock_llm_instance = type("MockLLM", (), {"stream": staticmethod(lambda messages, *args, **kwargs: iter([mock_llm(messages)]))})()
     graph = create_graph(mock_llm_instance, tools)
 
     # 3. Invoke the graph
@@ -59,4 +59,100 @@ def test_graph_with_tool_call():
 
     # Check the final AI message
     final_message = messages[3]
-    assert final_message.content == "Done."
\ No newline at end of file
+    assert final_message.content == "Done."
+
+def test_graph_uses_async_llm_with_astream():
+    """
+    Tests that `astream` runs the model through `astream`.
+    """
+    import asyncio
+
+    class MockLLM:
+        def stream(self, messages, *args, **kwargs):
+            raise AssertionError("the async path must not call stream")
+
+        async def astream(self, messages, *args, **kwargs):
+            if len(messages) == 1:
+                yield AIMessage(
+                    content="",
+                    tool_calls=[{"id": "tool_call_1", "name": "placeholder_shell_tool", "args": {"command": "pwd"}}],
+                )
+            else:
+                yield AIMessage(content="Done.")
+
+    graph = create_graph(MockLLM(), [placeholder_shell_tool])
+
+    async def run():
+        states = [state async for state in graph.astream({"messages": [HumanMessage(content="pwd")]}, stream_mode="values")]
+        return states[-1]["messages"]
+
+    messages = asyncio.run(run())
+    assert [type(m) for m in messages] == [HumanMessage, AIMessage, ToolMessage, AIMessage]
+    assert messages[2].content == "output of 'pwd'"
+
+
+def test_agent_node_streams_tokens_and_stores_complete_message():
+    """
+    Tests that model tokens reach the "messages" stream mode while the state gets one complete AIMessage.
+    """
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import AIMessageChunk, ToolCallChunk
+    from langchain_core.outputs import ChatGenerationChunk
+
+    class StreamingLLM(BaseChatModel):
+        @property
+        def _llm_type(self):
+            return "streaming-test"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            raise NotImplementedError
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            if len(messages) == 1:
+                yield ChatGenerationChunk(message=AIMessageChunk(content="Checking."))
+                for i, part in enumerate(['{"comm', 'and": "ls"}']):
+                    yield ChatGenerationChunk(message=AIMessageChunk(
+                        content="",
+                        tool_call_chunks=[ToolCallChunk(name="placeholder_shell_tool" if i == 0 else None, args=part, id="call_1" if i == 0 else None, index=0)],
+                    ))
+            else:
+                for word in ["Do", "ne."]:
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    graph = create_graph(StreamingLLM(), [placeholder_shell_tool])
+    chunks = []
+    final = None
+    for mode, event in graph.stream({"messages": [HumanMessage(content="ls")]}, stream_mode=["messages", "values"]):
+        if mode == "messages" and isinstance(event[0], AIMessageChunk):
+            chunks.append(event[0])
+        elif mode == "values":
+            final = event
+
+    assert [chunk.content for chunk in chunks if chunk.content] == ["Checking.", "Do", "ne."]
+    assert [c["args"] for chunk in chunks for c in chunk.tool_call_chunks] == ['{"comm', 'and": "ls"}']
+    messages = final["messages"]
+    assert type(messages[1]) is AIMessage
+    assert messages[1].tool_calls == [{"name": "placeholder_shell_tool", "args": {"command": "ls"}, "id": "call_1", "type": "tool_call"}]
+    assert messages[2].content == "output of 'ls'"
+    assert type(messages[3]) is AIMessage and messages[3].content == "Done."
+
+
+def test_empty_stream_gives_an_empty_answer():
+    """
+    Tests that a model that streams no chunks ends the turn with an empty AIMessage.
+    """
+    import asyncio
+
+    class SilentLLM:
+        def stream(self, messages, *args, **kwargs):
+            return iter(())
+
+        async def astream(self, messages, *args, **kwargs):
+            return
+            yield
+
+    graph = create_graph(SilentLLM(), [placeholder_shell_tool])
+    messages = graph.invoke({"messages": [HumanMessage(content="hi")]})["messages"]
+    assert type(messages[-1]) is AIMessage and messages[-1].content == ""
+    messages = asyncio.run(graph.ainvoke({"messages": [HumanMessage(content="hi")]}))["messages"]
+    assert type(messages[-1]) is AIMessage and messages[-1].content == ""
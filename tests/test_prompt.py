@@ -0,0 +1,44 @@
+import os
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agent import prompt
+from core.models import CachingChatOpenAI
+
+def test_placeholders_move_to_the_volatile_part(tmp_path):
+    (tmp_path / "01_identity.md").write_text("You are an agent.\n")
+    (tmp_path / "02_context.md").write_text("Date: {{date}}\n")
+    (tmp_path / "03_reminder.md").write_text("Be concise.\n")
+    assert prompt.compile_template(str(tmp_path)) == ("You are an agent.\n\nBe concise.", "Date: {{date}}")
+
+def test_template_is_cached_until_a_component_changes(tmp_path, monkeypatch):
+    component = tmp_path / "01_identity.md"
+    component.write_text("first")
+    assert prompt.compile_template(str(tmp_path))[0] == "first"
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda *args, **kwargs: opened.append(args[0]) or real_open(*args, **kwargs))
+    assert prompt.compile_template(str(tmp_path))[0] == "first"
+    assert opened == []
+    component.write_text("second version")
+    os.utime(component, ns=(0, 10**9))
+    assert prompt.compile_template(str(tmp_path))[0] == "second version"
+
+def test_system_prompt_prefix_is_stable(monkeypatch):
+    monkeypatch.setattr(prompt, "read_memory", lambda: ["likes tea"])
+    monkeypatch.setattr(prompt, "_directory_listing", lambda cwd: "(listing)")
+    first = prompt.build_system_message()
+    monkeypatch.setattr(prompt, "read_memory", lambda: ["likes coffee"])
+    second = prompt.build_system_message()
+    assert first.content[0] == second.content[0]
+    assert "{{" not in first.content[0]["text"]
+    assert second.content[1]["text"].endswith("# User-Specific Memory\n- likes coffee")
+
+def test_cache_control_marks_the_prefix():
+    llm = CachingChatOpenAI(model="test", api_key="test")
+    system = SystemMessage(content=[{"type": "text", "text": "stable"}, {"type": "text", "text": "volatile"}])
+    payload = llm._get_request_payload([system, HumanMessage(content="hi")])
+    assert payload["messages"][0]["content"] == [
+        {"type": "text", "text": "stable", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "volatile"},
+    ]
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+from agent.tool_node import ConflictAwareToolNode, dependencies
+
+events = []
+events_lock = threading.Lock()
+
+@tool
+def read_file(absolute_path: str = None, path: str = None) -> str:
+    """Pretends to read a file slowly."""
+    time.sleep(0.3)
+    return f"read {path}"
+
+@tool
+def write_file(file_path: str, content: str) -> str:
+    """Records the order of writes."""
+    with events_lock:
+        events.append(("start", content))
+    time.sleep(0.1)
+    with events_lock:
+        events.append(("end", content))
+    return f"wrote {content}"
+
+def _call(i, name, **args):
+    return {"id": f"call_{i}", "name": name, "args": args}
+
+def _state(*calls):
+    return {"messages": [HumanMessage(content="go"), AIMessage(content="", tool_calls=list(calls))]}
+
+def test_dependencies():
+    calls = [
+        _call(0, "read_file", absolute_path="/repo/a.py"),
+        _call(1, "read_file", absolute_path="/repo/b.py"),
+        _call(2, "write_file", file_path="/repo/a.py"),
+        _call(3, "glob", pattern="*.py", path="/repo/sub"),
+        _call(4, "google_web_search", query="x"),
+        _call(5, "run_shell_command", command="make"),
+        _call(6, "read_many_files", paths=["/repo/a*.py"]),
+    ]
+    assert dependencies(calls) == [set(), set(), {0}, set(), set(), {0, 1, 2, 3}, {2, 5}]
+
+def test_read_file_waits_only_for_writes_to_its_file():
+    calls = [
+        _call(0, "write_file", file_path="/repo/a.py"),
+        _call(1, "read_file", absolute_path="/repo/b.py"),
+        _call(2, "read_file", absolute_path="/repo/a.py"),
+    ]
+    assert dependencies(calls) == [set(), set(), {0}]
+
+def test_independent_reads_run_in_parallel_and_keep_order():
+    node = ConflictAwareToolNode([read_file])
+    start = time.monotonic()
+    result = node.invoke(_state(*(_call(i, "read_file", path=f"/repo/{i}.py") for i in range(5))))
+    assert time.monotonic() - start < 1.0
+    assert [m.content for m in result["messages"]] == [f"read /repo/{i}.py" for i in range(5)]
+    assert [m.tool_call_id for m in result["messages"]] == [f"call_{i}" for i in range(5)]
+
+def test_writes_to_the_same_file_are_serialized():
+    events.clear()
+    node = ConflictAwareToolNode([write_file])
+    result = node.invoke(_state(*(_call(i, "write_file", file_path="/repo/a.py", content=str(i)) for i in range(3))))
+    assert events == [(kind, str(i)) for i in range(3) for kind in ("start", "end")]
+    assert [m.content for m in result["messages"]] == ["wrote 0", "wrote 1", "wrote 2"]
+
+def test_unknown_tool_is_reported_in_place():
+    node = ConflictAwareToolNode([read_file])
+    result = node.invoke(_state(_call(0, "missing_tool"), _call(1, "read_file", path="/x")))
+    assert result["messages"][0].status == "error"
+    assert result["messages"][1].content == "read /x"
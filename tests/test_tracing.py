@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.tools import tool
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
+
+from agent import tracing
+from agent.graph import create_graph
+from benchmarks.stub_server import StubServer
+
+
+@tool
+def echo(text: str) -> str:
+    """Returns the text."""
+    return f"echo: {text}"
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.enable()
+    yield tracer
+    tracing.disable()
+
+
+def test_span_is_a_noop_without_a_tracer():
+    tracing.disable()
+    with tracing.span("anything", tracing.PROMPT) as span:
+        span.set(size=1)
+    assert tracing.get_tracer() is None
+
+
+def test_spans_nest_and_record_errors(tracer):
+    with tracing.span("turn", tracing.TURN) as turn:
+        with tracing.span("inner", tracing.PROMPT, size=3):
+            pass
+        with pytest.raises(ValueError):
+            with tracing.span("failing", tracing.CHECKPOINT):
+                raise ValueError("boom")
+
+    inner, failing = tracer.children(turn)
+    assert (inner.name, inner.parent_id, inner.trace_id, inner.attributes) == ("inner", turn.span_id, turn.trace_id, {"size": 3})
+    assert failing.error == "ValueError: boom"
+    with tracing.span("next", tracing.TURN) as other:
+        pass
+    assert other.trace_id != turn.trace_id and other.parent_id is None
+
+
+def test_graph_turn_is_traced(tracer, tmp_path):
+    script = [
+        {"tool_calls": [{"name": "echo", "args": {"text": "a"}}, {"name": "echo", "args": {"text": "bb"}}]},
+        {"content": "Echoed both."},
+    ]
+    with StubServer(script) as server:
+        llm = ChatOpenAI(model="stub", api_key="stub", base_url=server.url, stream_usage=True).bind_tools([echo])
+        graph = create_graph(llm, [echo], checkpointer=tracing.TracingCheckpointer(MemorySaver()))
+        config = {"configurable": {"thread_id": "t"}, "callbacks": [tracing.TracingCallbackHandler(tracer)]}
+        graph.update_state(config, {"messages": [SystemMessage(content="You are a test.")]})
+        with tracing.span("turn", tracing.TURN) as turn:
+            for _ in graph.stream({"messages": [HumanMessage(content="echo a and bb")]}, config, stream_mode=["messages", "updates"]):
+                pass
+
+    spans = tracer.children(turn)
+    kinds = [s.kind for s in spans]
+    assert kinds.count(tracing.GRAPH) == 1
+    assert [s.name for s in spans if s.kind == tracing.NODE] == ["context", "agent", "tools", "context", "agent"]
+    models = [s for s in spans if s.kind == tracing.MODEL]
+    assert len(models) == 2
+    assert all(m.attributes["prompt_tokens"] > 0 and m.attributes["completion_tokens"] > 0 for m in models)
+    assert all(0 <= m.attributes["time_to_first_token_ms"] <= m.duration_ms for m in models)
+    assert models[0].attributes["tool_calls"] == 2 and models[0].attributes["model"] == "stub"
+    tools = sorted((s for s in spans if s.kind == tracing.TOOL), key=lambda s: s.attributes["result_chars"])
+    assert [(t.name, t.attributes["result_chars"]) for t in tools] == [("echo", len("echo: a")), ("echo", len("echo: bb"))]
+    nodes = {s.span_id: s.name for s in spans if s.kind == tracing.NODE}
+    assert all(nodes[t.parent_id] == "tools" for t in tools)
+    assert {s.name for s in spans if s.kind == tracing.CHECKPOINT} >= {"checkpoint.get", "checkpoint.put", "checkpoint.put_writes"}
+
+    breakdown = tracing.format_breakdown(turn, spans)
+    assert "model       2 call(s)" in breakdown and "echo x2" in breakdown and "checkpoint" in breakdown
+
+    jsonl = tmp_path / "spans.jsonl"
+    tracer.export_jsonl(str(jsonl))
+    lines = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert len(lines) == len(tracer.spans) and {"turn", "echo", "chat_model"} <= {line["name"] for line in lines}
+
+    otlp = tracer.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root = next(s for s in otlp if s["name"] == "turn" and s["spanId"] == turn.span_id)
+    assert "parentSpanId" not in root and len(root["traceId"]) == 32 and len(root["spanId"]) == 16
+    model = next(s for s in otlp if s["name"] == "chat_model")
+    attributes = {a["key"]: a["value"] for a in model["attributes"]}
+    assert model["kind"] == 3 and model["status"] == {"code": 1}
+    assert int(attributes["prompt_tokens"]["intValue"]) > 0
+
+
+def test_tracing_checkpointer_forgets_finished_turns(tracer):
+    saver = tracing.TracingCheckpointer(MemorySaver())
+    for thread_id in ("a", "b", "c"):
+        with tracing.span("turn", tracing.TURN) as turn:
+            saver.get_tuple({"configurable": {"thread_id": thread_id}})
+    assert list(saver._turn_spans) == ["c"]
+    saver.get_tuple({"configurable": {"thread_id": "c"}})
+    assert saver._turn_spans == {}
+    # A late write of the last turn is still attributed to it.
+    assert tracer.children(turn)[-1].parent_id == turn.span_id
+
+
+def test_thread_profiler_covers_new_threads():
+    def work():
+        return sum(i * i for i in range(20000))
+
+    profiler = tracing.ThreadProfiler()
+    profiler.enable()
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    profiler.disable()
+
+    stats = profiler.stats()
+    assert any(function == "work" for _, _, function in stats.stats)
+    hotspots = tracing.format_hotspots(stats, os.path.dirname(__file__))
+    assert "test_tracing.py" in hotspots and "~" not in hotspots
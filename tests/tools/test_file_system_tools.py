@@ -137,3 +137,24 @@ def test_glob_non_existent_dir():
     assert glob.invoke({"pattern": "*", "path": "non_existent_dir"}) == expected_output
 
 
+
+def test_list_directory_pagination_and_sort(tmp_path):
+    for i, size in enumerate([3, 1, 2]):
+        (tmp_path / f"f{i}.txt").write_text("x" * size)
+    (tmp_path / "sub").mkdir()
+    result = list_directory.invoke({"path": str(tmp_path), "sort": "size", "ignore": ["sub"], "limit": 2})
+    assert result == f"Directory listing for {tmp_path}:\nf0.txt\nf2.txt\n\n(Showing entries 1-2 of 3. Use offset/limit to see more.)"
+    result = list_directory.invoke({"path": str(tmp_path), "sort": "type", "offset": 1, "limit": 2})
+    assert result == f"Directory listing for {tmp_path}:\nf0.txt\nf1.txt\n\n(Showing entries 2-3 of 4. Use offset/limit to see more.)"
+
+def test_list_directory_tree_collapses_large_directories(tmp_path, monkeypatch):
+    from agent.tools import file_system
+    monkeypatch.setattr(file_system, "TREE_COLLAPSE_ENTRIES", 2)
+    (tmp_path / "small").mkdir()
+    (tmp_path / "small" / "a.txt").write_text("a")
+    (tmp_path / "big").mkdir()
+    for i in range(3):
+        (tmp_path / "big" / f"{i}.txt").write_text("x")
+    (tmp_path / "top.txt").write_text("t")
+    result = list_directory.invoke({"path": str(tmp_path), "tree": True})
+    assert result == f"Directory tree for {tmp_path}:\n[DIR] big/ (3 files, 0 directories)\n[DIR] small/\n  a.txt\ntop.txt"
@@ -0,0 +1,70 @@
+import os
+from agent.tools import file_copy
+from agent.tools.file_system import concat_files, copy_file, extract_lines, move_file
+
+def test_copy_file_binary_and_mode(tmp_path):
+    src = tmp_path / "a.bin"
+    data = bytes(range(256)) * 1000
+    src.write_bytes(data)
+    os.chmod(src, 0o750)
+    dst = tmp_path / "out" / "b.bin"
+    assert copy_file.invoke({"source_path": str(src), "destination_path": str(dst)}) == f"Successfully copied {src} to {dst} ({len(data)} bytes)."
+    assert dst.read_bytes() == data
+    assert os.stat(dst).st_mode & 0o777 == 0o750
+
+def test_copy_file_refuses_to_overwrite(tmp_path):
+    src = tmp_path / "a.txt"
+    dst = tmp_path / "b.txt"
+    src.write_text("new")
+    dst.write_text("old")
+    result = copy_file.invoke({"source_path": str(src), "destination_path": str(dst)})
+    assert result == f"Error: Invalid parameters provided. Reason: Destination already exists: {dst}. Set overwrite to true to replace it."
+    assert dst.read_text() == "old"
+    copy_file.invoke({"source_path": str(src), "destination_path": str(dst), "overwrite": True})
+    assert dst.read_text() == "new"
+
+def test_move_file(tmp_path):
+    src = tmp_path / "a.txt"
+    src.write_text("content")
+    dst = tmp_path / "sub" / "b.txt"
+    assert move_file.invoke({"source_path": str(src), "destination_path": str(dst)}) == f"Successfully moved {src} to {dst}."
+    assert not src.exists() and dst.read_text() == "content"
+    assert move_file.invoke({"source_path": str(src), "destination_path": str(dst)}) == f"File not found: {src}"
+
+def test_concat_files_into_one_of_the_sources(tmp_path):
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    a.write_text("first\n")
+    b.write_text("second\n")
+    result = concat_files.invoke({"source_paths": [str(a), str(b)], "destination_path": str(a), "overwrite": True})
+    assert result == f"Successfully concatenated 2 file(s) into {a} (13 bytes)."
+    assert a.read_text() == "first\nsecond\n"
+
+def test_extract_lines(tmp_path):
+    src = tmp_path / "a.txt"
+    src.write_text("".join(f"line {i}\n" for i in range(10)))
+    dst = tmp_path / "b.txt"
+    result = extract_lines.invoke({"source_path": str(src), "destination_path": str(dst), "offset": 2, "limit": 3})
+    assert result == f"Successfully wrote lines 3-5 of {src} to {dst} (21 bytes)."
+    assert dst.read_text() == "line 2\nline 3\nline 4\n"
+    result = extract_lines.invoke({"source_path": str(src), "destination_path": str(dst), "offset": 20, "limit": 3, "overwrite": True})
+    assert result == f"Error: Invalid parameters provided. Reason: Offset 20 is beyond the end of the file (10 lines): {src}"
+
+def test_copy_range_falls_back_to_read_write(tmp_path, monkeypatch):
+    monkeypatch.delattr(file_copy.os, "copy_file_range", raising=False)
+    monkeypatch.delattr(file_copy.os, "sendfile", raising=False)
+    src = tmp_path / "a.txt"
+    src.write_bytes(b"0123456789")
+    with open(src, "rb") as f, open(tmp_path / "b.txt", "wb") as out:
+        assert file_copy.copy_range(f.fileno(), out.fileno(), 3, 4) == 4
+    assert (tmp_path / "b.txt").read_bytes() == b"3456"
+
+def test_new_files_follow_the_current_umask(tmp_path):
+    old = os.umask(0o027)
+    try:
+        assert file_copy._umask() == 0o027
+        with file_copy.write_atomically(str(tmp_path / "a.txt")) as fd:
+            os.write(fd, b"a")
+        assert os.stat(tmp_path / "a.txt").st_mode & 0o777 == 0o640
+    finally:
+        os.umask(old)
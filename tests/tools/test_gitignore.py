@@ -0,0 +1,77 @@
+import os
+from agent.tools import gitignore, walker
+from agent.tools.file_system import glob, list_directory, search_file_content
+
+def _repo(tmp_path):
+    (tmp_path / ".git").mkdir()
+    return tmp_path
+
+def test_parse_rules_semantics(tmp_path):
+    root = _repo(tmp_path)
+    (root / ".gitignore").write_text("# comment\n*.log\n!keep.log\nbuild/\n/top.txt\ndocs/**/*.tmp\n")
+    is_ignored = gitignore.IgnoreMatcher(str(root)).checker()
+    assert is_ignored(str(root / "a.log"), False)
+    assert is_ignored(str(root / "sub" / "a.log"), False)
+    assert not is_ignored(str(root / "keep.log"), False)
+    assert is_ignored(str(root / "build"), True)
+    assert not is_ignored(str(root / "build"), False)
+    assert is_ignored(str(root / "top.txt"), False)
+    assert not is_ignored(str(root / "sub" / "top.txt"), False)
+    assert is_ignored(str(root / "docs" / "a" / "b" / "x.tmp"), False)
+    assert is_ignored(str(root / ".git"), True)
+
+def test_nested_gitignore_and_ignored_parent(tmp_path):
+    root = _repo(tmp_path)
+    (root / ".gitignore").write_text("*.txt\nout/\n")
+    (root / "pkg").mkdir()
+    (root / "pkg" / ".gitignore").write_text("!notes.txt\n")
+    matcher = gitignore.IgnoreMatcher(str(root))
+    assert matcher.is_ignored(str(root / "a.txt"), False)
+    assert not matcher.is_ignored(str(root / "pkg" / "notes.txt"), False)
+    # A file below an ignored directory cannot be re-included.
+    (root / "out" / "pkg").mkdir(parents=True)
+    (root / "out" / ".gitignore").write_text("!*\n")
+    assert matcher.is_ignored(str(root / "out" / "pkg" / "notes.txt"), False)
+
+def test_rules_reload_when_gitignore_changes(tmp_path):
+    root = _repo(tmp_path)
+    ignore_file = root / ".gitignore"
+    ignore_file.write_text("*.log\n")
+    matcher = gitignore.IgnoreMatcher(str(root))
+    assert matcher.is_ignored(str(root / "a.log"), False)
+    ignore_file.write_text("*.tmp\n")
+    os.utime(ignore_file, ns=(1, 1))
+    assert not matcher.is_ignored(str(root / "a.log"), False)
+    assert matcher.is_ignored(str(root / "a.tmp"), False)
+
+def test_walkers_prune_ignored_subtrees(tmp_path, monkeypatch):
+    root = _repo(tmp_path)
+    (root / ".gitignore").write_text("build/\n")
+    (root / "build").mkdir()
+    (root / "build" / "gen.py").write_text("needle = 1\n")
+    (root / "main.py").write_text("needle = 2\n")
+    monkeypatch.chdir(root)
+    checked = []
+    ignore = gitignore.get_matcher(str(root)).checker()
+
+    def recording_ignore(path, is_dir):
+        checked.append(path)
+        return ignore(path, is_dir)
+
+    assert sorted(rel for _, rel, _ in walker.walk_files(str(root), ignore=recording_ignore)) == [".gitignore", "main.py"]
+    assert str(root / "build" / "gen.py") not in checked
+
+    assert "build" not in glob.invoke({"pattern": "**/*.py", "path": str(root)})
+    assert "build" in glob.invoke({"pattern": "**/*.py", "path": str(root), "respect_git_ignore": False})
+    result = search_file_content.invoke({"pattern": "needle", "path": str(root), "respect_git_ignore": False})
+    assert "gen.py" in result
+    result = search_file_content.invoke({"pattern": "needle =", "path": str(root), "respect_git_ignore": True})
+    assert "gen.py" not in result and "main.py" in result
+
+def test_list_directory_reports_git_ignored(tmp_path):
+    root = _repo(tmp_path)
+    (root / ".gitignore").write_text("*.log\n")
+    (root / "a.log").write_text("x")
+    (root / "b.txt").write_text("x")
+    result = list_directory.invoke({"path": str(root)})
+    assert result == f"Directory listing for {root}:\n.gitignore\nb.txt\n\n(2 items were git-ignored)"
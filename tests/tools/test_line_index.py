@@ -0,0 +1,72 @@
+import os
+import pytest
+from agent.tools import line_index
+from agent.tools.file_system import read_file
+
+@pytest.fixture
+def small_checkpoints(monkeypatch):
+    monkeypatch.setattr(line_index, "CHECKPOINT_BYTES", 16)
+
+def test_build_line_index_counts_lines(tmp_path, small_checkpoints):
+    f = tmp_path / "file.txt"
+    f.write_bytes(b"".join(b"line %d\n" % i for i in range(100)))
+    index = line_index.build_line_index(str(f))
+    assert index.total_lines == 100
+    assert len(index.lines) > 1
+    with open(f, "rb") as fh:
+        data = fh.read()
+    for line, offset in zip(index.lines, index.offsets):
+        assert data[:offset].count(b"\n") == line
+
+def test_build_line_index_without_trailing_newline(tmp_path):
+    f = tmp_path / "file.txt"
+    f.write_bytes(b"a\nb")
+    assert line_index.build_line_index(str(f)).total_lines == 2
+
+def test_build_line_index_counts_in_chunks(tmp_path, small_checkpoints, monkeypatch):
+    monkeypatch.setattr(line_index, "_COUNT_CHUNK_BYTES", 5)
+    f = tmp_path / "file.txt"
+    f.write_bytes(b"x" * 100 + b"\n" + b"".join(b"line %d\n" % i for i in range(50)) + b"end")
+    index = line_index.build_line_index(str(f))
+    assert index.total_lines == 52
+    assert line_index.read_lines(str(f), 51, 1)[0] == [b"end"]
+
+def test_read_lines_window(tmp_path, small_checkpoints):
+    f = tmp_path / "file.txt"
+    f.write_bytes(b"".join(b"line %d\n" % i for i in range(100)))
+    lines, index, cut = line_index.read_lines(str(f), 42, 3)
+    assert lines == [b"line 42\n", b"line 43\n", b"line 44\n"]
+    assert cut == 0
+
+def test_get_line_index_invalidated_on_change(tmp_path):
+    f = tmp_path / "file.txt"
+    f.write_text("a\nb\n")
+    assert line_index.get_line_index(str(f)).total_lines == 2
+    f.write_text("a\nb\nc\n")
+    assert line_index.get_line_index(str(f)).total_lines == 3
+
+def test_read_file_offset_and_limit(tmp_path):
+    f = tmp_path / "file.txt"
+    f.write_text("".join(f"line {i}\n" for i in range(10)))
+    result = read_file.invoke({"absolute_path": str(f), "offset": 2, "limit": 3})
+    assert result == "[File content truncated: showing lines 3-5 of 10 total lines. Use offset/limit parameters to view more.]\nline 2\nline 3\nline 4\n"
+
+def test_read_file_offset_beyond_end(tmp_path):
+    f = tmp_path / "file.txt"
+    f.write_text("a\nb\n")
+    result = read_file.invoke({"absolute_path": str(f), "offset": 5})
+    assert result == f"Error: Invalid parameters provided. Reason: Offset 5 is beyond the end of the file (2 lines): {f}"
+
+def test_read_file_shortens_long_lines(tmp_path):
+    f = tmp_path / "file.txt"
+    f.write_text("x" * 5000 + "\nshort\n")
+    result = read_file.invoke({"absolute_path": str(f)})
+    header, first, second, _ = result.split("\n")
+    assert "1 line(s) longer than 2000 bytes were shortened" in header
+    assert first == "x" * 2000
+    assert second == "short"
+
+def test_read_file_binary(tmp_path):
+    f = tmp_path / "file.bin"
+    f.write_bytes(b"\x00\x01\x02")
+    assert read_file.invoke({"absolute_path": str(f)}) == f"Cannot display content of binary file: {f}"
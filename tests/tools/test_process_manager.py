@@ -0,0 +1,74 @@
+import os
+import subprocess
+import time
+
+import pytest
+
+from agent.tools import process_manager
+from agent.tools.shell import (
+    kill_background_process,
+    list_background_processes,
+    poll_background_process,
+    run_shell_command,
+    tail_background_process,
+)
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return predicate()
+
+def test_rotating_spill_keeps_two_files(tmp_path):
+    spill = process_manager.RotatingSpill(str(tmp_path / "job"), max_bytes=100)
+    for i in range(50):
+        spill.write(f"line {i}\n".encode())
+    spill.close()
+    assert spill.total == sum(len(f"line {i}\n") for i in range(50))
+    assert sorted(p.name for p in (tmp_path / "job").iterdir()) == ["output.log", "output.log.1"]
+    assert spill.tail(3) == "line 47\nline 48\nline 49"
+    spill.remove()
+    assert not (tmp_path / "job").exists()
+
+def test_background_job_lifecycle(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_manager, "SPILL_DIR", str(tmp_path))
+    config = {"configurable": {"thread_id": "jobs-test"}}
+    result = run_shell_command.invoke({"command": "echo started; sleep 30", "background": True}, config=config)
+    job_id = int(result.split("Started background job ")[1].split()[0])
+    job = process_manager.manager.get("jobs-test", job_id)
+    assert _wait_until(lambda: job.spill.total > 0)
+    assert "running" in poll_background_process.invoke({"job_id": job_id}, config=config)
+    assert tail_background_process.invoke({"job_id": job_id}, config=config).endswith("--- last 50 lines ---\nstarted")
+    assert f"[{job_id}] PID {job.pid}, running" in list_background_processes.invoke({}, config=config)
+    # Jobs are private to their conversation thread.
+    assert poll_background_process.invoke({"job_id": job_id}).startswith("Error: No background job")
+    assert kill_background_process.invoke({"job_id": job_id}, config=config) == f"Sent SIGTERM to job {job_id} (PID {job.pid})."
+    assert _wait_until(lambda: not job.running)
+    assert "Status: killed by signal 15" in poll_background_process.invoke({"job_id": job_id}, config=config)
+    assert kill_background_process.invoke({"job_id": job_id}, config=config).startswith(f"Job {job_id} is no longer running")
+
+def test_kill_all_stops_jobs_and_removes_their_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_manager, "SPILL_DIR", str(tmp_path))
+    manager = process_manager.ProcessManager()
+    job = manager.start("t", "while true; do echo tick; sleep 0.01; done")
+    assert _wait_until(lambda: job.spill.total > 0)
+    manager.kill_all()
+    assert _wait_until(lambda: not job.running)
+    assert job.returncode == -9
+    assert manager.list("t") == [] and os.listdir(tmp_path) == []
+
+def test_foreground_command_reports_background_pids_and_resources():
+    result = run_shell_command.invoke({"command": "sleep 30 & echo $!"})
+    pid = int(result.split("Stdout: ")[1].split("\n")[0])
+    assert f"Background PIDs: {pid}\n" in result
+    assert "\nResources: wall " in result and "RSS" not in result
+    job = [job for job in process_manager.manager.list("default") if job.pid == pid][0]
+    assert job.running and job.spill is None
+    process_manager.manager.kill(job)
+    assert _wait_until(lambda: not job.running)
+
+def test_group_members_of_an_empty_group_skips_proc(monkeypatch):
+    process = subprocess.Popen(["true"], start_new_session=True)
+    process.wait()
+    monkeypatch.setattr(os, "listdir", lambda path: pytest.fail("/proc was scanned"))
+    assert process_manager.group_members(process.pid) == []
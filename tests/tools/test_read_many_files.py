@@ -1,5 +1,7 @@
 import os
+import subprocess
 import pytest
+from agent.tools import file_system
 from agent.tools.file_system import read_many_files
 
 def test_read_many_files_multiple(tmp_path):
@@ -39,4 +41,81 @@ def test_read_many_files_with_exclude(tmp_path):
     
     expected_output = f"--- {f1} ---\n\ncontent1"
     result = read_many_files.invoke({"paths": [str(d / "*")], "exclude": ["**/*.log"]})
-    assert repr(result) == repr(expected_output)
\ No newline at end of file
+    assert repr(result) == repr(expected_output)
+
+def test_read_many_files_deduplicates_and_merges_include(tmp_path):
+    d = tmp_path / "read_many"
+    d.mkdir()
+    f1 = d / "file1.txt"
+    f1.write_text("content1")
+    f2 = d / "file2.log"
+    f2.write_text("content2")
+
+    result = read_many_files.invoke({"paths": [str(d / "*.txt"), str(f1)], "include": [str(d / "*.log")]})
+    assert result == f"--- {f1} ---\n\ncontent1\n\n--- {f2} ---\n\ncontent2"
+
+def test_read_many_files_skips_binary(tmp_path):
+    f1 = tmp_path / "file1.txt"
+    f1.write_text("content1")
+    f2 = tmp_path / "data.bin"
+    f2.write_bytes(b"\x00\x01")
+
+    result = read_many_files.invoke({"paths": [str(f1), str(f2)]})
+    assert result == f"--- {f1} ---\n\ncontent1\n\n[Skipped 1 binary file(s): {f2}]"
+
+def test_read_many_files_default_excludes(tmp_path):
+    d = tmp_path / "node_modules"
+    d.mkdir()
+    (d / "dep.js").write_text("dependency")
+
+    assert read_many_files.invoke({"paths": [str(tmp_path / "**" / "*.js")]}) == "No files matching the criteria were found or all were skipped."
+    result = read_many_files.invoke({"paths": [str(tmp_path / "**" / "*.js")], "useDefaultExcludes": False})
+    assert "dependency" in result
+
+def test_read_many_files_per_file_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_system, "READ_MANY_MAX_FILE_LINES", 2)
+    f = tmp_path / "file.txt"
+    f.write_text("a\nb\nc\n")
+
+    result = read_many_files.invoke({"paths": [str(f)]})
+    assert result.startswith(f"--- {f} ---\n\na\nb\n\n\n[Truncated 1 file(s) to their first 2 lines")
+
+def test_read_many_files_total_budget(tmp_path, monkeypatch):
+    files = []
+    for i in range(5):
+        f = tmp_path / f"file{i}.txt"
+        f.write_text("x" * 50)
+        files.append(f)
+    part_size = len(f"--- {files[0]} ---\n\n{'x' * 50}\n\n")
+    monkeypatch.setattr(file_system, "READ_MANY_MAX_TOTAL_BYTES", 2 * part_size)
+
+    result = read_many_files.invoke({"paths": [str(tmp_path / "*.txt")]})
+    assert f"--- {files[1]} ---" in result
+    assert f"--- {files[2]} ---" not in result
+    assert f"[Skipped 3 file(s) after reaching the total budget of {2 * part_size} bytes: {files[2]}, {files[3]}, {files[4]}." in result
+
+def test_read_many_files_total_budget_counts_bytes(tmp_path, monkeypatch):
+    text = "\u00e9" * 500
+    files = []
+    for i in range(3):
+        f = tmp_path / f"file{i}.txt"
+        f.write_text(text, encoding="utf-8")
+        files.append(f)
+    part_bytes = len(f"--- {files[0]} ---\n\n{text}\n\n".encode("utf-8"))
+    monkeypatch.setattr(file_system, "READ_MANY_MAX_TOTAL_BYTES", 2 * part_bytes + 10)
+
+    result = read_many_files.invoke({"paths": [str(tmp_path / "*.txt")]})
+    assert f"--- {files[1]} ---" in result
+    assert f"[Skipped 1 file(s) after reaching the total budget of {2 * part_bytes + 10} bytes: {files[2]}." in result
+
+def test_read_many_files_respects_git_ignore(tmp_path, monkeypatch):
+    if subprocess.run(["git", "--version"], capture_output=True).returncode != 0:
+        pytest.skip("git is not available")
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    (tmp_path / "file1.txt").write_text("content1")
+    (tmp_path / "file2.log").write_text("content2")
+    monkeypatch.chdir(tmp_path)
+
+    assert read_many_files.invoke({"paths": ["*.txt", "*.log"]}) == "--- file1.txt ---\n\ncontent1"
+    assert "content2" in read_many_files.invoke({"paths": ["*.txt", "*.log"], "respect_git_ignore": False})
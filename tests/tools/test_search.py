@@ -0,0 +1,65 @@
+import os
+import pytest
+from agent.tools import search
+from agent.tools.file_system import search_file_content
+
+def test_scan_text_line_numbers():
+    pattern = search.compile_pattern("hello")
+    text = "hello world\nnothing here\nsay hello hello\n"
+    assert search.scan_text(text, pattern) == [(1, "hello world"), (3, "say hello hello")]
+
+def test_scan_text_anchors_match_per_line():
+    pattern = search.compile_pattern("^b$")
+    assert search.scan_text("a\nb\nc", pattern) == [(2, "b")]
+
+def test_scan_text_ignores_matches_spanning_lines():
+    pattern = search.compile_pattern(r"a\s+b")
+    assert search.scan_text("a\nb\na b\n", pattern) == [(3, "a b")]
+
+def test_scan_file_skips_binary(tmp_path):
+    f = tmp_path / "data.bin"
+    f.write_bytes(b"hello\x00world")
+    assert search.scan_file(str(f), search.compile_pattern("hello")) == []
+
+def test_search_files_stops_at_max_matches(tmp_path):
+    paths = []
+    for i in range(5):
+        f = tmp_path / f"file{i}.txt"
+        f.write_text("match\nmatch\n")
+        paths.append(str(f))
+    results, truncated = search.search_files(paths, "match", max_matches=3, parallel=False)
+    assert truncated
+    assert [len(m) for _, m in results] == [2, 1]
+
+def test_search_files_stops_at_max_files(tmp_path):
+    paths = []
+    for i in range(5):
+        f = tmp_path / f"file{i}.txt"
+        f.write_text("match\n")
+        paths.append(str(f))
+    results, truncated = search.search_files(paths, "match", max_files=2, parallel=False)
+    assert truncated
+    assert [p for p, _ in results] == paths[:2]
+
+def test_search_files_parallel_matches_sequential(tmp_path):
+    paths = []
+    for i in range(100):
+        f = tmp_path / f"file{i:03}.txt"
+        f.write_text(f"line {i}\nneedle {i}\n" if i % 3 == 0 else "nothing\n")
+        paths.append(str(f))
+    sequential = search.search_files(paths, "needle", parallel=False)
+    parallel = search.search_files(paths, "needle", parallel=True)
+    assert parallel == sequential
+    assert len(parallel[0]) == 34
+
+def test_search_file_content_invalid_pattern(tmp_path):
+    result = search_file_content.invoke({"pattern": "(unclosed", "path": str(tmp_path)})
+    assert result.startswith('Error: Invalid parameters provided. Reason: Invalid regular expression pattern "(unclosed"')
+
+def test_search_file_content_reports_truncation(tmp_path):
+    f = tmp_path / "file.txt"
+    f.write_text("hit\nhit\nhit\n")
+    result = search_file_content.invoke({"pattern": "hit", "path": str(tmp_path), "max_matches": 2})
+    assert "L1: hit\nL2: hit\n---" in result
+    assert "L3: hit" not in result
+    assert result.endswith("to see more.)")
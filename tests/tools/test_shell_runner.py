@@ -0,0 +1,59 @@
+import asyncio
+import time
+from agent.tools import shell_runner
+from agent.tools.shell import run_shell_command
+
+def test_head_tail_buffer_counts_omitted_bytes():
+    buffer = shell_runner.HeadTailBuffer(head_bytes=4, tail_bytes=3)
+    for chunk in (b"ab", b"cdef", b"ghij"):
+        buffer.write(chunk)
+    assert buffer.total == 10
+    assert buffer.omitted == 3
+    assert buffer.text() == "abcd\n... [3 bytes omitted] ...\nhij"
+
+def test_large_output_is_bounded(monkeypatch):
+    monkeypatch.setattr(shell_runner, "HEAD_BYTES", 1024)
+    monkeypatch.setattr(shell_runner, "TAIL_BYTES", 1024)
+    result = shell_runner.run("head -c 20000000 /dev/zero | tr '\\0' 'x'; echo; echo done")
+    assert result.exit_code == 0
+    assert result.stdout.total == 20000006
+    assert len(result.stdout.head) == 1024
+    assert result.stdout.text().endswith("x\ndone\n")
+
+def test_timeout_kills_the_process_group(monkeypatch):
+    monkeypatch.setattr(shell_runner, "KILL_GRACE_SECONDS", 0.5)
+    start = time.monotonic()
+    result = run_shell_command.invoke({"command": "sleep 30 & sleep 30", "timeout": 1})
+    assert time.monotonic() - start < 10
+    assert "Error: Command timed out after" in result
+    assert "Exit Code: (none)" in result
+    assert "Signal: 15" in result
+
+def test_background_job_does_not_block():
+    start = time.monotonic()
+    result = shell_runner.run("sleep 30 & echo started")
+    assert time.monotonic() - start < 5
+    assert result.exit_code == 0
+    assert result.stdout.text().strip() == "started"
+    shell_runner.kill_group(result.pid)
+
+def test_progress_is_reported(monkeypatch):
+    monkeypatch.setattr(shell_runner, "PROGRESS_INTERVAL_SECONDS", 0)
+    reports = []
+    shell_runner.run("echo one; sleep 0.3; echo two", on_progress=lambda out, err: reports.append(out.text()))
+    assert any("one" in report and "two" not in report for report in reports)
+
+def test_arun_runs_commands_concurrently():
+    async def main():
+        return await asyncio.gather(
+            shell_runner.arun("sleep 0.5; echo out; echo err >&2"),
+            shell_runner.arun("sleep 0.5; exit 3"),
+            shell_runner.arun("sleep 30", timeout=0.5),
+        )
+    start = time.monotonic()
+    ok, failed, timed_out = asyncio.run(main())
+    assert time.monotonic() - start < 2
+    assert (ok.exit_code, ok.stdout.text(), ok.stderr.text()) == (0, "out\n", "err\n")
+    assert ok.usage is not None
+    assert failed.exit_code == 3
+    assert timed_out.timed_out and timed_out.signal == 15
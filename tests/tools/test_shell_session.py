@@ -0,0 +1,65 @@
+import pytest
+from agent.tools import shell_runner, shell_session
+from agent.tools.shell import run_shell_command
+
+@pytest.fixture
+def pool():
+    pool = shell_session.SessionPool()
+    yield pool
+    pool.close_all()
+
+def test_state_persists_between_commands(pool, tmp_path):
+    pool.run("t", f"cd {tmp_path} && export GREETING=hi")
+    result, restarted = pool.run("t", "echo $PWD $GREETING")
+    assert not restarted
+    assert result.stdout.text().strip() == f"{tmp_path} hi"
+    other, _ = pool.run("other", "echo ${GREETING:-unset}")
+    assert other.stdout.text().strip() == "unset"
+
+def test_exit_code_stderr_and_directory(pool, tmp_path):
+    result, _ = pool.run("t", "echo oops >&2; exit_code() { return 3; }; exit_code", cwd=str(tmp_path))
+    assert result.exit_code == 3
+    assert result.stderr.text().strip() == "oops"
+    result, _ = pool.run("t", "pwd")
+    assert result.stdout.text().strip() != str(tmp_path)
+
+def test_session_is_recreated_after_exit(pool):
+    first, _ = pool.run("t", "export X=1")
+    result, restarted = pool.run("t", "exit 7")
+    assert restarted and result.exit_code == 7
+    result, restarted = pool.run("t", "echo ${X:-gone}")
+    assert not restarted
+    assert result.stdout.text().strip() == "gone"
+    assert result.pid != first.pid
+
+def test_timeout_restarts_the_session(pool, monkeypatch):
+    monkeypatch.setattr(shell_runner, "KILL_GRACE_SECONDS", 0.5)
+    result, restarted = pool.run("t", "sleep 30", timeout=0.5)
+    assert result.timed_out and restarted
+    assert result.signal is not None
+
+def test_idle_sessions_are_evicted(pool, monkeypatch):
+    monkeypatch.setattr(shell_session, "IDLE_SECONDS", 0)
+    pool.run("a", "true")
+    pool.run("b", "true")
+    assert list(pool._sessions) == ["b"]
+
+def test_leased_sessions_are_not_evicted(pool, monkeypatch):
+    monkeypatch.setattr(shell_session, "IDLE_SECONDS", 0)
+    monkeypatch.setattr(shell_session, "MAX_SESSIONS", 1)
+    # A session handed out but not yet locked by its caller survives both eviction rules.
+    leased = pool._acquire("a")
+    pool.run("b", "true")
+    assert leased.alive and pool._sessions["a"] is leased
+    leased.leases -= 1
+    pool.run("c", "true")
+    assert list(pool._sessions) == ["c"] and not leased.alive
+
+def test_tool_uses_the_thread_session():
+    config = {"configurable": {"thread_id": "test-tool-session"}}
+    run_shell_command.invoke({"command": "export MARK=kept"}, config=config)
+    result = run_shell_command.invoke({"command": "echo $MARK"}, config=config)
+    assert "Stdout: kept" in result
+    # The session's process group is not the command's to kill.
+    assert "Process Group PGID: (none)" in result
+    shell_session.pool.close_all()
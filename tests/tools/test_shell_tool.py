@@ -6,6 +6,7 @@ def test_run_shell_command_simple():
     assert "Command: echo 'hello'" in result
     assert "Stdout: hello" in result
     assert "Exit Code: 0" in result
+    assert "Process Group PGID: (none)" not in result
 
 def test_run_shell_command_error():
     result = run_shell_command.invoke({"command": "ls non_existent_dir"})
@@ -0,0 +1,69 @@
+import os
+import pytest
+from agent.tools import snapshot
+
+def _names(entries):
+    return sorted(entry.name for entry in entries)
+
+@pytest.fixture(params=[True, False], ids=["inotify", "polling"])
+def workspace(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "POLL_INTERVAL", 0)
+    snap = snapshot.WorkspaceSnapshot(str(tmp_path), use_inotify=request.param)
+    if request.param and not snap.uses_inotify:
+        pytest.skip("inotify is not available")
+    yield snap
+    snap.close()
+
+def test_repeated_listing_is_served_from_memory(workspace, tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("a")
+    assert _names(workspace.scandir(str(tmp_path))) == ["a.txt"]
+
+    def fail(_):
+        raise AssertionError("directory was scanned again")
+    monkeypatch.setattr(snapshot.os, "scandir", fail)
+    assert _names(workspace.scandir(str(tmp_path))) == ["a.txt"]
+
+def test_changes_are_picked_up(workspace, tmp_path):
+    (tmp_path / "sub").mkdir()
+    f = tmp_path / "a.txt"
+    f.write_text("a")
+    workspace.scandir(str(tmp_path))
+    workspace.scandir(str(tmp_path / "sub"))
+
+    (tmp_path / "b.txt").write_text("b")
+    (tmp_path / "sub" / "c.txt").write_text("c")
+    f.write_text("longer content")
+    os.utime(f, ns=(5, 5))
+    entries = {entry.name: entry for entry in workspace.scandir(str(tmp_path))}
+    assert sorted(entries) == ["a.txt", "b.txt", "sub"]
+    assert entries["a.txt"].stat().st_size == len("longer content")
+    assert entries["a.txt"].stat().st_mtime_ns == 5
+    assert entries["sub"].is_dir() and not entries["a.txt"].is_dir()
+    assert _names(workspace.scandir(str(tmp_path / "sub"))) == ["c.txt"]
+
+    os.remove(tmp_path / "sub" / "c.txt")
+    os.rmdir(tmp_path / "sub")
+    assert _names(workspace.scandir(str(tmp_path))) == ["a.txt", "b.txt"]
+    with pytest.raises(OSError):
+        workspace.scandir(str(tmp_path / "sub"))
+
+def test_invalidate_refreshes_an_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "POLL_INTERVAL", 3600)
+    workspace = snapshot.WorkspaceSnapshot(str(tmp_path), use_inotify=False)
+    f = tmp_path / "a.txt"
+    f.write_text("a")
+    workspace.scandir(str(tmp_path))
+    f.write_text("abc")
+    workspace.invalidate(str(f))
+    (entry,) = workspace.scandir(str(tmp_path))
+    assert entry.stat().st_size == 3
+
+def test_scandir_outside_the_working_directory(tmp_path, monkeypatch):
+    inside = tmp_path / "inside"
+    outside = tmp_path / "outside"
+    inside.mkdir()
+    outside.mkdir()
+    (outside / "x.txt").write_text("x")
+    monkeypatch.chdir(inside)
+    assert _names(snapshot.scandir(str(outside))) == ["x.txt"]
+    assert not snapshot.get_snapshot().contains(str(outside))
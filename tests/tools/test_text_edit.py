@@ -0,0 +1,50 @@
+import os
+from agent.tools import text_edit
+from agent.tools.file_system import replace
+
+def test_matches_across_chunk_boundaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_edit, "CHUNK_CHARS", 3)
+    f = tmp_path / "big.txt"
+    content = "xx needle yy needle zz neeneedle\n" * 50
+    f.write_text(content)
+    counts, committed = text_edit.stream_replace(str(f), [("needle", "pin")])
+    assert (counts, committed) == ([150], True)
+    assert f.read_text() == content.replace("needle", "pin")
+
+def test_pairs_are_applied_simultaneously(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_edit, "CHUNK_CHARS", 5)
+    f = tmp_path / "a.txt"
+    f.write_text("a b ab ba\n")
+    counts, committed = text_edit.stream_replace(str(f), [("a", "b"), ("b", "a"), ("ab", "AB")])
+    assert (counts, committed) == ([2, 2, 1], True)
+    assert f.read_text() == "b a AB ab\n"
+
+def test_count_mismatch_leaves_file_untouched(tmp_path):
+    f = tmp_path / "a.txt"
+    f.write_text("one one two\n")
+    os.chmod(f, 0o640)
+    counts, committed = text_edit.stream_replace(str(f), [("one", "1"), ("two", "2")], expected=[1, 1])
+    assert (counts, committed) == ([2, 1], False)
+    assert f.read_text() == "one one two\n"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+    counts, committed = text_edit.stream_replace(str(f), [("one", "1"), ("two", "2")], expected=[2, 1])
+    assert committed and f.read_text() == "1 1 2\n"
+    assert os.stat(f).st_mode & 0o777 == 0o640
+
+def test_replace_tool_with_several_edits(tmp_path):
+    f = tmp_path / "a.txt"
+    f.write_text("alpha beta beta\n")
+    result = replace.invoke({"file_path": str(f), "edits": [
+        {"old_string": "alpha", "new_string": "A"},
+        {"old_string": "beta", "new_string": "B", "expected_replacements": 2},
+    ]})
+    assert result == f"Successfully modified file: {f} (3 replacements)."
+    assert f.read_text() == "A B B\n"
+
+    result = replace.invoke({"file_path": str(f), "edits": [
+        {"old_string": "A", "new_string": "a"},
+        {"old_string": "B", "new_string": "b"},
+    ]})
+    assert result == f"Failed to edit, Expected 1 occurrence but found 2 for old_string of edit 2 in file: {f}"
+    assert f.read_text() == "A B B\n"
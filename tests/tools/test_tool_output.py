@@ -0,0 +1,43 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+from agent.tool_node import ConflictAwareToolNode
+from agent.tools import output_store
+from agent.tools.tool_output import read_tool_output
+
+def _noisy(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_store, "OUTPUT_DIR", str(tmp_path))
+    return "".join(f"line {i}\n" for i in range(20000))
+
+def test_spill_stores_once_and_previews(tmp_path, monkeypatch):
+    text = _noisy(tmp_path, monkeypatch)
+    preview = output_store.spill(text)
+    assert len(preview) < 2 * output_store.PREVIEW_CHARS + 500
+    handle = preview.split("It is stored as ")[1].split(":")[0]
+    assert preview.startswith(f"[This output is too large for the conversation ({len(text)} characters, 20000 lines).")
+    assert "line 0\n" in preview and preview.endswith("line 19999\n")
+    assert output_store.spill(text) == preview
+    assert [p.name for p in tmp_path.iterdir()] == [f"{handle}.txt"]
+    assert output_store.spill("short") == "short"
+
+def test_read_tool_output_pages(tmp_path, monkeypatch):
+    handle = output_store.store(_noisy(tmp_path, monkeypatch))
+    result = read_tool_output.invoke({"handle": handle, "offset": 10, "limit": 2})
+    assert result == f"[Showing lines 11-12 of 20000 of {handle}. Continue with offset=12.]\nline 10\nline 11\n"
+    big_page = read_tool_output.invoke({"handle": handle, "limit": 100000})
+    assert len(big_page) <= output_store.PAGE_MAX_BYTES + 200
+    assert read_tool_output.invoke({"handle": "out-missing"}).startswith("Error: No stored tool output with handle out-missing.")
+    assert read_tool_output.invoke({"handle": "../../etc/passwd"}).startswith("Error: No stored tool output")
+
+def test_tool_node_spills_large_results(tmp_path, monkeypatch):
+    text = _noisy(tmp_path, monkeypatch)
+
+    @tool
+    def noisy() -> str:
+        """Prints a lot."""
+        return text
+
+    state = {"messages": [HumanMessage(content="go"), AIMessage(content="", tool_calls=[{"id": "c1", "name": "noisy", "args": {}}])]}
+    message = ConflictAwareToolNode([noisy]).invoke(state)["messages"][0]
+    assert message.content == output_store.spill(text)
+    assert message.tool_call_id == "c1"
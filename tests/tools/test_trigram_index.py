@@ -0,0 +1,129 @@
+import os
+import pytest
+from agent.tools import snapshot, trigram_index
+from agent.tools.file_system import search_file_content
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    d = tmp_path / "index"
+    monkeypatch.setattr(trigram_index, "INDEX_DIR", str(d))
+    return d
+
+def test_trigrams_for_literal_pattern():
+    query = trigram_index.trigrams_for_pattern("hello")
+    assert query == [trigram_index.extract_trigrams(b"hello")]
+
+def test_trigrams_for_unconstrained_patterns():
+    assert trigram_index.trigrams_for_pattern(".*") is None
+    assert trigram_index.trigrams_for_pattern("ab") is None
+    assert trigram_index.trigrams_for_pattern("foo|.*") is None
+
+def test_trigrams_for_alternation():
+    query = trigram_index.trigrams_for_pattern("def (alpha|beta)_[a-z]+")
+    assert len(query) == 2
+    assert trigram_index.extract_trigrams(b"alpha") <= query[0]
+    assert trigram_index.extract_trigrams(b"beta") <= query[1]
+
+def test_trigrams_ignore_case_skips_unsafe_folds():
+    query = trigram_index.trigrams_for_pattern("(?i)HELLO")
+    assert query == [trigram_index.extract_trigrams(b"hello")]
+    assert trigram_index.trigrams_for_pattern("(?i)kiss") is None
+
+def test_index_candidates_and_incremental_refresh(tmp_path, index_dir):
+    root = tmp_path / "repo"
+    (root / "pkg").mkdir(parents=True)
+    a = root / "pkg" / "a.py"
+    a.write_text("def needle():\n    pass\n")
+    b = root / "b.py"
+    b.write_text("nothing to see\n")
+    (root / "c.bin").write_bytes(b"needle\x00")
+
+    index = trigram_index.TrigramIndex(str(root))
+    query = trigram_index.trigrams_for_pattern("needle")
+    index.refresh()
+    assert index.candidates(query) == [str(a)]
+
+    b.write_text("a needle appears\n")
+    os.utime(b, ns=(1, 1))
+    index.refresh()
+    assert index.candidates(query) == [str(b), str(a)]
+
+    a.unlink()
+    index.refresh()
+    assert index.candidates(query) == [str(b)]
+
+def test_index_rebuilds_when_corrupt(tmp_path, index_dir):
+    root = tmp_path / "repo"
+    root.mkdir()
+    f = root / "a.txt"
+    f.write_text("needle\n")
+    index = trigram_index.TrigramIndex(str(root))
+    os.makedirs(os.path.dirname(index.db_path), exist_ok=True)
+    with open(index.db_path, "wb") as db:
+        db.write(b"not a database" * 100)
+    index.refresh()
+    assert index.candidates(trigram_index.trigrams_for_pattern("needle")) == [str(f)]
+
+def test_search_file_content_uses_index(tmp_path, index_dir, monkeypatch):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.txt").write_text("first needle\nsecond\n")
+    (root / "b.txt").write_text("no match here\n")
+    monkeypatch.chdir(root)
+    result = search_file_content.invoke({"pattern": "needle"})
+    assert result == f'Found 1 matches for pattern "needle" in path "{root}":\n---\nFile: a.txt\nL1: first needle\n---'
+    assert os.listdir(index_dir)
+
+def test_index_compacts_small_segments(tmp_path, index_dir, monkeypatch):
+    monkeypatch.setattr(trigram_index, "MAX_WASTEFUL_SEGMENTS", 3)
+    root = tmp_path / "repo"
+    root.mkdir()
+    index = trigram_index.TrigramIndex(str(root))
+    query = trigram_index.trigrams_for_pattern("needle")
+    files = []
+    for i in range(6):
+        f = root / f"file{i}.txt"
+        f.write_text(f"needle {i}\n")
+        files.append(str(f))
+        index.refresh()
+    conn = index._connect()
+    segment_count = conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+    conn.close()
+    assert segment_count < 6
+    assert index.candidates(query) == files
+
+def test_undecodable_files_are_always_candidates(tmp_path, index_dir):
+    root = tmp_path / "repo"
+    root.mkdir()
+    # The scanner drops the invalid byte and sees "needle".
+    f = root / "latin1.txt"
+    f.write_bytes(b"nee\xffdle\n")
+    index = trigram_index.TrigramIndex(str(root))
+    index.refresh()
+    assert index.candidates(trigram_index.trigrams_for_pattern("needle")) == [str(f)]
+
+def test_refresh_skips_the_walk_while_nothing_changes(tmp_path, index_dir, monkeypatch):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.txt").write_text("needle\n")
+    monkeypatch.chdir(root)
+    snapshot.clear()
+    if snapshot.get_snapshot().generation() is None:
+        pytest.skip("inotify is not available")
+    index = trigram_index.TrigramIndex(str(root))
+    query = trigram_index.trigrams_for_pattern("needle")
+    index.refresh()
+    index.refresh()
+
+    walk_files = trigram_index.walk_files
+    walks = []
+    monkeypatch.setattr(trigram_index, "walk_files", lambda *args: walks.append(args) or walk_files(*args))
+    index.refresh()
+    index.refresh(str(root))
+    assert walks == []
+
+    (root / "b.txt").write_text("another needle\n")
+    index.refresh()
+    assert len(walks) == 1
+    assert index.candidates(query) == [str(root / "a.txt"), str(root / "b.txt")]
+    snapshot.clear()
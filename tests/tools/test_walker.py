@@ -0,0 +1,68 @@
+import os
+import glob as py_glob
+import pytest
+from agent.tools import walker
+from agent.tools.file_system import glob
+
+def make_tree(root):
+    files = ["a.py", "b.txt", ".hidden.py", "src/c.py", "src/d.TXT", "src/deep/e.py", "src/.cache/f.py", "docs/g.md"]
+    for rel in files:
+        p = root / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(rel)
+    return files
+
+@pytest.mark.parametrize("pattern", ["*.py", "**/*.py", "src/*.py", "src/**/*.py", "src/**", "*/*", "[ab].*", "**/e.py", "src/.cache/*.py", "**/.cache/*.py"])
+def test_glob_matcher_agrees_with_glob_module(tmp_path, pattern):
+    make_tree(tmp_path)
+    expected = sorted(p for p in py_glob.glob(str(tmp_path / pattern), recursive=True) if os.path.isfile(p))
+    found, total = walker.find_newest(str(tmp_path), pattern)
+    assert sorted(found) == expected
+    assert total == len(expected)
+
+def test_double_star_skips_hidden_directories(tmp_path):
+    make_tree(tmp_path)
+    (tmp_path / ".venv" / "lib").mkdir(parents=True)
+    (tmp_path / ".venv" / "lib" / "h.py").write_text("h")
+    scanned = []
+
+    def scandir(directory):
+        scanned.append(os.path.relpath(directory, tmp_path))
+        return walker._scandir(directory)
+
+    found = [rel for _, rel, _ in walker.walk_files(str(tmp_path), walker.GlobMatcher("**/*.py"), scandir=scandir)]
+    assert sorted(found) == ["a.py", "src/c.py", "src/deep/e.py"]
+    assert sorted(scanned) == [".", "docs", "src", "src/deep"]
+    scanned.clear()
+    found = [rel for _, rel, _ in walker.walk_files(str(tmp_path), walker.GlobMatcher("**/.cache/*.py"), scandir=scandir)]
+    assert found == ["src/.cache/f.py"] and ".venv" not in scanned
+
+def test_glob_matcher_case_insensitive(tmp_path):
+    make_tree(tmp_path)
+    found, _ = walker.find_newest(str(tmp_path), "SRC/*.txt", case_sensitive=False)
+    assert found == [str(tmp_path / "src" / "d.TXT")]
+
+def test_find_newest_keeps_top_k(tmp_path):
+    for i in range(10):
+        f = tmp_path / f"file{i}.txt"
+        f.write_text("x")
+        os.utime(f, (1000 + i, 1000 + i))
+    found, total = walker.find_newest(str(tmp_path), "*.txt", limit=3)
+    assert total == 10
+    assert found == [str(tmp_path / f"file{i}.txt") for i in (9, 8, 7)]
+
+def test_walk_prunes_excluded_directories(tmp_path):
+    make_tree(tmp_path)
+    found, _ = walker.find_newest(str(tmp_path), "**/*.py", excludes=["src"])
+    assert sorted(found) == [str(tmp_path / "a.py")]
+
+def test_glob_tool_limit(tmp_path):
+    for i in range(5):
+        f = tmp_path / f"file{i}.txt"
+        f.write_text("x")
+        os.utime(f, (1000 + i, 1000 + i))
+    result = glob.invoke({"pattern": "*.txt", "path": str(tmp_path), "limit": 2})
+    assert result == (
+        f'Found 5 file(s) matching "*.txt" within {tmp_path}, sorted by modification time (newest first):\n'
+        f'{tmp_path / "file4.txt"}\n{tmp_path / "file3.txt"}\n(Showing the 2 newest of 5 files.)'
+    )